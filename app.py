@@ -3,7 +3,6 @@ import pandas as pd
 import os
 import hashlib
 from pathlib import Path
-from datetime import datetime
 import logging
 
 # =====================================================
@@ -31,7 +30,24 @@ st.set_page_config(
 # =====================================================
 # IMPORTS APP
 # =====================================================
-from utils.firestore_utils import load_dataframes_firestore
+from utils.firestore_utils import (
+    get_shared_data,
+    shared_data_versions,
+    invalidate_shared_data,
+)
+from utils.schemas import aplicar_esquema
+from utils.metricas import rerun as metricas_rerun
+from utils.perfilado import rerun as perfil_rerun, tramo
+from utils.indice_pedidos import obtener_indice
+from utils.estados import COLUMNA_ESTADO, INICIO, TERMINADO, PENDIENTE, RETIRADO
+from modules import (
+    pedidos_page,
+    gastos_page,
+    resumen_page,
+    config_page,
+    analisis_productos_page,
+    posibles_clientes_page,
+)
 from modules.pedidos_page import show_pedidos_page
 from modules.gastos_page import show_gastos_page
 from modules.resumen_page import show_resumen_page
@@ -39,6 +55,19 @@ from modules.config_page import show_config_page
 from modules.analisis_productos_page import show_analisis_productos_page
 from modules.posibles_clientes_page import show_posibles_clientes_page
 
+# =====================================================
+# PÁGINAS -> COLECCIONES QUE NECESITAN
+# =====================================================
+PAGINAS = {
+    "Inicio": ["pedidos"],
+    "Pedidos": pedidos_page.COLECCIONES,
+    "Posibles clientes": posibles_clientes_page.COLECCIONES,
+    "Gastos": gastos_page.COLECCIONES,
+    "Resumen": resumen_page.COLECCIONES,
+    "Ver Datos": analisis_productos_page.COLECCIONES,
+    "Configuración": config_page.COLECCIONES,
+}
+
 # =====================================================
 # HEADER
 # =====================================================
@@ -134,6 +163,7 @@ if check_password():
     st.sidebar.title("🧭 Navegación")
 
     if st.sidebar.button("🔄 Recargar aplicación"):
+        invalidate_shared_data()
         st.session_state.data_loaded = False
         st.session_state.current_page = "Inicio"
         st.rerun()
@@ -142,109 +172,124 @@ if check_password():
         st.session_state.clear()
         st.rerun()
 
-    # =================================================
-    # CARGA DE DATOS
-    # =================================================
-    if not st.session_state.data_loaded:
-        with st.spinner("Cargando datos..."):
-            data = load_dataframes_firestore()
-            if not data:
-                st.error("No se pudieron cargar los datos.")
-                st.stop()
-
-            df_pedidos = data.get("df_pedidos")
-            if df_pedidos is None or df_pedidos.empty:
-                df_pedidos = empty_pedidos_df()
-            else:
-                df_pedidos["Año"] = (
-                    pd.to_numeric(df_pedidos["Año"], errors="coerce")
-                    .fillna(datetime.now().year)
-                    .astype("int64")
-                )
-
-            st.session_state.data = data
-            st.session_state.data["df_pedidos"] = df_pedidos
-            st.session_state.data_loaded = True
-
     # =================================================
     # MENÚ
     # =================================================
     page = st.sidebar.radio(
         "Secciones",
-        [
-            "Inicio",
-            "Pedidos",
-            "Posibles clientes",
-            "Gastos",
-            "Resumen",
-            "Ver Datos",
-            "Configuración",
-        ],
+        list(PAGINAS),
         key="current_page"
     )
 
-    df_pedidos = st.session_state.data.get("df_pedidos", empty_pedidos_df())
-    df_gastos = st.session_state.data.get("df_gastos")
+    # Coste del rerun anterior de esta sesión (detalle en Configuración)
+    ultimo = st.session_state.get("metricas_ultimo_rerun")
+    if ultimo:
+        st.sidebar.caption(
+            f"📊 Último rerun ({ultimo['pagina']}): {ultimo['lecturas']} lecturas, "
+            f"{ultimo['escrituras']} escrituras, {ultimo['ms']:.0f} ms"
+        )
 
     # =================================================
-    # PÁGINAS
+    # MÉTRICAS
     # =================================================
-    if page == "Inicio":
-        st.header("🏠 Pedidos nuevos")
-
-        if df_pedidos.empty:
-            st.info("No hay pedidos.")
-        else:
-            # ---- NORMALIZAR ESTADOS ----
-            estado_cols = [
-                "Inicio Trabajo",
-                "Trabajo Terminado",
-                "Pendiente",
-                "Retirado",
-            ]
-
-            for col in estado_cols:
-                if col not in df_pedidos.columns:
-                    df_pedidos[col] = False
-                df_pedidos[col] = df_pedidos[col].fillna(False).astype(bool)
-
-            nuevos = df_pedidos[
-                (~df_pedidos["Inicio Trabajo"]) &
-                (~df_pedidos["Trabajo Terminado"]) &
-                (~df_pedidos["Pendiente"]) &
-                (~df_pedidos["Retirado"])
-            ].copy()
-
-            if nuevos.empty:
-                st.success("🎉 No hay pedidos nuevos pendientes")
-            else:
-                nuevos = nuevos.sort_values(["Año", "ID"], ascending=[False, False])
-
-                tabla = nuevos[[
-                    "ID", "Año", "Cliente", "Club", "Telefono",
-                    "Precio", "Cobrado"
-                ]]
-
-                st.dataframe(
-                    tabla,
-                    use_container_width=True,
-                    hide_index=True
+    # Las llamadas a Firestore de la carga y de la página cuentan en este
+    # rerun (ver utils/metricas.py); con IMPERYO_PERFIL se perfila además
+    # por tramos (ver utils/perfilado.py)
+    with metricas_rerun(page), perfil_rerun(page):
+        # =================================================
+        # CARGA DE DATOS
+        # =================================================
+        # Los DataFrames viven en una caché compartida por todas las sesiones;
+        # cada sesión solo guarda referencias y la versión que tiene. Cada
+        # colección se carga la primera vez que una página la necesita.
+        necesarias = PAGINAS[page]
+        versiones_cache = shared_data_versions()
+        faltan = [c for c in necesarias if f"df_{c}" not in versiones_cache]
+        desfasada = st.session_state.get("data_versions") != versiones_cache
+
+        if not st.session_state.data_loaded or desfasada or faltan:
+            with tramo("cargar_datos"), st.spinner("Cargando datos..."):
+                barra = st.progress(0.0, text="Cargando datos...")
+
+                def progreso(coleccion, hechas, total):
+                    barra.progress(hechas / total, text=f"✔ {coleccion}")
+
+                data, versiones = get_shared_data(
+                    necesarias,
+                    sincronizar=not st.session_state.data_loaded,
+                    progreso=progreso
                 )
+                barra.empty()
+                if any(f"df_{c}" not in data for c in necesarias):
+                    st.error("No se pudieron cargar los datos.")
+                    st.stop()
 
-    elif page == "Pedidos":
-        show_pedidos_page(df_pedidos, st.session_state.data.get("df_listas"))
+                if data.get("df_pedidos") is not None and data["df_pedidos"].empty:
+                    data["df_pedidos"] = aplicar_esquema("pedidos", empty_pedidos_df())
 
-    elif page == "Posibles clientes":
-        show_posibles_clientes_page()
+                st.session_state.data = data
+                st.session_state.data_versions = versiones
+                st.session_state.data_loaded = True
 
-    elif page == "Gastos":
-        show_gastos_page(df_gastos)
+        df_pedidos = st.session_state.data.get("df_pedidos", empty_pedidos_df())
+        df_gastos = st.session_state.data.get("df_gastos")
 
-    elif page == "Resumen":
-        show_resumen_page(df_pedidos)
+        # =================================================
+        # PÁGINAS
+        # =================================================
+        if page == "Inicio":
+            st.header("🏠 Pedidos nuevos")
 
-    elif page == "Ver Datos":
-        show_analisis_productos_page(df_pedidos)
-
-    elif page == "Configuración":
-        show_config_page()
+            if df_pedidos.empty:
+                st.info("No hay pedidos.")
+            else:
+                # ---- ESTADOS (código de estado, ver utils/estados.py) ----
+                sin_empezar = INICIO | TERMINADO | PENDIENTE | RETIRADO
+                nuevos = df_pedidos[(df_pedidos[COLUMNA_ESTADO] & sin_empezar) == 0]
+
+                if nuevos.empty:
+                    st.success("🎉 No hay pedidos nuevos pendientes")
+                else:
+                    nuevos = nuevos.sort_values(["Año", "ID"], ascending=[False, False])
+
+                    tabla = nuevos[[
+                        "ID", "Año", "Cliente", "Club", "Telefono",
+                        "Precio", "Cobrado"
+                    ]]
+
+                    st.dataframe(
+                        tabla,
+                        use_container_width=True,
+                        hide_index=True
+                    )
+
+        elif page == "Pedidos":
+            show_pedidos_page(
+                df_pedidos,
+                st.session_state.data.get("df_listas"),
+                st.session_state.data.get("df_lineas_productos"),
+                obtener_indice(st.session_state.data, df_pedidos)
+            )
+
+        elif page == "Posibles clientes":
+            show_posibles_clientes_page(
+                st.session_state.data.get("df_posibles_clientes")
+            )
+
+        elif page == "Gastos":
+            show_gastos_page(df_gastos)
+
+        elif page == "Resumen":
+            show_resumen_page(
+                df_pedidos,
+                st.session_state.data.get("df_conteos_estado")
+            )
+
+        elif page == "Ver Datos":
+            show_analisis_productos_page(
+                df_pedidos,
+                st.session_state.data.get("df_lineas_productos")
+            )
+
+        elif page == "Configuración":
+            show_config_page()
@@ -0,0 +1,106 @@
+# benchmarks/bench_productos.py
+"""
+Compara la explosión de Productos fila a fila (implementación anterior de
+analisis_productos_page) con la tabla de líneas vectorizada.
+
+    python benchmarks/bench_productos.py [num_pedidos] [productos_por_pedido]
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.productos_utils import construir_lineas_productos  # noqa: E402
+from modules.analisis_productos_page import detalle_productos  # noqa: E402
+
+PRODUCTOS = ["Maillot", "Culotte", "Chaleco", "Chaqueta", "Camiseta"]
+TELAS = ["Lycra", "Poliéster", "Roubaix", "Malla"]
+
+
+def generar_pedidos(n, items):
+    rnd = random.Random(42)
+    return pd.DataFrame({
+        "id_documento_firestore": [f"doc{i}" for i in range(n)],
+        "ID": [i % 2000 + 1 for i in range(n)],
+        "Año": [2020 + i // 2000 for i in range(n)],
+        "Cliente": [f"Cliente {rnd.randint(1, 500)}" for _ in range(n)],
+        "Club": [f"Club {rnd.randint(1, 80)}" for _ in range(n)],
+        "Productos": [
+            json.dumps([{
+                "Producto": rnd.choice(PRODUCTOS),
+                "Tela": rnd.choice(TELAS),
+                "PrecioUnitario": round(rnd.uniform(10, 90), 2),
+                "Cantidad": rnd.randint(1, 20),
+            } for _ in range(items)])
+            for _ in range(n)
+        ],
+    })
+
+
+def explotar_productos_json(df):
+    # Implementación anterior, fila a fila
+    registros = []
+
+    for _, row in df.iterrows():
+        productos_raw = row.get('Productos')
+        if not productos_raw:
+            continue
+
+        try:
+            productos = json.loads(productos_raw) if isinstance(productos_raw, str) else productos_raw
+        except Exception:
+            continue
+
+        for p in productos:
+            registros.append({
+                'Pedido': f"{row.get('ID')} / {row.get('Año')}",
+                'Cliente': row.get('Cliente'),
+                'Club': row.get('Club'),
+                'Producto': p.get('Producto'),
+                'Tela': p.get('Tela'),
+                'Cantidad': int(p.get('Cantidad', 1)),
+                'Precio Unitario': float(p.get('PrecioUnitario', 0.0)),
+                'Total': float(p.get('PrecioUnitario', 0.0)) * int(p.get('Cantidad', 1))
+            })
+
+    return pd.DataFrame(registros)
+
+
+def medir(fn, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultado = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor, resultado
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    items = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    df = generar_pedidos(n, items)
+
+    t_antes, esperado = medir(lambda: explotar_productos_json(df))
+    t_ahora, obtenido = medir(
+        lambda: detalle_productos(construir_lineas_productos(df), df)
+    )
+
+    pd.testing.assert_frame_equal(
+        esperado.reset_index(drop=True),
+        obtenido.reset_index(drop=True),
+        check_dtype=False
+    )
+
+    print(f"{n} pedidos x {items} productos ({len(obtenido)} líneas)")
+    print(f"  fila a fila:  {t_antes * 1000:8.1f} ms")
+    print(f"  vectorizado:  {t_ahora * 1000:8.1f} ms")
+    print(f"  mejora:       {t_antes / t_ahora:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# benchmarks/bench_suite.py
+"""
+Mide los caminos calientes de la app con datos sintéticos sobre un backend
+local (utils/almacenamiento.py) en lugar de Firestore: tiempo, pico de
+memoria y lecturas/escrituras de documentos, y lo compara con una línea
+base guardada.
+
+    python benchmarks/bench_suite.py                      # 1k y 10k, memoria
+    python benchmarks/bench_suite.py --tamaños 100000 --backend sqlite
+    python benchmarks/bench_suite.py --casos backup_zip,backup_xlsx
+    python benchmarks/bench_suite.py --guardar-baseline   # actualiza la base
+
+Las lecturas se cuentan como las factura Firestore: un documento devuelto
+es una lectura, una consulta vacía cuenta una y un count()/sum() una por
+cada 1000 documentos. Sale con código 1 si algún caso empeora respecto a
+la línea base.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Copia local y outbox fuera de data/: cada ejecución parte de cero
+os.environ.setdefault("IMPERYO_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="bench_snapshot_"))
+# Sin escuchas en tiempo real: sus hilos leerían en segundo plano y
+# falsearían tiempos y lecturas de los casos
+os.environ.setdefault("IMPERYO_TIEMPO_REAL", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd  # noqa: E402
+import streamlit.logger  # noqa: E402
+
+# Fuera de `streamlit run` la caché avisa en cada llamada de que no hay runtime
+streamlit.logger.set_log_level("error")
+
+import utils.firestore_utils as firestore_utils  # noqa: E402
+from utils.almacenamiento import ClienteLocal, MotorMemoria, MotorSQLite  # noqa: E402
+from utils.backup_utils import crear_backup_zip, datos_backup  # noqa: E402
+from utils.estados import COLUMNA_ESTADO, VISTAS, contar_vista  # noqa: E402
+from utils.excel_utils import crear_backup_en_memoria  # noqa: E402
+from utils.helpers import calcular_renumeracion  # noqa: E402
+from utils.productos_utils import construir_lineas_productos  # noqa: E402
+from modules.analisis_productos_page import detalle_productos  # noqa: E402
+
+from generador import generar_todo  # noqa: E402
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+TAMAÑOS = [1_000, 10_000]
+
+# Un caso empeora si tarda más de TOLERANCIA_TIEMPO veces lo guardado (y
+# al menos MARGEN_TIEMPO segundos más), si usa más de TOLERANCIA_MEMORIA
+# veces la memoria, o si hace más lecturas/escrituras.
+TOLERANCIA_TIEMPO = 1.5
+MARGEN_TIEMPO = 0.02
+TOLERANCIA_MEMORIA = 1.5
+
+
+# =====================================================
+# BACKEND CON CONTADORES
+# =====================================================
+class MotorContado:
+    """Envuelve un motor y cuenta lecturas y escrituras de documentos."""
+
+    def __init__(self, motor):
+        self.motor = motor
+        self.lock = motor.lock
+        self.lecturas = 0
+        self.escrituras = 0
+
+    def reiniciar(self):
+        self.lecturas = 0
+        self.escrituras = 0
+
+    def leer(self, coleccion, doc_id):
+        self.lecturas += 1
+        return self.motor.leer(coleccion, doc_id)
+
+    def consultar(self, coleccion, filtros, orden, limite, despues):
+        filas = self.motor.consultar(coleccion, filtros, orden, limite, despues)
+        self.lecturas += max(1, len(filas))
+        return filas
+
+    def agregar(self, coleccion, filtros, sumas):
+        n, totales = self.motor.agregar(coleccion, filtros, sumas)
+        self.lecturas += max(1, -(-n // 1000))
+        return n, totales
+
+    def escribir(self, ops):
+        self.escrituras += len(ops)
+        self.motor.escribir(ops)
+
+
+def crear_cliente(backend, directorio):
+    if backend == "sqlite":
+        motor = MotorSQLite(Path(directorio) / f"bench_{time.time_ns()}.sqlite3")
+    else:
+        motor = MotorMemoria()
+    return ClienteLocal(MotorContado(motor))
+
+
+def poblar(cliente, documentos):
+    ahora = datetime.now(timezone.utc)
+    ops = [
+        ("set", coleccion, f"{coleccion[:3]}{i:07d}", {**doc, "updated_at": ahora})
+        for coleccion, docs in documentos.items()
+        for i, doc in enumerate(docs)
+    ]
+    for inicio in range(0, len(ops), 5000):
+        cliente.motor.motor.escribir(ops[inicio:inicio + 5000])
+
+
+def frames_publicados(documentos):
+    # DataFrames como los deja la caché compartida (esquema + derivadas)
+    cache = firestore_utils._SharedCache()
+    for coleccion, docs in documentos.items():
+        df = pd.DataFrame(docs)
+        df["id_documento_firestore"] = [f"{coleccion[:3]}{i:07d}" for i in range(len(docs))]
+        cache.publicar(f"df_{coleccion}", df)
+    return cache.data
+
+
+# =====================================================
+# CASOS
+# =====================================================
+# Cada caso: preparar(documentos, cliente) -> estado (no se mide) y
+# ejecutar(estado) (se mide).
+def _sin_preparar(documentos, cliente):
+    return documentos
+
+
+def _preparar_frames(documentos, cliente):
+    return frames_publicados(documentos)
+
+
+def caso_carga_completa(documentos):
+    firestore_utils.load_dataframes_firestore(colecciones=list(documentos))
+
+
+def caso_carga_compartida(documentos):
+    firestore_utils.invalidate_shared_data()
+    firestore_utils.get_shared_data(list(documentos))
+
+
+def caso_lineas_productos(data):
+    lineas = construir_lineas_productos(data["df_pedidos"])
+    detalle_productos(lineas, data["df_pedidos"])
+
+
+def caso_filtro_resumen(data):
+    # Lo que hace show_resumen_page por cada año y vista
+    df_pedidos = data["df_pedidos"]
+    conteos = data[firestore_utils.CONTEOS_KEY]
+    for año in df_pedidos["Año"].unique():
+        df = df_pedidos[df_pedidos["Año"] == año]
+        for vista, codigos in VISTAS.items():
+            df[df[COLUMNA_ESTADO].isin(codigos)]
+            contar_vista(conteos, año, vista)
+
+
+def _preparar_guardado(documentos, cliente):
+    # Los gastos tal como los lee la página, con un 1% de importes
+    # cambiados; la caché compartida vacía, así que el estado anterior se
+    # lee del backend
+    df = firestore_utils.load_dataframes_firestore(colecciones=["gastos"])["df_gastos"]
+    firestore_utils.invalidate_shared_data()
+    cambiados = df.sample(frac=0.01, random_state=1).index
+    df.loc[cambiados, "Importe"] = df.loc[cambiados, "Importe"] + 1
+    return df
+
+
+def caso_guardar_dataframe(df_gastos):
+    firestore_utils.save_dataframe_firestore(df_gastos, "gastos")
+
+
+def _preparar_borrado(documentos, cliente):
+    # Primer pedido del último año: hay que renumerar todos los demás
+    firestore_utils.invalidate_shared_data()
+    df = pd.DataFrame(documentos["pedidos"])
+    df["id_documento_firestore"] = [f"ped{i:07d}" for i in range(len(df))]
+    año = df["Año"].max()
+    df_año = df[df["Año"] == año]
+    primero = df_año.loc[df_año["ID"].idxmin()]
+    return (
+        primero["id_documento_firestore"],
+        calcular_renumeracion(df_año, int(primero["ID"])),
+    )
+
+
+def caso_borrar_renumerar(estado):
+    doc_id, renumeracion = estado
+    firestore_utils.delete_and_renumber_firestore("pedidos", doc_id, renumeracion)
+
+
+def caso_backup_xlsx(data):
+    crear_backup_en_memoria(datos_backup(data))
+
+
+def caso_backup_zip(data):
+    crear_backup_zip(datos_backup(data))
+
+
+CASOS = {
+    "carga_completa": (_sin_preparar, caso_carga_completa),
+    "carga_compartida": (_sin_preparar, caso_carga_compartida),
+    "lineas_productos": (_preparar_frames, caso_lineas_productos),
+    "filtro_resumen": (_preparar_frames, caso_filtro_resumen),
+    "guardar_dataframe": (_preparar_guardado, caso_guardar_dataframe),
+    "borrar_renumerar": (_preparar_borrado, caso_borrar_renumerar),
+    "backup_xlsx": (_preparar_frames, caso_backup_xlsx),
+    "backup_zip": (_preparar_frames, caso_backup_zip),
+}
+
+
+# =====================================================
+# EJECUCIÓN
+# =====================================================
+def medir_caso(nombre, documentos, backend, directorio, memoria=True):
+    preparar, ejecutar = CASOS[nombre]
+
+    def una_vez(con_memoria):
+        cliente = crear_cliente(backend, directorio)
+        firestore_utils.get_firestore_client = lambda: cliente
+        poblar(cliente, documentos)
+        estado = preparar(documentos, cliente)
+        cliente.motor.reiniciar()
+
+        # La basura de la preparación no debe recogerse a mitad del caso
+        gc.collect()
+        if con_memoria:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        ejecutar(estado)
+        segundos = time.perf_counter() - t0
+        pico = 0
+        if con_memoria:
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return segundos, pico, cliente.motor.lecturas, cliente.motor.escrituras
+
+    # El tiempo se toma sin tracemalloc, que ralentiza mucho la ejecución
+    segundos, _, lecturas, escrituras = una_vez(False)
+    pico = una_vez(True)[1] if memoria else 0
+    return {
+        "segundos": round(segundos, 4),
+        "pico_mb": round(pico / 2 ** 20, 2),
+        "lecturas": lecturas,
+        "escrituras": escrituras,
+    }
+
+
+def comparar(resultado, base):
+    motivos = []
+    if resultado["segundos"] > base["segundos"] * TOLERANCIA_TIEMPO + MARGEN_TIEMPO:
+        motivos.append(f"tiempo x{resultado['segundos'] / max(base['segundos'], 1e-9):.1f}")
+    if base.get("pico_mb") and resultado["pico_mb"] > base["pico_mb"] * TOLERANCIA_MEMORIA:
+        motivos.append(f"memoria x{resultado['pico_mb'] / base['pico_mb']:.1f}")
+    for campo in ("lecturas", "escrituras"):
+        if resultado[campo] > base[campo]:
+            motivos.append(f"{campo} {base[campo]} -> {resultado[campo]}")
+    return motivos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tamaños", default=",".join(map(str, TAMAÑOS)),
+                        help="número de pedidos, separados por comas")
+    parser.add_argument("--backend", choices=["memoria", "sqlite"], default="memoria")
+    parser.add_argument("--casos", default=",".join(CASOS))
+    parser.add_argument("--sin-memoria", action="store_true",
+                        help="no medir el pico de memoria (más rápido)")
+    parser.add_argument("--baseline", default=str(BASELINE))
+    parser.add_argument("--guardar-baseline", action="store_true")
+    args = parser.parse_args()
+
+    tamaños = [int(t) for t in args.tamaños.split(",")]
+    casos = [c for c in args.casos.split(",") if c]
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+    resultados = {}
+    regresiones = []
+    directorio = tempfile.mkdtemp(prefix="bench_db_")
+
+    print(f"{'caso':<20} {'n':>7} {'seg':>9} {'MB':>8} {'lect':>8} {'escr':>7}  vs base")
+    for n in tamaños:
+        documentos = generar_todo(n)
+        for caso in casos:
+            clave = f"{args.backend}/{caso}/{n}"
+            r = medir_caso(caso, documentos, args.backend, directorio, not args.sin_memoria)
+            resultados[clave] = r
+
+            base = baseline.get(clave)
+            if base is None:
+                nota = "(sin base)"
+            else:
+                motivos = comparar(r, base)
+                nota = "REGRESIÓN: " + ", ".join(motivos) if motivos else \
+                    f"ok ({r['segundos'] / max(base['segundos'], 1e-9):.2f}x)"
+                if motivos:
+                    regresiones.append(clave)
+
+            print(
+                f"{caso:<20} {n:>7} {r['segundos']:>9.4f} {r['pico_mb']:>8.2f} "
+                f"{r['lecturas']:>8} {r['escrituras']:>7}  {nota}"
+            )
+
+    if args.guardar_baseline:
+        baseline.update(resultados)
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"Línea base guardada en {baseline_path}")
+    elif regresiones:
+        print(f"{len(regresiones)} casos empeoran respecto a la línea base")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/generador.py
+"""
+Datos sintéticos con la forma de las colecciones reales (mismos campos que
+crean las páginas), reproducibles con una semilla.
+
+    generar_pedidos(10_000)            -> lista de dicts (documentos)
+    generar_gastos(2_500)
+    generar_posibles_clientes(1_000)
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+PRODUCTOS = ["Maillot", "Culotte", "Chaleco", "Chaqueta", "Camiseta", "Mono", "Manguitos"]
+TELAS = ["Lycra", "Poliéster", "Roubaix", "Malla", "Microfibra"]
+TIPOS_GASTO = ["Material", "Envíos", "Publicidad", "Maquinaria", "Otros"]
+CONCEPTOS = ["Rollo de tela", "Tinta", "Mensajería", "Redes sociales", "Mantenimiento"]
+ESTADOS_CLIENTE = ["Nuevo", "Contactado", "Pensándolo", "En negociación", "Perdido", "Cerrado"]
+INTERESES = ["Ciclismo", "Trail", "Ambos"]
+
+# Pedidos por año: los datos generados ocupan tantos años como haga falta
+PEDIDOS_POR_AÑO = 2000
+GASTOS_POR_AÑO = 500
+
+
+def generar_pedidos(n, semilla=42, año_final=None):
+    rnd = random.Random(semilla)
+    año_final = año_final or datetime.now().year
+    años = max(1, -(-n // PEDIDOS_POR_AÑO))
+    clientes = [f"Cliente {i}" for i in range(max(50, n // 20))]
+    clubs = [f"Club {i}" for i in range(max(10, n // 200))]
+
+    pedidos = []
+    for i in range(n):
+        año = año_final - años + 1 + i // PEDIDOS_POR_AÑO
+        entrada = datetime(año, 1, 1) + timedelta(days=rnd.randint(0, 360))
+        terminado = rnd.random() < 0.7
+        pedidos.append({
+            "ID": i % PEDIDOS_POR_AÑO + 1,
+            "Año": año,
+            "Fecha entrada": entrada,
+            "Fecha salida": entrada + timedelta(days=rnd.randint(7, 40)) if terminado else None,
+            "Cliente": rnd.choice(clientes),
+            "Telefono": f"6{rnd.randint(10_000_000, 99_999_999)}",
+            "Club": rnd.choice(clubs),
+            "Precio": round(rnd.uniform(30, 900), 2),
+            "Precio Factura": round(rnd.uniform(30, 900), 2),
+            "Notas": "" if rnd.random() < 0.8 else "Revisar tallas",
+            "Productos": json.dumps([{
+                "Producto": rnd.choice(PRODUCTOS),
+                "Tela": rnd.choice(TELAS),
+                "PrecioUnitario": round(rnd.uniform(10, 90), 2),
+                "Cantidad": rnd.randint(1, 25),
+            } for _ in range(rnd.randint(1, 6))], ensure_ascii=False),
+            "Inicio Trabajo": terminado or rnd.random() < 0.5,
+            "Trabajo Terminado": terminado,
+            "Cobrado": terminado and rnd.random() < 0.8,
+            "Retirado": terminado and rnd.random() < 0.7,
+            "Pendiente": rnd.random() < 0.1,
+        })
+    return pedidos
+
+
+def generar_gastos(n, semilla=42, año_final=None):
+    rnd = random.Random(semilla)
+    año_final = año_final or datetime.now().year
+    años = max(1, -(-n // GASTOS_POR_AÑO))
+
+    gastos = []
+    for i in range(n):
+        año = año_final - años + 1 + i // GASTOS_POR_AÑO
+        gastos.append({
+            "ID": i % GASTOS_POR_AÑO + 1,
+            "Año": año,
+            "Fecha": datetime(año, 1, 1) + timedelta(days=rnd.randint(0, 360)),
+            "Concepto": rnd.choice(CONCEPTOS),
+            "Importe": round(rnd.uniform(5, 1500), 2),
+            "Tipo": rnd.choice(TIPOS_GASTO),
+        })
+    return gastos
+
+
+def generar_posibles_clientes(n, semilla=42):
+    rnd = random.Random(semilla)
+    ahora = datetime.now()
+
+    clientes = []
+    for i in range(n):
+        creado = ahora - timedelta(days=rnd.randint(0, 900))
+        clientes.append({
+            "Nombre": f"Posible {i}",
+            "Telefono": f"6{rnd.randint(10_000_000, 99_999_999)}",
+            "Club": f"Club {rnd.randint(0, 300)}",
+            "Interes": rnd.choice(INTERESES),
+            "Estado": rnd.choice(ESTADOS_CLIENTE),
+            "Notas": "",
+            "Fecha_creacion": creado,
+            "Ultima_actualizacion": creado + timedelta(days=rnd.randint(0, 60)),
+        })
+    return clientes
+
+
+def generar_todo(n_pedidos, semilla=42):
+    """{colección: documentos} con gastos y posibles clientes proporcionales."""
+    return {
+        "pedidos": generar_pedidos(n_pedidos, semilla),
+        "gastos": generar_gastos(max(1, n_pedidos // 4), semilla + 1),
+        "posibles_clientes": generar_posibles_clientes(max(1, n_pedidos // 10), semilla + 2),
+    }
@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json # ¡NUEVA IMPORTACION!
+
+from utils import firestore_utils
+from utils.firestore_utils import get_firestore_client
 
 # Define los nombres de tus colecciones en Firestore (equivalente a las hojas de Excel)
 # ¡IMPORTANTE! Estos nombres deben ser los que usarás en Firestore.
@@ -20,22 +20,9 @@ COLLECTION_NAMES = {
 @st.cache_resource
 def initialize_firestore():
     try:
-        # Recupera las credenciales de Firebase desde st.secrets
-        # La clave 'firestore' en secrets.toml contiene el JSON de la cuenta de servicio
-        
-        # ¡CAMBIO AQUI! Parseamos la cadena JSON de st.secrets en un diccionario Python
-        creds_json_string = st.secrets["firestore"]
-        creds_dict = json.loads(creds_json_string) # Convertir la cadena a diccionario
-        
-        # Inicializa la aplicación Firebase con las credenciales
-        # Si ya está inicializada, no hace nada
-        if not firebase_admin._apps:
-            cred = credentials.Certificate(creds_dict) # Ahora creds_dict es un diccionario
-            firebase_admin.initialize_app(cred)
-        
-        # Obtiene una instancia del cliente de Firestore
-        db = firestore.client()
-        return db
+        # Mismo cliente que la app: credenciales de st.secrets["firestore"],
+        # o el backend local de IMPERYO_BACKEND (utils/almacenamiento.py)
+        return get_firestore_client()
     except Exception as e:
         st.error(f"Error al inicializar Firebase Firestore: {e}")
         st.info("Asegúrate de que el archivo .streamlit/secrets.toml esté correctamente configurado con las credenciales de Firebase Firestore bajo la sección '[firestore]' y que el formato JSON sea válido.")
@@ -98,51 +85,14 @@ def save_dataframe_firestore(df, collection_key):
         return False
 
     try:
+        # Mismas escrituras que la app: updated_at nuevo en cada documento y
+        # lápida en los borrados, así la caché y la copia local se enteran.
+        # En 'pedidos' se actualizan o añaden filas; en el resto, lo que no
+        # está en `df` se borra.
+        firestore_utils.save_dataframe_firestore(df, collection_key)
         if collection_key == 'pedidos':
-            # Para la colección 'pedidos', iteramos sobre el DataFrame
-            # y usamos el 'id_documento_firestore' para actualizar o añadimos nuevos
-            for index, row in df.iterrows():
-                doc_id = row.get('id_documento_firestore') # Obtiene el ID de Firestore si existe
-                record_to_save = row.drop('id_documento_firestore', errors='ignore').to_dict() # Elimina la columna temporal
-
-                # Convierte Timestamp de Pandas a datetime.date o None
-                for col in ['Fecha Entrada', 'Fecha Salida']:
-                    if pd.notna(record_to_save.get(col)):
-                        record_to_save[col] = record_to_save[col].to_pydatetime().date()
-                    else:
-                        record_to_save[col] = None # Almacena como None si es NaT
-
-                # Convierte booleanos de Python a booleanos nativos de Firestore
-                for col in ['Inicio Trabajo', 'Cobrado', 'Retirado', 'Pendiente', 'Trabajo Terminado']:
-                    if col in record_to_save:
-                        record_to_save[col] = bool(record_to_save[col])
-
-                if doc_id:
-                    # Si el documento ya tiene un ID de Firestore, lo actualizamos
-                    db.collection(collection_name).document(doc_id).set(record_to_save)
-                else:
-                    # Si es un nuevo registro, Firestore generará un ID automáticamente
-                    db.collection(collection_name).add(record_to_save)
             st.success(f"Colección '{collection_name}' actualizada en Firestore.")
         else:
-            # Para otras colecciones (Listas, Gastos, etc.), borramos y reescribimos
-            # Esto es más simple para datos que no se modifican individualmente con frecuencia
-            
-            # 1. Borrar todos los documentos existentes en la colección
-            docs_to_delete = db.collection(collection_name).stream()
-            for doc in docs_to_delete:
-                doc.reference.delete()
-            
-            # 2. Añadir los nuevos documentos del DataFrame
-            for index, row in df.iterrows():
-                record_to_save = row.to_dict()
-                # Convertir Timestamp a datetime.date si es necesario (para fechas)
-                for col in df.select_dtypes(include=['datetime64[ns]']).columns:
-                    if pd.notna(record_to_save.get(col)):
-                        record_to_save[col] = record_to_save[col].to_pydatetime().date()
-                    else:
-                        record_to_save[col] = None
-                db.collection(collection_name).add(record_to_save)
             st.success(f"Colección '{collection_name}' sobrescrita en Firestore.")
         return True
     except Exception as e:
@@ -164,7 +114,8 @@ def delete_document_firestore(collection_key, doc_id_firestore):
         return False
 
     try:
-        db.collection(collection_name).document(doc_id_firestore).delete()
+        # Con lápida, para que la sincronización incremental lo quite
+        firestore_utils.delete_document_firestore(collection_key, doc_id_firestore)
         st.success(f"Documento con ID de Firestore '{doc_id_firestore}' eliminado de la colección '{collection_name}'.")
         return True
     except Exception as e:
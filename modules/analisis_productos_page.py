@@ -1,35 +1,35 @@
 import streamlit as st
 import pandas as pd
-import json
-
-def explotar_productos_json(df):
-    registros = []
-
-    for _, row in df.iterrows():
-        productos_raw = row.get('Productos')
-        if not productos_raw:
-            continue
-
-        try:
-            productos = json.loads(productos_raw) if isinstance(productos_raw, str) else productos_raw
-        except Exception:
-            continue
-
-        for p in productos:
-            registros.append({
-                'Pedido': f"{row.get('ID')} / {row.get('Año')}",  # ✅ ID + AÑO
-                'Cliente': row.get('Cliente'),
-                'Club': row.get('Club'),
-                'Producto': p.get('Producto'),
-                'Tela': p.get('Tela'),
-                'Cantidad': int(p.get('Cantidad', 1)),
-                'Precio Unitario': float(p.get('PrecioUnitario', 0.0)),
-                'Total': float(p.get('PrecioUnitario', 0.0)) * int(p.get('Cantidad', 1))
-            })
 
-    return pd.DataFrame(registros)
+from utils.firestore_utils import años_disponibles, cargar_año
+from utils.perfilado import perfilar, tramo
+
+# Colecciones que la página necesita cargadas
+COLECCIONES = ["pedidos"]
+
+
+def detalle_productos(df_lineas, df_pedidos):
+    """Líneas de producto con los datos del pedido, listas para mostrar."""
+    clientes = df_pedidos.reindex(
+        columns=["id_documento_firestore", "Cliente", "Club"]
+    ).drop_duplicates("id_documento_firestore")
+
+    df = df_lineas.merge(clientes, on="id_documento_firestore", how="left")
+
+    return pd.DataFrame({
+        'Pedido': df['ID'].astype(str) + " / " + df['Año'].astype(str),  # ✅ ID + AÑO
+        'Cliente': df['Cliente'],
+        'Club': df['Club'],
+        'Producto': df['Producto'],
+        'Tela': df['Tela'],
+        'Cantidad': df['Cantidad'],
+        'Precio Unitario': df['PrecioUnitario'],
+        'Total': df['PrecioUnitario'] * df['Cantidad'],
+    })
 
-def show_analisis_productos_page(df_pedidos):
+
+@perfilar
+def show_analisis_productos_page(df_pedidos, df_lineas):
     st.header("📈 Análisis de Productos")
     st.write("---")
 
@@ -38,15 +38,24 @@ def show_analisis_productos_page(df_pedidos):
         return
 
     # ✅ AÑOS DISPONIBLES
-    años = sorted(df_pedidos['Año'].dropna().unique(), reverse=True)
-    año = st.selectbox("📅 Año", años, index=0)
+    año = st.selectbox("📅 Año", años_disponibles("pedidos"), index=0)
+
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("pedidos", año):
+        st.rerun()
 
-    df = df_pedidos[df_pedidos['Año'] == año].copy()
+    with tramo("filtrar"):
+        df = df_pedidos[df_pedidos['Año'] == año]
     if df.empty:
         st.info(f"No hay datos en {año}.")
         return
 
-    df_prod = explotar_productos_json(df)
+    if df_lineas is None or df_lineas.empty:
+        st.info("No hay productos.")
+        return
+
+    with tramo("normalizar"):
+        df_prod = detalle_productos(df_lineas[df_lineas['Año'] == año], df)
     if df_prod.empty:
         st.info("No hay productos.")
         return
@@ -63,16 +72,17 @@ def show_analisis_productos_page(df_pedidos):
     st.write("---")
 
     # --- AGRUPADOS ---
-    resumen = (
-        df_prod
-        .groupby(['Producto', 'Tela'], dropna=False)
-        .agg({
-            'Cantidad': 'sum',
-            'Total': 'sum'
-        })
-        .reset_index()
-        .sort_values('Cantidad', ascending=False)
-    )
+    with tramo("agrupar"):
+        resumen = (
+            df_prod
+            .groupby(['Producto', 'Tela'], dropna=False)
+            .agg({
+                'Cantidad': 'sum',
+                'Total': 'sum'
+            })
+            .reset_index()
+            .sort_values('Cantidad', ascending=False)
+        )
 
     st.subheader("Resumen por producto")
     st.dataframe(resumen, use_container_width=True, hide_index=True)
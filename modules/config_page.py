@@ -1,16 +1,28 @@
 import streamlit as st
+import pandas as pd
 from datetime import datetime
 
-from utils.excel_utils import crear_backup_en_memoria
-from utils.firestore_utils import load_dataframes_firestore
-from utils.restore_from_excel import restore_from_excel
+from utils.excel_utils import crear_backup_en_memoria, XLSX_MIME
+from utils.backup_utils import crear_backup_zip, leer_datos_backup
+from utils.restore_from_excel import restore_from_excel, restauracion_pendiente
+from utils.perfilado import perfilar, tramo
+from utils.metricas import (
+    reruns_registrados, resumen_por_pagina, resumen_por_operacion,
+    exportar_jsonl, vaciar_metricas, MAX_RERUNS,
+)
 
+# Colecciones que la página necesita cargadas
+COLECCIONES = []
 
+
+@perfilar
 def show_config_page():
     st.header("⚙️ Configuración del Sistema")
     st.write("---")
 
-    tab_backup, tab_restore = st.tabs(["🔐 Backup", "📥 Restaurar"])
+    tab_backup, tab_restore, tab_diagnostico = st.tabs(
+        ["🔐 Backup", "📥 Restaurar", "📊 Diagnóstico"]
+    )
 
     # =================================================
     # BACKUP
@@ -28,48 +40,142 @@ def show_config_page():
             """
         )
 
-        if st.button("📦 Generar backup"):
-            with st.spinner("Generando backup..."):
-                data = load_dataframes_firestore()
-                buffer = crear_backup_en_memoria(data)
-
-                timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                filename = f"backup_imperyo_{timestamp}.xlsx"
-
-            st.success("✅ Backup listo para descargar")
+        formato = st.radio(
+            "Formato",
+            ["ZIP comprimido (rápido)", "Excel .xlsx (lento)"],
+            horizontal=True
+        )
 
-            st.download_button(
-                label="⬇️ Descargar backup",
-                data=buffer,
-                file_name=filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+        if st.button("📦 Generar backup"):
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+            with tramo("exportar"), st.spinner("Generando backup..."):
+                # Lectura completa: la caché no tiene todos los años
+                data = leer_datos_backup()
+
+                if formato.startswith("ZIP"):
+                    buffer, manifest = crear_backup_zip(
+                        data, st.session_state.get("backup_huella")
+                    )
+                    filename = f"backup_imperyo_{timestamp}.zip"
+                    mime = "application/zip"
+                else:
+                    buffer = crear_backup_en_memoria(data)
+                    manifest = None
+                    filename = f"backup_imperyo_{timestamp}.xlsx"
+                    mime = XLSX_MIME
+
+            if buffer is None:
+                st.info("ℹ️ No hay cambios desde el último backup.")
+            else:
+                if manifest:
+                    st.session_state.backup_huella = manifest["huella"]
+                    st.caption(f"Huella: {manifest['huella'][:12]}")
+
+                st.success("✅ Backup listo para descargar")
+
+                st.download_button(
+                    label="⬇️ Descargar backup",
+                    data=buffer,
+                    file_name=filename,
+                    mime=mime
+                )
 
     # =================================================
     # RESTAURAR
     # =================================================
     with tab_restore:
-        st.subheader("📥 Restaurar desde Excel")
-        st.warning("⚠️ Esta acción BORRARÁ todos los datos actuales y los sustituirá por los del Excel.")
+        st.subheader("📥 Restaurar desde backup")
+        st.warning("⚠️ Esta acción BORRARÁ todos los datos actuales y los sustituirá por los del backup.")
 
         uploaded_file = st.file_uploader(
-            "📁 Selecciona un archivo de backup (.xlsx)",
-            type=["xlsx"]
+            "📁 Selecciona un archivo de backup (.zip o .xlsx)",
+            type=["zip", "xlsx"]
         )
 
         if uploaded_file is not None:
             st.success(f"Archivo cargado: {uploaded_file.name}")
 
+            if restauracion_pendiente(uploaded_file):
+                st.info(
+                    "🔁 Hay una restauración a medias de este mismo archivo: "
+                    "continuará desde donde se quedó."
+                )
+
             confirm = st.checkbox(
                 "✅ Confirmo que quiero restaurar y borrar los datos actuales"
             )
 
             if confirm and st.button("🚀 RESTAURAR AHORA", type="primary"):
                 with st.spinner("Restaurando datos..."):
-                    ok, msg = restore_from_excel(uploaded_file)
+                    barra = st.progress(0.0)
+
+                    def progreso(coleccion, hechas, total):
+                        barra.progress(
+                            hechas / total,
+                            text=f"{coleccion}: bloque {hechas} de {total}"
+                        )
+
+                    ok, msg = restore_from_excel(uploaded_file, progreso)
+                    barra.empty()
 
                 if ok:
-                    st.success("🎉 Restauración completada correctamente")
+                    st.success(f"🎉 {msg}")
                     st.info("🔄 Recarga la aplicación (F5)")
                 else:
                     st.error(f"❌ Error al restaurar: {msg}")
+
+    # =================================================
+    # DIAGNÓSTICO
+    # =================================================
+    with tab_diagnostico:
+        st.subheader("📊 Consumo de Firestore")
+        st.caption(
+            f"Últimos {MAX_RERUNS} reruns de todas las sesiones desde que "
+            "arrancó la app. Lecturas y escrituras son documentos facturables."
+        )
+
+        reruns = reruns_registrados()
+        if not reruns:
+            st.info("Todavía no hay reruns registrados.")
+            return
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Reruns", len(reruns))
+        col2.metric("Lecturas", f"{sum(r['lecturas'] for r in reruns):,}")
+        col3.metric("Escrituras", f"{sum(r['escrituras'] for r in reruns):,}")
+
+        st.markdown("**Por página** (duración del rerun completo)")
+        st.dataframe(resumen_por_pagina(reruns), use_container_width=True, hide_index=True)
+
+        st.markdown("**Por llamada** (latencia de Firestore)")
+        st.dataframe(resumen_por_operacion(reruns), use_container_width=True, hide_index=True)
+
+        st.markdown("**Últimos reruns**")
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "Inicio": r["inicio"],
+                    "Sesión": r["sesion"],
+                    "Página": r["pagina"],
+                    "ms": r["ms"],
+                    "Lecturas": r["lecturas"],
+                    "Escrituras": r["escrituras"],
+                    "Llamadas": len(r["llamadas"]),
+                }
+                for r in reversed(reruns[-50:])
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        col_exportar, col_vaciar = st.columns(2)
+        col_exportar.download_button(
+            "⬇️ Exportar JSON lines",
+            data=exportar_jsonl(reruns),
+            file_name=f"metricas_imperyo_{datetime.now():%Y-%m-%d_%H-%M-%S}.jsonl",
+            mime="application/jsonl"
+        )
+        if col_vaciar.button("🧹 Vaciar métricas"):
+            vaciar_metricas()
+            st.rerun()
@@ -1,13 +1,24 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-import io
 
 from utils.firestore_utils import (
-    save_dataframe_firestore,
-    delete_document_firestore,
-    update_document_firestore
+    add_document_firestore,
+    update_document_firestore,
+    delete_and_renumber_firestore,
+    reservar_ids_firestore,
+    años_disponibles,
+    cargar_año,
+    año_en_memoria,
+    agregar_firestore,
 )
+from utils.helpers import calcular_renumeracion, safe_float
+from utils.schemas import aplicar_esquema
+from utils.excel_utils import excel_cacheado, XLSX_MIME
+from utils.perfilado import perfilar, tramo
+
+# Colecciones que la página necesita cargadas
+COLECCIONES = ["gastos"]
 
 # =====================================================
 # HELPERS
@@ -30,13 +41,6 @@ def get_next_gasto_id_por_año(df, año):
     return int(ids.max()) + 1 if not ids.empty else 1
 
 
-def reindexar_gastos_por_año(df, año):
-    df_otros = df[df["Año"] != año]
-    df_año = df[df["Año"] == año].sort_values("ID").reset_index(drop=True)
-    df_año["ID"] = range(1, len(df_año) + 1)
-    return pd.concat([df_año, df_otros], ignore_index=True)
-
-
 def format_fecha_col(df):
     df = df.copy()
     df["Fecha"] = pd.to_datetime(
@@ -49,18 +53,14 @@ def format_fecha_col(df):
 # MAIN PAGE
 # =====================================================
 
+@perfilar
 def show_gastos_page(df_gastos):
     st.header("💰 Gastos")
     st.write("---")
 
+    # df_gastos ya viene tipado (utils/schemas.py)
     if df_gastos is None or df_gastos.empty:
-        df_gastos = empty_gastos_df()
-
-    df_gastos = df_gastos.copy()
-    df_gastos["Año"] = pd.to_numeric(
-        df_gastos.get("Año", datetime.now().year),
-        errors="coerce"
-    ).fillna(datetime.now().year).astype(int)
+        df_gastos = aplicar_esquema("gastos", empty_gastos_df())
 
     # ---------- MENÚ INTERNO ----------
     if "gasto_section" not in st.session_state:
@@ -74,12 +74,14 @@ def show_gastos_page(df_gastos):
     )
 
     # ---------- SELECTOR AÑO ----------
-    años = sorted(df_gastos["Año"].unique(), reverse=True) \
-        if not df_gastos.empty else [datetime.now().year]
+    año = st.selectbox("📅 Año", años_disponibles("gastos"))
 
-    año = st.selectbox("📅 Año", años)
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("gastos", año):
+        st.rerun()
 
-    df_año = df_gastos[df_gastos["Año"] == año].copy()
+    with tramo("filtrar"):
+        df_año = df_gastos[df_gastos["Año"] == año]
 
     # =================================================
     # ➕ CREAR
@@ -103,7 +105,10 @@ def show_gastos_page(df_gastos):
                 st.error("❌ El concepto es obligatorio")
                 return
 
-            next_id = get_next_gasto_id_por_año(df_gastos, año)
+            next_id = reservar_ids_firestore(
+                "gastos", año,
+                minimo=get_next_gasto_id_por_año(df_gastos, año) - 1
+            )[0]
 
             nuevo = {
                 "ID": next_id,
@@ -112,16 +117,9 @@ def show_gastos_page(df_gastos):
                 "Concepto": concepto.strip(),
                 "Importe": float(importe),
                 "Tipo": tipo,
-                "id_documento_firestore": None
             }
 
-            df_gastos = pd.concat(
-                [df_gastos, pd.DataFrame([nuevo])],
-                ignore_index=True
-            )
-
-            if save_dataframe_firestore(df_gastos, "gastos"):
-                st.session_state.data["df_gastos"] = df_gastos
+            if add_document_firestore("gastos", nuevo):
                 st.success("✅ Gasto añadido")
                 st.balloons()
                 st.rerun()
@@ -135,10 +133,16 @@ def show_gastos_page(df_gastos):
         if df_año.empty:
             st.info("No hay gastos este año.")
         else:
-            total = df_año["Importe"].sum()
+            # El año ya está en memoria: la suma es local. Firestore solo
+            # si la caché no lo tiene entero (cacheada por versión)
+            if año_en_memoria("gastos", año):
+                total = float(df_año["Importe"].sum())
+            else:
+                total = agregar_firestore("gastos", año, sumas=("Importe",))["Importe"]
             st.metric("Total anual", f"{total:.2f} €")
 
-            df_show = format_fecha_col(df_año)
+            with tramo("normalizar"):
+                df_show = format_fecha_col(df_año)
 
             st.dataframe(
                 df_show.sort_values("ID", ascending=False),
@@ -146,16 +150,21 @@ def show_gastos_page(df_gastos):
                 hide_index=True
             )
 
-            df_excel = format_fecha_col(df_año)
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-                df_excel.to_excel(writer, index=False)
+            # Solo se genera al pulsar, cacheado por versión de datos y año.
+            # df_show no entra en la clave: vale mientras sea solo df_gastos
+            # filtrado por año y con la fecha formateada. Si se añade otro
+            # filtro o vista, tiene que ir también en la clave.
+            clave = (
+                "gastos",
+                st.session_state.get("data_versions", {}).get("df_gastos"),
+                año,
+            )
 
             st.download_button(
                 "📥 Descargar Excel",
-                buffer.getvalue(),
+                lambda: excel_cacheado(clave, df_show, "Gastos"),
                 file_name=f"gastos_{año}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                mime=XLSX_MIME
             )
 
     # =================================================
@@ -185,7 +194,7 @@ def show_gastos_page(df_gastos):
                     with c2:
                         importe_m = st.number_input(
                             "Importe (€)", min_value=0.01,
-                            value=float(gasto["Importe"])
+                            value=max(safe_float(gasto["Importe"]), 0.01)
                         )
                         tipo_m = st.selectbox(
                             "Tipo", ["Fijo", "Variable"],
@@ -228,19 +237,14 @@ def show_gastos_page(df_gastos):
 
                 if st.checkbox("Confirmo eliminar este gasto"):
                     if st.button("ELIMINAR DEFINITIVAMENTE", type="primary"):
-                        delete_document_firestore(
+                        if not delete_and_renumber_firestore(
                             "gastos",
-                            gasto["id_documento_firestore"]
-                        )
-
-                        df_gastos = df_gastos[
-                            ~((df_gastos["ID"] == del_id) & (df_gastos["Año"] == año))
-                        ]
-
-                        df_gastos = reindexar_gastos_por_año(df_gastos, año)
-
-                        save_dataframe_firestore(df_gastos, "gastos")
-                        st.session_state.data["df_gastos"] = df_gastos
-                        st.success("🗑️ Gasto eliminado")
-                        st.balloons()
-                        st.rerun()
+                            gasto["id_documento_firestore"],
+                            calcular_renumeracion(df_año, del_id),
+                            (año, int(df_año["ID"].max()), len(df_año) - 1)
+                        ):
+                            st.error("❌ El gasto ya no existe.")
+                        else:
+                            st.success("🗑️ Gasto eliminado")
+                            st.balloons()
+                            st.rerun()
@@ -1,25 +1,16 @@
 import streamlit as st
 import pandas as pd
-import json
 from datetime import datetime
 
+from utils.productos_utils import productos_de_pedido
+from utils.firestore_utils import años_disponibles, cargar_año
+from utils.indice_pedidos import IndicePedidos
+from utils.perfilado import perfilar
+
 
 # =====================================================
 # UTILIDADES
 # =====================================================
-def parse_productos(value):
-    if not value:
-        return []
-    try:
-        if isinstance(value, str):
-            return json.loads(value)
-        if isinstance(value, list):
-            return value
-    except Exception:
-        pass
-    return []
-
-
 def safe_date(v):
     if v is None:
         return ""
@@ -38,7 +29,8 @@ def safe_date(v):
 # =====================================================
 # CONSULTAR PEDIDO
 # =====================================================
-def show_consult(df_pedidos, df_listas=None):
+@perfilar
+def show_consult(df_pedidos, df_listas=None, df_lineas=None, indice=None):
 
     # ===============================
     # VOLVER A PEDIDOS
@@ -54,27 +46,20 @@ def show_consult(df_pedidos, df_listas=None):
         st.info("📭 No hay pedidos.")
         return
 
-    # ---------- NORMALIZAR ----------
-    df_pedidos = df_pedidos.copy()
-
-    df_pedidos["Año"] = pd.to_numeric(
-        df_pedidos["Año"], errors="coerce"
-    ).fillna(datetime.now().year).astype(int)
-
-    df_pedidos["ID"] = pd.to_numeric(
-        df_pedidos["ID"], errors="coerce"
-    ).fillna(0).astype(int)
+    indice = indice or IndicePedidos(df_pedidos)
 
     # ---------- SELECTORES ----------
-    años = sorted(df_pedidos["Año"].unique(), reverse=True)
-    año = st.selectbox("📅 Año", años)
+    año = st.selectbox("📅 Año", años_disponibles("pedidos"))
 
-    df_año = df_pedidos[df_pedidos["Año"] == año]
-    if df_año.empty:
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("pedidos", año):
+        st.rerun()
+
+    if not indice.num_pedidos(año):
         st.info("📭 No hay pedidos ese año.")
         return
 
-    max_id = int(df_año["ID"].max())
+    max_id = indice.max_id(año)
     pedido_id = st.number_input(
         "🆔 ID del pedido",
         min_value=1,
@@ -82,13 +67,11 @@ def show_consult(df_pedidos, df_listas=None):
         step=1
     )
 
-    pedido_df = df_año[df_año["ID"] == pedido_id]
-    if pedido_df.empty:
+    pedido = indice.pedido(año, pedido_id)
+    if pedido is None:
         st.warning("No existe ese pedido.")
         return
 
-    pedido = pedido_df.iloc[0]
-
     # =================================================
     # DATOS PRINCIPALES
     # =================================================
@@ -96,6 +79,7 @@ def show_consult(df_pedidos, df_listas=None):
 
     datos_pedido = pd.DataFrame([{
         "Pedido": f"{pedido_id} / {año}",
+        "Nº en el año": indice.secuencia(pedido),
         "Cliente": pedido.get("Cliente", ""),
         "Teléfono": pedido.get("Telefono", ""),
         "Club": pedido.get("Club", ""),
@@ -140,7 +124,7 @@ def show_consult(df_pedidos, df_listas=None):
     # =================================================
     st.markdown("### 🧵 Productos")
 
-    productos = parse_productos(pedido.get("Productos"))
+    productos = productos_de_pedido(df_lineas, pedido.get("id_documento_firestore"))
     if productos:
         df_prod = pd.DataFrame(productos)
         df_prod["Total (€)"] = (
@@ -2,11 +2,17 @@ import streamlit as st
 import time
 from datetime import datetime
 
-from utils.firestore_utils import add_document_firestore, get_next_id_por_año
+from utils.firestore_utils import (
+    add_document_firestore,
+    get_next_id_por_año,
+    reservar_ids_firestore,
+)
 from utils.data_utils import limpiar_telefono
+from utils.perfilado import perfilar
 from .helpers import convert_to_firestore_type
 
 
+@perfilar
 def show_create(df_pedidos, df_listas):
 
     col1, col2 = st.columns([1, 6])
@@ -31,6 +37,7 @@ def show_create(df_pedidos, df_listas):
     next_id = get_next_id_por_año(df_año, año_actual)
 
     st.markdown(f"### 🆔 ID del pedido: **{next_id}**")
+    st.caption("El ID definitivo se asigna al guardar.")
 
     with st.form("crear_pedido_form"):
         col1, col2 = st.columns(2)
@@ -66,8 +73,14 @@ def show_create(df_pedidos, df_listas):
             st.error("❌ Teléfono inválido")
             return
 
+        # ID reservado en Firestore: no se repite aunque otra sesión
+        # esté creando pedidos a la vez
+        nuevo_id = reservar_ids_firestore(
+            "pedidos", año_actual, minimo=next_id - 1
+        )[0]
+
         nuevo_pedido = {
-            "ID": next_id,
+            "ID": nuevo_id,
             "Año": año_actual,
             "Fecha entrada": convert_to_firestore_type(fecha_entrada),
             "Cliente": convert_to_firestore_type(cliente),
@@ -85,9 +98,9 @@ def show_create(df_pedidos, df_listas):
 
         add_document_firestore("pedidos", nuevo_pedido)
 
-        st.success("✅ Pedido creado correctamente")
+        st.success(f"✅ Pedido {nuevo_id} creado correctamente")
         time.sleep(1)
 
-        st.session_state.data_loaded = False
+        # La caché compartida ya incluye el pedido: no hace falta recargar
         st.session_state.pedido_modo = "menu"
         st.rerun()
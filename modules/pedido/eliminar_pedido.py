@@ -1,15 +1,17 @@
 import streamlit as st
 import pandas as pd
 import time
-from datetime import datetime
 
 from utils.firestore_utils import (
-    delete_document_firestore,
-    update_document_firestore
+    delete_and_renumber_firestore, años_disponibles, cargar_año
 )
+from utils.helpers import calcular_renumeracion
+from utils.indice_pedidos import IndicePedidos
+from utils.perfilado import perfilar
 
 
-def show_delete(df_pedidos, df_listas=None):
+@perfilar
+def show_delete(df_pedidos, df_listas=None, indice=None):
     st.subheader("🗑️ Eliminar Pedido")
     st.write("---")
 
@@ -18,30 +20,23 @@ def show_delete(df_pedidos, df_listas=None):
         return
 
     # =================================================
-    # NORMALIZAR
+    # SELECTORES
     # =================================================
-    df_pedidos = df_pedidos.copy()
-
-    df_pedidos["Año"] = pd.to_numeric(
-        df_pedidos["Año"], errors="coerce"
-    ).fillna(datetime.now().year).astype(int)
+    indice = indice or IndicePedidos(df_pedidos)
 
-    df_pedidos["ID"] = pd.to_numeric(
-        df_pedidos["ID"], errors="coerce"
-    ).fillna(0).astype(int)
+    año = st.selectbox(
+        "📅 Año del pedido", años_disponibles("pedidos"), key="delete_year"
+    )
 
-    # =================================================
-    # SELECTORES
-    # =================================================
-    años = sorted(df_pedidos["Año"].unique(), reverse=True)
-    año = st.selectbox("📅 Año del pedido", años, key="delete_year")
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("pedidos", año):
+        st.rerun()
 
-    df_año = df_pedidos[df_pedidos["Año"] == año].sort_values("ID")
-    if df_año.empty:
+    if not indice.num_pedidos(año):
         st.info(f"📭 No hay pedidos en {año}.")
         return
 
-    max_id = int(df_año["ID"].max())
+    max_id = indice.max_id(año)
 
     if "delete_id" not in st.session_state:
         st.session_state.delete_id = max_id
@@ -53,13 +48,11 @@ def show_delete(df_pedidos, df_listas=None):
         key="delete_id"
     )
 
-    pedido_df = df_año[df_año["ID"] == pedido_id]
-    if pedido_df.empty:
+    pedido = indice.pedido(año, pedido_id)
+    if pedido is None:
         st.warning("⚠️ No existe ese pedido.")
         return
 
-    pedido = pedido_df.iloc[0]
-
     # =================================================
     # INFO DEL PEDIDO (TABLA)
     # =================================================
@@ -67,6 +60,7 @@ def show_delete(df_pedidos, df_listas=None):
 
     info_df = pd.DataFrame([{
         "ID": pedido_id,
+        "Nº en el año": indice.secuencia(pedido),
         "Cliente": pedido.get("Cliente", ""),
         "Club": pedido.get("Club", ""),
         "Teléfono": pedido.get("Telefono", ""),
@@ -84,6 +78,11 @@ def show_delete(df_pedidos, df_listas=None):
         f"({pedido.get('Club', '')})?"
     )
 
+    mantener_huecos = st.checkbox(
+        "Mantener los IDs del resto de pedidos (dejar hueco en la numeración)",
+        key="delete_mantener_huecos"
+    )
+
     confirmar = st.checkbox(
         "Sí, confirmo que quiero eliminar este pedido definitivamente"
     )
@@ -97,28 +96,32 @@ def show_delete(df_pedidos, df_listas=None):
             st.error("❌ Pedido sin ID de Firestore.")
             return
 
-        # 1️⃣ BORRAR
-        if not delete_document_firestore("pedidos", doc_id):
-            st.error("❌ Error eliminando el pedido.")
+        # 1️⃣ IDS DEL AÑO A RENUMERAR (solo los que cambian)
+        renumeracion = {}
+        contador = None
+        if not mantener_huecos:
+            renumeracion = calcular_renumeracion(
+                indice.pedidos_del_año(año), pedido_id
+            )
+            contador = (año, max_id, indice.num_pedidos(año) - 1)
+
+        # 2️⃣ BORRAR + RENUMERAR EN UNA SOLA TRANSACCIÓN
+        if not delete_and_renumber_firestore(
+            "pedidos", doc_id, renumeracion, contador
+        ):
+            st.error("❌ El pedido ya no existe.")
             return
 
-        # 2️⃣ RENUMERAR IDS DEL AÑO
-        restantes = df_año[df_año["ID"] != pedido_id].sort_values("ID")
-
-        for new_id, (_, row) in enumerate(restantes.iterrows(), start=1):
-            if row["ID"] != new_id:
-                update_document_firestore(
-                    "pedidos",
-                    row["id_documento_firestore"],
-                    {"ID": new_id}
-                )
-
         # 3️⃣ RECARGA
         st.session_state.pop("data", None)
         st.session_state["data_loaded"] = False
 
         st.balloons()
-        st.success("✅ Pedido eliminado y IDs reordenados correctamente")
+        st.success(
+            "✅ Pedido eliminado"
+            if mantener_huecos
+            else "✅ Pedido eliminado y IDs reordenados correctamente"
+        )
 
         time.sleep(1.2)
         st.rerun()
@@ -4,8 +4,14 @@ import json
 import time
 from datetime import datetime, date
 
-from utils.firestore_utils import update_document_firestore
+from utils.firestore_utils import (
+    update_document_firestore, años_disponibles, cargar_año
+)
 from utils.data_utils import limpiar_telefono
+from utils.helpers import safe_float
+from utils.productos_utils import parse_productos
+from utils.indice_pedidos import IndicePedidos
+from utils.perfilado import perfilar
 from .helpers import convert_to_firestore_type, safe_select_index
 
 
@@ -33,23 +39,11 @@ def safe_to_date(value):
     return None
 
 
-def parse_productos(value):
-    if not value:
-        return []
-    try:
-        if isinstance(value, str):
-            return json.loads(value)
-        if isinstance(value, list):
-            return value
-    except Exception:
-        pass
-    return []
-
-
 # =========================
 # MODIFICAR PEDIDO
 # =========================
-def show_modify(df_pedidos, df_listas):
+@perfilar
+def show_modify(df_pedidos, df_listas, indice=None):
 
     # ===============================
     # SALIR SIN GUARDAR
@@ -71,30 +65,26 @@ def show_modify(df_pedidos, df_listas):
         st.info("📭 No hay pedidos.")
         return
 
-    # ---------- AÑOS ----------
-    df_pedidos = df_pedidos.copy()
-    df_pedidos["Año"] = pd.to_numeric(
-        df_pedidos["Año"], errors="coerce"
-    ).fillna(datetime.now().year).astype(int)
+    indice = indice or IndicePedidos(df_pedidos)
 
-    años = sorted(df_pedidos["Año"].unique(), reverse=True)
+    # ---------- AÑOS ----------
+    años = años_disponibles("pedidos")
 
     if "mod_year" not in st.session_state:
         st.session_state.mod_year = años[0]
 
     año = st.selectbox("📅 Año del pedido", años, key="mod_year")
 
-    df_año = df_pedidos[df_pedidos["Año"] == año]
-    if df_año.empty:
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("pedidos", año):
+        st.rerun()
+
+    if not indice.num_pedidos(año):
         st.info("📭 No hay pedidos ese año.")
         return
 
     # ---------- ID ----------
-    df_año["ID"] = pd.to_numeric(
-        df_año["ID"], errors="coerce"
-    ).fillna(0).astype(int)
-
-    max_id = int(df_año["ID"].max())
+    max_id = indice.max_id(año)
 
     if "mod_id" not in st.session_state:
         st.session_state.mod_id = max_id
@@ -106,17 +96,20 @@ def show_modify(df_pedidos, df_listas):
         key="mod_id"
     )
 
-    pedido_df = df_año[df_año["ID"] == pedido_id]
-    if pedido_df.empty:
+    pedido = indice.pedido(año, pedido_id)
+    if pedido is None:
         st.warning("⚠️ No existe ese pedido.")
         return
 
-    pedido = pedido_df.iloc[0]
-
     # ---------- PRODUCTOS ----------
     pedido_key = f"{año}_{pedido_id}"
     if st.session_state.get("pedido_key") != pedido_key:
-        productos = parse_productos(pedido.get("Productos"))
+        # Del JSON guardado, no de la tabla de líneas: al guardar se
+        # reescribe Productos entero y la tabla solo tiene cuatro columnas
+        productos = [
+            p for p in parse_productos(pedido.get("Productos"))
+            if isinstance(p, dict)
+        ]
         if not productos:
             productos = [{
                 "Producto": "",
@@ -193,13 +186,13 @@ def show_modify(df_pedidos, df_listas):
             precio = st.number_input(
                 "Precio total (€)",
                 min_value=0.0,
-                value=float(pedido.get("Precio", 0.0))
+                value=safe_float(pedido.get("Precio"))
             )
 
             precio_factura = st.number_input(
                 "Precio factura (€)",
                 min_value=0.0,
-                value=float(pedido.get("Precio Factura", 0.0))
+                value=safe_float(pedido.get("Precio Factura"))
             )
 
             fecha_salida = st.date_input(
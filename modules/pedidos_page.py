@@ -4,9 +4,14 @@ from modules.pedido.crear_pedido import show_create
 from modules.pedido.consultar_pedidos import show_consult
 from modules.pedido.modificar_pedido import show_modify
 from modules.pedido.eliminar_pedido import show_delete
+from utils.perfilado import perfilar
 
+# Colecciones que la página necesita cargadas
+COLECCIONES = ["pedidos", "listas"]
 
-def show_pedidos_page(df_pedidos, df_listas):
+
+@perfilar
+def show_pedidos_page(df_pedidos, df_listas, df_lineas=None, indice=None):
 
     st.header("📦 Pedidos")
     st.write("---")
@@ -57,13 +62,13 @@ def show_pedidos_page(df_pedidos, df_listas):
         return
 
     if section == "🔍 Consultar":
-        show_consult(df_pedidos, df_listas)
+        show_consult(df_pedidos, df_listas, df_lineas, indice)
         return
 
     if section == "✏️ Modificar":
-        show_modify(df_pedidos, df_listas)
+        show_modify(df_pedidos, df_listas, indice)
         return
 
     if section == "🗑️ Eliminar":
-        show_delete(df_pedidos, df_listas)
+        show_delete(df_pedidos, df_listas, indice)
         return
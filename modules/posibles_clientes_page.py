@@ -3,13 +3,16 @@ import pandas as pd
 from datetime import datetime
 
 from utils.firestore_utils import (
-    load_dataframes_firestore,
     update_document_firestore,
     delete_document_firestore,
     add_document_firestore,
 )
 from utils.helpers import convert_to_firestore_type
 from utils.data_utils import limpiar_telefono
+from utils.perfilado import perfilar
+
+# Colecciones que la página necesita cargadas
+COLECCIONES = ["posibles_clientes"]
 
 
 ESTADOS = [
@@ -28,14 +31,14 @@ INTERESES = [
 ]
 
 
-def show_posibles_clientes_page():
+@perfilar
+def show_posibles_clientes_page(df):
     st.header("📋 Posibles clientes")
     st.write("---")
 
-    data = load_dataframes_firestore()
-    df = data.get("df_posibles_clientes", pd.DataFrame())
-
-    if df.empty:
+    # `df` sale de la caché compartida (app.py). Guardar y borrar actualizan
+    # esa caché al escribir, así el rerun no vuelve a leer de Firestore.
+    if df is None or df.empty:
         df = pd.DataFrame(columns=[
             "Nombre",
             "Telefono",
@@ -48,19 +51,14 @@ def show_posibles_clientes_page():
             "id_documento_firestore",
         ])
 
-    df = df.copy()
+    etiquetas = _etiquetas(df)
 
     # =================================================
     # CREAR / EDITAR
     # =================================================
     st.subheader("✏️ Crear / Editar posible cliente")
 
-    opciones = ["➕ Nuevo cliente"]
-    if not df.empty:
-        opciones += [
-            f"{row['Nombre']} ({row['Telefono']})"
-            for _, row in df.iterrows()
-        ]
+    opciones = ["➕ Nuevo cliente"] + etiquetas
 
     seleccion = st.selectbox("Seleccionar cliente", opciones)
 
@@ -140,10 +138,7 @@ def show_posibles_clientes_page():
     if df.empty:
         st.info("No hay posibles clientes todavía.")
     else:
-        opciones_crear = [
-            f"{row['Nombre']} ({row['Telefono']})"
-            for _, row in df.iterrows()
-        ]
+        opciones_crear = etiquetas
 
         cliente_sel = st.selectbox(
             "Selecciona cliente para crear pedido",
@@ -174,10 +169,11 @@ def show_posibles_clientes_page():
     if df.empty:
         return
 
-    df_show = df.copy()
-    df_show["Última actualización"] = pd.to_datetime(
-        df_show["Ultima_actualizacion"], errors="coerce"
-    ).dt.strftime("%Y-%m-%d")
+    df_show = df.assign(**{
+        "Última actualización": pd.to_datetime(
+            df["Ultima_actualizacion"], errors="coerce"
+        ).dt.strftime("%Y-%m-%d")
+    })
 
     columnas = [
         "Nombre",
@@ -212,3 +208,12 @@ def show_posibles_clientes_page():
         delete_document_firestore("posibles_clientes", doc_id)
         st.success("🗑️ Cliente eliminado")
         st.rerun()
+
+
+def _etiquetas(df):
+    # "Nombre (Telefono)" de cada cliente, en el orden de `df`
+    if df.empty:
+        return []
+    return (
+        df["Nombre"].astype(str) + " (" + df["Telefono"].astype(str) + ")"
+    ).tolist()
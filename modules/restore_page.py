@@ -1,12 +1,11 @@
 # modules/restore_page.py
 import streamlit as st
 import pandas as pd
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
 import logging
 import os
 
+from utils.firestore_utils import reemplazar_coleccion_firestore
+
 logger = logging.getLogger(__name__)
 
 def restore_data_from_excel(excel_path, collection_mapping):
@@ -18,39 +17,16 @@ def restore_data_from_excel(excel_path, collection_mapping):
         collection_mapping: Diccionario {'sheet_name': 'collection_name'}
     """
     try:
-        # Inicializar Firestore si no está activo
-        if not firebase_admin._apps:
-            cred_dict = dict(st.secrets["firestore"])
-            cred = credentials.Certificate(cred_dict)
-            firebase_admin.initialize_app(cred)
-        db = firestore.client()
-
         xls = pd.ExcelFile(excel_path)
         
         for sheet_name, collection_name in collection_mapping.items():
             if sheet_name in xls.sheet_names:
                 df = pd.read_excel(xls, sheet_name=sheet_name)
-                collection_ref = db.collection(collection_name)
-                
-                # Limpiar colección existente
-                docs = collection_ref.stream()
-                batch = db.batch()
-                for doc in docs:
-                    batch.delete(doc.reference)
-                batch.commit()
-                
-                st.info(f"🧹 Colección '{collection_name}' limpiada. Subiendo {len(df)} registros...")
-                
-                # Subir nuevos documentos
-                for _, row in df.iterrows():
-                    doc_data = row.to_dict()
-                    # Eliminar zona horaria de fechas
-                    for key, value in doc_data.items():
-                        if isinstance(value, pd.Timestamp):
-                            doc_data[key] = value.tz_localize(None)
-                        elif isinstance(value, datetime) and value.tzinfo is not None:
-                            doc_data[key] = value.replace(tzinfo=None)
-                    collection_ref.add(doc_data)
+                st.info(f"🧹 Sustituyendo la colección '{collection_name}' por {len(df)} registros...")
+
+                # Borra lo actual (con lápidas) y sube el Excel con updated_at
+                # nuevo; también vacía la caché y la copia local
+                reemplazar_coleccion_firestore(collection_name, df)
                 
                 st.success(f"✅ Colección '{collection_name}' restaurada desde hoja '{sheet_name}'.")
                 logger.info(f"Colección '{collection_name}' restaurada con {len(df)} documentos.")
@@ -1,44 +1,39 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
-import io
 
+from utils.firestore_utils import años_disponibles, cargar_año
+from utils.estados import COLUMNA_ESTADO, VISTAS, contar_estados, contar_vista
+from utils.excel_utils import excel_cacheado, XLSX_MIME
+from utils.perfilado import perfilar, tramo
 
-# =====================================================
-# PREPARAR DATAFRAME PARA EXCEL
-# =====================================================
-def preparar_df_para_excel(df: pd.DataFrame) -> pd.DataFrame:
-    df_export = df.copy()
-
-    for col in df_export.columns:
-        if pd.api.types.is_datetime64tz_dtype(df_export[col]):
-            df_export[col] = df_export[col].dt.tz_convert(None)
-
-    for col in df_export.columns:
-        def clean_value(v):
-            try:
-                if pd.isna(v):
-                    return None
-            except Exception:
-                pass
-
-            if isinstance(v, pd.Timestamp):
-                return v.tz_convert(None) if v.tzinfo else v
-            if isinstance(v, datetime):
-                return v.replace(tzinfo=None) if v.tzinfo else v
-            if isinstance(v, (list, dict)):
-                return str(v)
-            return v
-
-        df_export[col] = df_export[col].apply(clean_value)
-
-    return df_export
+# Colecciones que la página necesita cargadas
+COLECCIONES = ["pedidos"]
 
 
 # =====================================================
 # RESUMEN
 # =====================================================
-def show_resumen_page(df_pedidos):
+def tabla_resumen(df):
+    """Pedidos listos para la tabla: etiqueta "ID / Año" y fechas en texto."""
+    df_show = df.copy()
+    # ID es Int64 nullable: un pedido sin ID se muestra con "—"
+    df_show["Pedido"] = (
+        df_show["ID"].astype("string").fillna("—")
+        + " / " + df_show["Año"].astype(str)
+    )
+
+    for col in ["Fecha entrada", "Fecha Salida"]:
+        if col in df_show.columns:
+            df_show[col] = (
+                pd.to_datetime(df_show[col], errors="coerce")
+                .dt.strftime("%Y-%m-%d")
+                .fillna("")
+            )
+    return df_show
+
+
+@perfilar
+def show_resumen_page(df_pedidos, conteos=None):
     st.header("📊 Resumen de Pedidos")
     st.write("---")
 
@@ -46,46 +41,33 @@ def show_resumen_page(df_pedidos):
         st.info("📭 No hay pedidos.")
         return
 
-    # =================================================
-    # 🔒 NORMALIZAR (IGUAL QUE consultar_pedidos.py)
-    # =================================================
-    df_pedidos = df_pedidos.copy()
-
-    df_pedidos["Año"] = pd.to_numeric(
-        df_pedidos["Año"], errors="coerce"
-    ).fillna(datetime.now().year).astype(int)
-
-    df_pedidos["ID"] = pd.to_numeric(
-        df_pedidos["ID"], errors="coerce"
-    ).fillna(0).astype(int)
-
     # =================================================
     # 🔥 ELIMINAR DUPLICADOS (SOLO VISTA)
     # =================================================
-    if "id_documento_firestore" in df_pedidos.columns:
-        df_pedidos = df_pedidos.drop_duplicates(
-            subset=["Año", "ID", "id_documento_firestore"]
-        )
-    else:
-        df_pedidos = df_pedidos.drop_duplicates(
-            subset=["Año", "ID"]
-        )
+    with tramo("normalizar"):
+        if "id_documento_firestore" in df_pedidos.columns:
+            df_pedidos = df_pedidos.drop_duplicates(
+                subset=["Año", "ID", "id_documento_firestore"]
+            )
+        else:
+            df_pedidos = df_pedidos.drop_duplicates(
+                subset=["Año", "ID"]
+            )
 
     # =================================================
     # SELECTORES (SIDEBAR)
     # =================================================
-    años_disponibles = sorted(
-        df_pedidos["Año"].unique(),
-        reverse=True
-    )
-
     año = st.sidebar.selectbox(
         "📅 Año",
-        años_disponibles,
+        años_disponibles("pedidos"),
         index=0,
         key="resumen_year_select"
     )
 
+    # Los años que no están en memoria se piden a Firestore al elegirlos
+    if cargar_año("pedidos", año):
+        st.rerun()
+
     vistas = [
         "Todos los pedidos",
         "Nuevos pedidos",
@@ -105,82 +87,36 @@ def show_resumen_page(df_pedidos):
     # =================================================
     # FILTRAR POR AÑO
     # =================================================
-    df = df_pedidos[df_pedidos["Año"] == año].copy()
+    with tramo("filtrar"):
+        df = df_pedidos[df_pedidos["Año"] == año]
     if df.empty:
         st.info(f"📭 No hay pedidos en {año}.")
         return
 
     # =================================================
-    # FILTRO POR VISTA
+    # FILTRO POR VISTA (código de estado, ver utils/estados.py)
     # =================================================
-    if vista == "Todos los pedidos":
-        filtered = df
-
-    elif vista == "Nuevos pedidos":
-        filtered = df[
-            (~df["Inicio Trabajo"]) &
-            (~df["Pendiente"]) &
-            (~df["Trabajo Terminado"]) &
-            (~df["Cobrado"]) &
-            (~df["Retirado"])
-        ]
-
-    elif vista == "Trabajos empezados":
-        filtered = df[
-            (df["Inicio Trabajo"]) &
-            (~df["Trabajo Terminado"])
-        ]
-
-    elif vista == "Pedidos pendientes":
-        filtered = df[df["Pendiente"]]
-
-    elif vista == "Trabajos terminados":
-        filtered = df[
-            (df["Trabajo Terminado"]) &
-            ~(df["Cobrado"] & df["Retirado"])
-        ]
-
-    elif vista == "Trabajos completados":
-        filtered = df[
-            (df["Trabajo Terminado"]) &
-            (df["Cobrado"]) &
-            (df["Retirado"])
-        ]
-
-    else:
-        filtered = df
+    with tramo("filtrar"):
+        filtered = df[df[COLUMNA_ESTADO].isin(VISTAS.get(vista, VISTAS["Todos los pedidos"]))]
 
     # =================================================
-    # KPIs
+    # KPIs (tabla de conteos por año y estado)
     # =================================================
+    if conteos is None:
+        conteos = contar_estados(df)
+
     c1, c2, c3, c4, c5 = st.columns(5)
 
     with c1:
         st.metric("📦 Total", len(filtered))
     with c2:
-        st.metric(
-            "✔️ Completados",
-            len(df[
-                (df["Trabajo Terminado"]) &
-                (df["Cobrado"]) &
-                (df["Retirado"])
-            ])
-        )
+        st.metric("✔️ Completados", contar_vista(conteos, año, "Trabajos completados"))
     with c3:
-        st.metric("📌 Pendientes", len(df[df["Pendiente"]]))
+        st.metric("📌 Pendientes", contar_vista(conteos, año, "Pedidos pendientes"))
     with c4:
-        st.metric("🔵 Empezados", len(df[df["Inicio Trabajo"]]))
+        st.metric("🔵 Empezados", contar_vista(conteos, año, "Empezados"))
     with c5:
-        st.metric(
-            "🆕 Nuevos",
-            len(df[
-                (~df["Inicio Trabajo"]) &
-                (~df["Pendiente"]) &
-                (~df["Trabajo Terminado"]) &
-                (~df["Cobrado"]) &
-                (~df["Retirado"])
-            ])
-        )
+        st.metric("🆕 Nuevos", contar_vista(conteos, año, "Nuevos pedidos"))
 
     st.write("---")
 
@@ -191,18 +127,8 @@ def show_resumen_page(df_pedidos):
     # =================================================
     # TABLA
     # =================================================
-    df_show = filtered.copy()
-    df_show["Pedido"] = df_show.apply(
-        lambda r: f"{int(r['ID'])} / {int(r['Año'])}", axis=1
-    )
-
-    for col in ["Fecha entrada", "Fecha Salida"]:
-        if col in df_show.columns:
-            df_show[col] = (
-                pd.to_datetime(df_show[col], errors="coerce")
-                .dt.strftime("%Y-%m-%d")
-                .fillna("")
-            )
+    with tramo("normalizar"):
+        df_show = tabla_resumen(filtered)
 
     columnas = [
         "Pedido", "Cliente", "Club", "Telefono",
@@ -222,15 +148,18 @@ def show_resumen_page(df_pedidos):
     # =================================================
     # EXPORTAR
     # =================================================
-    buffer = io.BytesIO()
-    df_export = preparar_df_para_excel(filtered)
-
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        df_export.to_excel(writer, index=False, sheet_name="Resumen")
+    # El Excel solo se genera al pulsar el botón, y se reutiliza mientras
+    # no cambien los datos, el año o la vista
+    clave = (
+        "resumen",
+        st.session_state.get("data_versions", {}).get("df_pedidos"),
+        año,
+        vista,
+    )
 
     st.download_button(
         "📥 Descargar Excel",
-        buffer.getvalue(),
+        lambda: excel_cacheado(clave, filtered, "Resumen"),
         f"resumen_{vista.replace(' ', '_').lower()}_{año}.xlsx",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        XLSX_MIME
     )
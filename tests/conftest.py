@@ -0,0 +1,41 @@
+# tests/conftest.py
+# Las pruebas usan el backend en memoria (utils/almacenamiento.py), sin
+# escuchas y con la copia local y el outbox fuera de data/. Las variables
+# tienen que estar antes de importar utils.
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ["IMPERYO_BACKEND"] = "memoria"
+os.environ["IMPERYO_TIEMPO_REAL"] = "0"
+os.environ.setdefault("IMPERYO_SNAPSHOT_DIR", tempfile.mkdtemp(prefix="test_snapshot_"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import streamlit.logger  # noqa: E402
+
+# Fuera de `streamlit run` la caché avisa en cada llamada de que no hay runtime
+streamlit.logger.set_log_level("error")
+
+import pytest  # noqa: E402
+
+import utils.firestore_utils as firestore_utils  # noqa: E402
+
+
+@pytest.fixture
+def firestore_vacio():
+    """Backend sin documentos y caché compartida vacía, antes y después."""
+    def vaciar():
+        firestore_utils.invalidate_shared_data()
+        db = firestore_utils.get_firestore_client()
+        colecciones = list(firestore_utils.COLLECTIONS.values()) + [
+            firestore_utils.TOMBSTONES_COLLECTION, firestore_utils.COUNTERS_COLLECTION,
+        ]
+        for coleccion in colecciones:
+            for doc in db.collection(coleccion).stream():
+                doc.reference.delete()
+
+    vaciar()
+    yield firestore_utils.get_firestore_client()
+    vaciar()
@@ -0,0 +1,121 @@
+# tests/test_backup.py
+"""
+El backup sale de una lectura completa de Firestore, no de la caché
+compartida, que solo tiene algunos años de pedidos y gastos, se puede
+descargar desde Configuración y se puede restaurar.
+
+    python -m pytest tests
+"""
+import json
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+
+import utils.backup_utils as backup_utils
+import utils.firestore_utils as firestore_utils
+from utils.backup_utils import crear_backup_zip, leer_datos_backup
+from utils.excel_utils import crear_backup_en_memoria
+from utils.restore_from_excel import restore_from_excel
+
+AÑO_ACTUAL = datetime.now().year
+AÑO_ANTIGUO = AÑO_ACTUAL - firestore_utils.MAX_AÑOS_EN_MEMORIA - 2
+
+
+@pytest.fixture
+def datos(firestore_vacio):
+    for año in (AÑO_ACTUAL, AÑO_ANTIGUO):
+        firestore_utils.add_document_firestore("pedidos", {
+            "ID": 1, "Año": año, "Cliente": f"Cliente {año}", "Productos": "[]",
+        })
+        firestore_utils.add_document_firestore("gastos", {
+            "ID": 1, "Año": año, "Concepto": f"Gasto {año}", "Importe": 10.0,
+        })
+
+    # La caché compartida no tiene el año antiguo
+    data, _ = firestore_utils.get_shared_data(["pedidos", "gastos"])
+    assert AÑO_ANTIGUO not in set(data["df_pedidos"]["Año"])
+    assert AÑO_ANTIGUO not in set(data["df_gastos"]["Año"])
+
+
+def test_backup_zip_incluye_años_fuera_de_memoria(datos):
+    contenido, manifest = crear_backup_zip(leer_datos_backup())
+
+    with zipfile.ZipFile(BytesIO(contenido)) as zf:
+        for coleccion in ("pedidos", "gastos"):
+            filas = [json.loads(linea) for linea in zf.read(f"{coleccion}.ndjson").splitlines()]
+            assert {int(f["Año"]) for f in filas} == {AÑO_ACTUAL, AÑO_ANTIGUO}
+            assert manifest["colecciones"][f"{coleccion}.ndjson"]["filas"] == 2
+
+
+def test_backup_xlsx_incluye_años_fuera_de_memoria(datos):
+    buffer = crear_backup_en_memoria(leer_datos_backup())
+
+    for hoja in ("pedidos", "gastos"):
+        df = pd.read_excel(buffer, sheet_name=hoja)
+        assert set(df["Año"].astype(int)) == {AÑO_ACTUAL, AÑO_ANTIGUO}
+
+
+def test_backup_zip_sin_cambios_no_genera_el_zip(datos, monkeypatch):
+    data = leer_datos_backup()
+    _, manifest = crear_backup_zip(data)
+
+    def no_llamar(*args, **kwargs):
+        raise AssertionError("con la misma huella no se escribe el ZIP")
+
+    monkeypatch.setattr(backup_utils, "_bloque_ndjson", no_llamar)
+    contenido, repetido = crear_backup_zip(data, manifest["huella"])
+    assert contenido is None
+    assert repetido["huella"] == manifest["huella"]
+
+
+def test_backup_zip_se_restaura(datos):
+    contenido, _ = crear_backup_zip(leer_datos_backup())
+    antes = leer_datos_backup()["df_gastos"]
+
+    firestore_utils.reemplazar_coleccion_firestore("gastos", antes.iloc[:0])
+    ok, msg = restore_from_excel(contenido)
+    assert ok, msg
+
+    despues = leer_datos_backup()["df_gastos"]
+    columnas = ["id_documento_firestore", "Año", "Concepto", "Importe"]
+    pd.testing.assert_frame_equal(
+        despues.sort_values("id_documento_firestore")[columnas].reset_index(drop=True),
+        antes.sort_values("id_documento_firestore")[columnas].reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+@pytest.mark.parametrize("formato", ["ZIP comprimido (rápido)", "Excel .xlsx (lento)"])
+def test_descarga_desde_configuracion(datos, monkeypatch, formato):
+    # Lo que st.download_button entrega al navegador
+    descargas = []
+    original = MemoryMediaFileStorage.load_and_get_id
+
+    def guardar(self, path_or_data, mimetype, kind, filename=None):
+        descargas.append(path_or_data)
+        return original(self, path_or_data, mimetype, kind, filename)
+
+    monkeypatch.setattr(MemoryMediaFileStorage, "load_and_get_id", guardar)
+
+    at = AppTest.from_string(
+        "from modules.config_page import show_config_page\n"
+        "show_config_page()\n",
+        default_timeout=30,
+    ).run()
+    at.radio[0].set_value(formato).run()
+    next(b for b in at.button if b.label == "📦 Generar backup").click().run()
+
+    assert not at.exception
+    assert [d.label for d in at.get("download_button")] == ["⬇️ Descargar backup"]
+    assert len(descargas) == 1
+    # .zip y .xlsx son los dos archivos ZIP
+    with zipfile.ZipFile(BytesIO(descargas[0])) as zf:
+        if formato.startswith("ZIP"):
+            assert "manifest.json" in zf.namelist()
+        else:
+            assert "xl/workbook.xml" in zf.namelist()
@@ -0,0 +1,44 @@
+# tests/test_escrituras.py
+"""
+Las escrituras de mantenimiento dejan updated_at nuevo y lápidas, así la
+sincronización incremental desde una marca anterior las ve.
+"""
+import pandas as pd
+
+import utils.firestore_utils as firestore_utils
+
+
+def _gastos_en_firestore():
+    for concepto in ("Luz", "Agua", "Alquiler"):
+        firestore_utils.add_document_firestore("gastos", {
+            "ID": 1, "Año": 2024, "Concepto": concepto, "Importe": 10.0,
+        })
+    df = firestore_utils.load_dataframes_firestore(colecciones=["gastos"])["df_gastos"]
+    return df.sort_values("Concepto").reset_index(drop=True)
+
+
+def test_reemplazar_coleccion_se_ve_en_la_sincronizacion(firestore_vacio):
+    df = _gastos_en_firestore()
+    marca = firestore_utils.nueva_marca_sync()
+
+    # Se queda Agua (cambiada) y Luz; Alquiler desaparece
+    nuevo = df[df["Concepto"] != "Alquiler"].copy()
+    nuevo.loc[nuevo["Concepto"] == "Agua", "Importe"] = 99.0
+    firestore_utils.reemplazar_coleccion_firestore("gastos", nuevo)
+
+    sincronizado, _ = firestore_utils.sync_dataframes_firestore({"df_gastos": df}, marca)
+    importes = sincronizado["df_gastos"].set_index("Concepto")["Importe"].to_dict()
+    assert importes == {"Agua": 99.0, "Luz": 10.0}
+
+
+def test_reemplazar_con_ids_nuevos_borra_los_anteriores(firestore_vacio):
+    df = _gastos_en_firestore()
+    marca = firestore_utils.nueva_marca_sync()
+
+    firestore_utils.reemplazar_coleccion_firestore("gastos", df, nuevos_ids=True)
+
+    sincronizado, _ = firestore_utils.sync_dataframes_firestore({"df_gastos": df}, marca)
+    df_sync = sincronizado["df_gastos"]
+    assert sorted(df_sync["Concepto"]) == ["Agua", "Alquiler", "Luz"]
+    assert not set(df_sync["id_documento_firestore"]) & set(df["id_documento_firestore"])
+    assert pd.Series(df_sync["updated_at"]).notna().all()
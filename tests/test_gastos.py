@@ -0,0 +1,47 @@
+# tests/test_gastos.py
+from datetime import datetime
+
+from streamlit.testing.v1 import AppTest
+
+import modules.gastos_page as gastos_page
+import utils.firestore_utils as firestore_utils
+
+AÑO_ACTUAL = datetime.now().year
+AÑO_ANTIGUO = AÑO_ACTUAL - firestore_utils.MAX_AÑOS_EN_MEMORIA - 2
+
+
+def test_año_en_memoria(firestore_vacio):
+    for año in (AÑO_ACTUAL, AÑO_ANTIGUO):
+        firestore_utils.add_document_firestore("gastos", {
+            "ID": 1, "Año": año, "Concepto": "Luz", "Importe": 10.0,
+        })
+    firestore_utils.get_shared_data(["gastos"])
+
+    assert firestore_utils.año_en_memoria("gastos", AÑO_ACTUAL)
+    assert not firestore_utils.año_en_memoria("gastos", AÑO_ANTIGUO)
+
+
+def test_consultar_suma_en_local(firestore_vacio, monkeypatch):
+    for i, importe in enumerate((10.5, 4.25), start=1):
+        firestore_utils.add_document_firestore("gastos", {
+            "ID": i, "Año": AÑO_ACTUAL, "Fecha": datetime(AÑO_ACTUAL, 1, i),
+            "Concepto": f"Gasto {i}", "Importe": importe, "Tipo": "Otro",
+        })
+
+    def no_llamar(*args, **kwargs):
+        raise AssertionError("el año está en memoria, no se consulta Firestore")
+
+    monkeypatch.setattr(gastos_page, "agregar_firestore", no_llamar)
+
+    at = AppTest.from_string(
+        "from modules import gastos_page\n"
+        "from utils.firestore_utils import get_shared_data\n"
+        "data, _ = get_shared_data(gastos_page.COLECCIONES)\n"
+        "gastos_page.show_gastos_page(data['df_gastos'])\n",
+        default_timeout=30,
+    )
+    at.session_state["gasto_section"] = "🔍 Consultar"
+    at.run()
+
+    assert not at.exception
+    assert at.metric[0].value == "14.75 €"
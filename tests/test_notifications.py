@@ -0,0 +1,34 @@
+# tests/test_notifications.py
+import logging
+
+import pytest
+
+import utils.notifications as notifications
+
+
+@pytest.fixture
+def encolados(monkeypatch):
+    cola = []
+    monkeypatch.setattr(notifications, "encolar", lambda canal, payload: cola.append(payload))
+    return cola
+
+
+def test_enviar_telegram_sin_token(encolados, caplog):
+    with caplog.at_level(logging.WARNING, logger=notifications.__name__):
+        assert notifications.enviar_telegram("Hola", "-100")
+        assert notifications.enviar_telegram("Hola", chat_id="-100")
+
+    assert encolados == [{"text": "Hola", "chat_id": "-100"}] * 2
+    assert not caplog.records
+
+
+def test_enviar_telegram_ignora_el_token_antiguo(encolados, caplog):
+    with caplog.at_level(logging.WARNING, logger=notifications.__name__):
+        assert notifications.enviar_telegram("Hola", "123:ABC", "-100")
+        assert notifications.enviar_telegram("Hola", bot_token="123:ABC", chat_id="-100")
+
+    # El token no llega a la cola ni al log
+    assert encolados == [{"text": "Hola", "chat_id": "-100"}] * 2
+    assert len(caplog.records) == 2
+    assert all("obsoleto" in r.getMessage() for r in caplog.records)
+    assert all("123:ABC" not in r.getMessage() for r in caplog.records)
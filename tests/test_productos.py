@@ -0,0 +1,48 @@
+# tests/test_productos.py
+import json
+
+import pandas as pd
+
+from utils.productos_utils import construir_lineas_productos
+
+
+def _pedidos(productos):
+    return pd.DataFrame({
+        "id_documento_firestore": [f"doc{i}" for i in range(len(productos))],
+        "Año": 2024,
+        "ID": range(1, len(productos) + 1),
+        "Productos": productos,
+    })
+
+
+def _lineas_por_pedido(df):
+    lineas = construir_lineas_productos(df)
+    return lineas.groupby("id_documento_firestore")["Producto"].apply(list).to_dict()
+
+
+def test_una_linea_por_producto():
+    df = _pedidos([
+        json.dumps([{"Producto": "a"}, {"Producto": "b"}, {"Producto": "c"}]),
+        json.dumps([{"Producto": "d"}]),
+    ])
+    assert _lineas_por_pedido(df) == {"doc0": ["a", "b", "c"], "doc1": ["d"]}
+
+
+def test_productos_mal_formado_que_se_une_con_comas():
+    # Dentro del array común '[..],[..]' aporta dos elementos
+    df = _pedidos([
+        json.dumps([{"Producto": "x"}]),
+        '[{"Producto": "y"}],[{"Producto": "z"}]',
+        json.dumps([{"Producto": "w"}]),
+    ])
+    assert _lineas_por_pedido(df) == {"doc0": ["x"], "doc2": ["w"]}
+
+
+def test_dos_mal_formados_que_se_compensan():
+    # Unidos darían dos listas y los productos acabarían en otro pedido
+    df = _pedidos([
+        '[{"Producto": "y"}], [{"Producto": "z"}',
+        '{"Producto": "v"}]',
+        json.dumps([{"Producto": "w"}]),
+    ])
+    assert _lineas_por_pedido(df) == {"doc2": ["w"]}
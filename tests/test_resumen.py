@@ -0,0 +1,19 @@
+# tests/test_resumen.py
+import pandas as pd
+
+from modules.resumen_page import tabla_resumen
+from utils.schemas import aplicar_esquema
+
+
+def test_pedido_sin_id_no_rompe_la_tabla():
+    df = aplicar_esquema("pedidos", pd.DataFrame({
+        "ID": [7, None],
+        "Año": [2024, 2024],
+        "Cliente": ["Ana", "Luis"],
+        "Fecha entrada": ["2024-03-01", None],
+    }))
+    assert df["ID"].isna().any()
+
+    df_show = tabla_resumen(df)
+    assert df_show["Pedido"].tolist() == ["7 / 2024", "— / 2024"]
+    assert df_show["Fecha entrada"].tolist() == ["2024-03-01", ""]
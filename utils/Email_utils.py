@@ -3,23 +3,23 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import streamlit as st
 
+from utils.outbox import encolar, CANAL_EMAIL
+
+# --- CONFIGURACIÓN SMTP (MODIFICA ESTO) ---
+# En secrets [email] pueden indicarse también "server", "port" y
+# "starttls" (p. ej. para probar con un servidor SMTP local)
+SMTP_SERVER = "smtp.gmail.com"  # Cambia si usas Outlook, Yahoo, etc.
+SMTP_PORT = 587
+
+
 def send_completion_email(to_email, client_name, product_name, delivery_date):
     """
     Envía un email al cliente cuando su pedido cambia a 'Terminado'.
+
+    El email se deja en la cola de avisos (utils/outbox.py) y se envía en
+    segundo plano: devuelve True si ha quedado en la cola.
     """
     try:
-        # --- CONFIGURACIÓN SMTP (MODIFICA ESTO) ---
-        SMTP_SERVER = "smtp.gmail.com"  # Cambia si usas Outlook, Yahoo, etc.
-        SMTP_PORT = 587
-        SENDER_EMAIL = st.secrets["email"]["sender"]  # Ej: "tuemail@gmail.com"
-        SENDER_PASSWORD = st.secrets["email"]["password"]  # Contraseña de app (no la de la cuenta)
-
-        # --- CREAR MENSAJE ---
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = "🎉 ¡Tu pedido está listo! - Imperyo Sport"
-
         body = f"""
 Hola {client_name},
 
@@ -32,18 +32,88 @@ Gracias por confiar en nosotros. ¡Te esperamos!
 — Equipo Imperyo Sport
         """.strip()
 
-        msg.attach(MIMEText(body, 'plain'))
-
-        # --- ENVIAR EMAIL ---
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        text = msg.as_string()
-        server.sendmail(SENDER_EMAIL, to_email, text)
-        server.quit()
-
+        encolar(CANAL_EMAIL, {
+            "to": to_email,
+            "subject": "🎉 ¡Tu pedido está listo! - Imperyo Sport",
+            "body": body,
+        })
         return True
 
     except Exception as e:
         print(f"[EMAIL ERROR] {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+# =====================================================
+# CONEXIÓN SMTP REUTILIZABLE
+# =====================================================
+class ConexionSMTP:
+    """
+    Una conexión SMTP (STARTTLS + login una sola vez) para todos los
+    emails de un lote y de los lotes siguientes, hasta cerrar(). Si el
+    servidor la ha cortado, se reconecta y se reintenta ese email.
+    """
+
+    def __init__(self, servidor=SMTP_SERVER, puerto=SMTP_PORT, remitente=None,
+                 password=None, starttls=True):
+        self.servidor = servidor
+        self.puerto = puerto
+        self.remitente = remitente
+        self.password = password
+        self.starttls = starttls
+        self._smtp = None
+
+    @classmethod
+    def desde_secrets(cls):
+        config = st.secrets.get("email", {})
+        return cls(
+            servidor=config.get("server", SMTP_SERVER),
+            puerto=int(config.get("port", SMTP_PORT)),
+            remitente=config.get("sender"),
+            password=config.get("password"),
+            starttls=bool(config.get("starttls", True)),
+        )
+
+    def enviar_lote(self, payloads):
+        errores = []
+        for payload in payloads:
+            try:
+                self._enviar(payload)
+                errores.append(None)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self.cerrar()
+                try:
+                    self._enviar(payload)
+                    errores.append(None)
+                except Exception as e:
+                    errores.append(str(e))
+            except Exception as e:
+                errores.append(str(e))
+        return errores
+
+    def _enviar(self, payload):
+        msg = MIMEMultipart()
+        msg['From'] = self.remitente
+        msg['To'] = payload["to"]
+        msg['Subject'] = payload["subject"]
+        msg.attach(MIMEText(payload["body"], 'plain'))
+
+        self._conexion().sendmail(self.remitente, payload["to"], msg.as_string())
+
+    def _conexion(self):
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.servidor, self.puerto, timeout=30)
+            if self.starttls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.remitente, self.password)
+            self._smtp = smtp
+        return self._smtp
+
+    def cerrar(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
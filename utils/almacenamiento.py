@@ -0,0 +1,746 @@
+# utils/almacenamiento.py
+import enum
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from firebase_admin import firestore
+from google.api_core import exceptions as gcp_exceptions
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# BACKENDS DE ALMACENAMIENTO
+# =====================================================
+# firestore_utils trabaja siempre con un "cliente" con la API de Firestore
+# (collection, document, where, stream, batch, transaction...). Además del
+# cliente real hay un cliente local con la misma API sobre un motor de
+# documentos propio, para usar la app sin conexión, hacer pruebas de carga
+# y comparar rendimiento:
+#
+#   IMPERYO_BACKEND=firestore  -> Firestore (por defecto)
+#   IMPERYO_BACKEND=memoria    -> diccionarios en memoria (se pierde al salir)
+#   IMPERYO_BACKEND=sqlite     -> SQLite con índices (IMPERYO_SQLITE_PATH)
+#
+# Del cliente local solo existe lo que usa la app: filtros de igualdad,
+# rango e "in", order_by, limit, start_after, count()/sum(), batches,
+# transacciones y on_snapshot. Las transacciones se serializan con un lock
+# del proceso, y on_snapshot solo ve las escrituras hechas con el mismo
+# cliente (no las de otro proceso sobre el mismo SQLite).
+BACKENDS = ("firestore", "memoria", "sqlite")
+BACKEND = os.environ.get("IMPERYO_BACKEND", "firestore")
+SQLITE_PATH = Path(
+    os.environ.get(
+        "IMPERYO_SQLITE_PATH",
+        Path(__file__).resolve().parent.parent / "data" / "imperyo.sqlite3"
+    )
+)
+
+# Nombre de campo con el que Firestore se refiere al ID del documento
+ID_DOCUMENTO = "__name__"
+
+
+def crear_cliente_local(backend=None, path=None):
+    """Cliente local ("memoria" o "sqlite") con la API de Firestore."""
+    backend = backend or BACKEND
+    if backend == "memoria":
+        return ClienteLocal(MotorMemoria())
+    if backend == "sqlite":
+        return ClienteLocal(MotorSQLite(path or SQLITE_PATH))
+    raise ValueError(f"Backend de almacenamiento desconocido: {backend}")
+
+
+def transaccional(funcion):
+    """
+    Como firestore.transactional, pero vale también para las
+    transacciones del cliente local.
+    """
+    remota = firestore.transactional(funcion)
+
+    def ejecutar(transaction, *args, **kwargs):
+        if isinstance(transaction, TransaccionLocal):
+            return transaction.ejecutar(funcion, *args, **kwargs)
+        return remota(transaction, *args, **kwargs)
+
+    return ejecutar
+
+
+# =====================================================
+# CLIENTE LOCAL (API DE FIRESTORE)
+# =====================================================
+class ClienteLocal:
+    def __init__(self, motor):
+        self.motor = motor
+        self._escuchas = []
+        self._lock_escuchas = threading.Lock()
+
+    def collection(self, nombre):
+        return ColeccionLocal(self, nombre)
+
+    def batch(self):
+        return LoteLocal(self)
+
+    def transaction(self):
+        return TransaccionLocal(self)
+
+    def _notificar(self, ops):
+        with self._lock_escuchas:
+            self._escuchas = [e for e in self._escuchas if e.is_active]
+            escuchas = list(self._escuchas)
+        for escucha in escuchas:
+            escucha.notificar(ops)
+
+
+class SnapshotLocal:
+    def __init__(self, referencia, datos):
+        self.reference = referencia
+        self.id = referencia.id
+        self._datos = datos
+
+    @property
+    def exists(self):
+        return self._datos is not None
+
+    def to_dict(self):
+        return None if self._datos is None else dict(self._datos)
+
+    def get(self, campo):
+        if campo == ID_DOCUMENTO:
+            return self.id
+        return (self._datos or {}).get(campo)
+
+
+class DocumentoLocal:
+    def __init__(self, cliente, coleccion, doc_id):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self.id = doc_id
+
+    @property
+    def parent(self):
+        return ColeccionLocal(self._cliente, self._coleccion)
+
+    def get(self, transaction=None):
+        return SnapshotLocal(self, self._cliente.motor.leer(self._coleccion, self.id))
+
+    def set(self, datos, merge=False):
+        lote = LoteLocal(self._cliente)
+        lote.set(self, datos, merge=merge)
+        lote.commit()
+
+    def update(self, datos):
+        lote = LoteLocal(self._cliente)
+        lote.update(self, datos)
+        lote.commit()
+
+    def delete(self):
+        lote = LoteLocal(self._cliente)
+        lote.delete(self)
+        lote.commit()
+
+
+class ConsultaLocal:
+    def __init__(self, cliente, coleccion, filtros=(), orden=(), limite=None, despues=None):
+        self._cliente = cliente
+        self._coleccion = coleccion
+        self._filtros = tuple(filtros)
+        self._orden = tuple(orden)
+        self._limite = limite
+        self._despues = despues
+
+    def _copia(self, **cambios):
+        args = {
+            "filtros": self._filtros, "orden": self._orden,
+            "limite": self._limite, "despues": self._despues,
+        }
+        args.update(cambios)
+        return ConsultaLocal(self._cliente, self._coleccion, **args)
+
+    def where(self, campo=None, op=None, valor=None, filter=None):
+        if filter is not None:
+            campo, op, valor = filter.field_path, filter.op_string, filter.value
+        return self._copia(filtros=self._filtros + ((str(campo), op, _normalizar(valor)),))
+
+    def order_by(self, campo, direction="ASCENDING"):
+        return self._copia(orden=self._orden + ((str(campo), direction == "DESCENDING"),))
+
+    def limit(self, limite):
+        return self._copia(limite=limite)
+
+    def start_after(self, snapshot):
+        return self._copia(despues=snapshot)
+
+    def select(self, campos):
+        # Sin proyección: se devuelven los documentos completos
+        return self
+
+    def _orden_completo(self):
+        # Como Firestore: el ID del documento desempata al final
+        orden = list(self._orden)
+        if not any(campo == ID_DOCUMENTO for campo, _ in orden):
+            orden.append((ID_DOCUMENTO, orden[-1][1] if orden else False))
+        return orden
+
+    def stream(self, transaction=None):
+        orden = self._orden_completo()
+        despues = None
+        if self._despues is not None:
+            despues = [_normalizar(self._despues.get(campo)) for campo, _ in orden]
+
+        filas = self._cliente.motor.consultar(
+            self._coleccion, self._filtros, orden, self._limite, despues
+        )
+        for doc_id, datos in filas:
+            yield SnapshotLocal(
+                DocumentoLocal(self._cliente, self._coleccion, doc_id), datos
+            )
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return AgregacionLocal(self).count(alias)
+
+    def sum(self, campo, alias=None):
+        return AgregacionLocal(self).sum(campo, alias)
+
+    def on_snapshot(self, callback):
+        # Se registra antes de la primera consulta para no perder escrituras
+        escucha = EscuchaLocal(self, callback)
+        with self._cliente._lock_escuchas:
+            self._cliente._escuchas.append(escucha)
+        escucha.iniciar()
+        return escucha
+
+
+class ColeccionLocal(ConsultaLocal):
+    def __init__(self, cliente, nombre):
+        super().__init__(cliente, nombre)
+        self.id = nombre
+
+    def document(self, doc_id=None):
+        return DocumentoLocal(self._cliente, self.id, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, datos):
+        ref = self.document()
+        ref.set(datos)
+        return datetime.now(timezone.utc), ref
+
+
+class ResultadoAgregacion:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AgregacionLocal:
+    def __init__(self, consulta):
+        self._consulta = consulta
+        self._agregaciones = []
+
+    def count(self, alias=None):
+        self._agregaciones.append(("count", None, alias or "count"))
+        return self
+
+    def sum(self, campo, alias=None):
+        self._agregaciones.append(("sum", str(campo), alias or f"sum_{campo}"))
+        return self
+
+    def get(self, transaction=None):
+        q = self._consulta
+        sumas = [campo for tipo, campo, _ in self._agregaciones if tipo == "sum"]
+        n, totales = q._cliente.motor.agregar(q._coleccion, q._filtros, sumas)
+        totales = iter(totales)
+        return [[
+            ResultadoAgregacion(alias, n if tipo == "count" else next(totales))
+            for tipo, _, alias in self._agregaciones
+        ]]
+
+
+class LoteLocal:
+    def __init__(self, cliente):
+        self._cliente = cliente
+        self._ops = []
+
+    def set(self, ref, datos, merge=False):
+        self._ops.append(("merge" if merge else "set", ref._coleccion, ref.id, _resolver(datos)))
+
+    def update(self, ref, datos):
+        self._ops.append(("update", ref._coleccion, ref.id, _resolver(datos)))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref._coleccion, ref.id, None))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        self._cliente.motor.escribir(ops)
+        self._cliente._notificar(ops)
+        return []
+
+
+class TransaccionLocal(LoteLocal):
+    def ejecutar(self, funcion, *args, **kwargs):
+        # Las lecturas ven el estado actual y nadie más escribe hasta el
+        # commit: el lock del motor hace la transacción serializable
+        with self._cliente.motor.lock:
+            resultado = funcion(self, *args, **kwargs)
+            self.commit()
+        return resultado
+
+
+# =====================================================
+# ESCUCHAS (ON_SNAPSHOT)
+# =====================================================
+class TipoCambio(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+
+class CambioLocal:
+    def __init__(self, tipo, documento):
+        self.type = tipo
+        self.document = documento
+
+
+class EscuchaLocal:
+    """
+    Como el Watch de Firestore: en un hilo propio llama a
+    callback(docs, cambios, read_time) primero con todos los documentos de
+    la consulta y después con los que entran, cambian o salen de ella.
+    Solo se tienen en cuenta los filtros de la consulta.
+    """
+
+    def __init__(self, consulta, callback):
+        self._consulta = consulta
+        self._callback = callback
+        self._docs = {}
+        self._cola = queue.Queue()
+        self.is_active = True
+
+    def iniciar(self):
+        self._cola.put(None)
+        threading.Thread(
+            target=self._bucle, daemon=True, name=f"escucha-{self._consulta._coleccion}"
+        ).start()
+
+    def notificar(self, ops):
+        ids = {doc_id for _, coleccion, doc_id, _ in ops if coleccion == self._consulta._coleccion}
+        if ids:
+            self._cola.put(ids)
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._cola.put(False)
+
+    def _bucle(self):
+        primera = True
+        while True:
+            ids = self._cola.get()
+            if ids is False or not self.is_active:
+                return
+            cambios = self._cambios(ids)
+            if cambios or primera:
+                try:
+                    self._callback(list(self._docs.values()), cambios, datetime.now(timezone.utc))
+                except Exception:
+                    logger.exception("Error en la escucha local")
+            primera = False
+
+    def _cambios(self, ids):
+        q = self._consulta
+        if ids is None:
+            filas = q._cliente.motor.consultar(q._coleccion, q._filtros, [], None, None)
+        else:
+            filas = [(doc_id, q._cliente.motor.leer(q._coleccion, doc_id)) for doc_id in ids]
+
+        cambios = []
+        for doc_id, datos in filas:
+            cumple = datos is not None and all(
+                _cumple(_valor(doc_id, datos, c), op, v) for c, op, v in q._filtros
+            )
+            snap = SnapshotLocal(DocumentoLocal(q._cliente, q._coleccion, doc_id), datos)
+            if cumple:
+                tipo = TipoCambio.MODIFIED if doc_id in self._docs else TipoCambio.ADDED
+                self._docs[doc_id] = snap
+                cambios.append(CambioLocal(tipo, snap))
+            elif doc_id in self._docs:
+                cambios.append(CambioLocal(TipoCambio.REMOVED, self._docs.pop(doc_id)))
+        return cambios
+
+
+def _resolver(datos):
+    # SERVER_TIMESTAMP -> hora actual; fechas siempre con zona UTC
+    return {
+        k: datetime.now(timezone.utc) if v is firestore.SERVER_TIMESTAMP else _normalizar(v)
+        for k, v in datos.items()
+    }
+
+
+def _normalizar(valor):
+    if isinstance(valor, float) and valor != valor:
+        return None
+    if isinstance(valor, datetime):
+        if valor.tzinfo is None:
+            return valor.replace(tzinfo=timezone.utc)
+        return valor.astimezone(timezone.utc)
+    if isinstance(valor, list):
+        return [_normalizar(v) for v in valor]
+    if isinstance(valor, dict):
+        return {k: _normalizar(v) for k, v in valor.items()}
+    return valor
+
+
+# =====================================================
+# MOTORES
+# =====================================================
+class Motor:
+    """
+    Almacén de documentos {colección: {id: datos}}.
+
+    - leer(coleccion, doc_id) -> datos o None
+    - consultar(coleccion, filtros, orden, limite, despues) -> [(id, datos)]
+      filtros: [(campo, op, valor)]; orden: [(campo, descendente)];
+      despues: valores del cursor en el mismo orden que `orden`
+    - agregar(coleccion, filtros, sumas) -> (n, [suma de cada campo])
+    - escribir(ops): [(tipo, coleccion, doc_id, datos)] de forma atómica,
+      tipo "set" | "merge" | "update" | "delete"
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    def agregar(self, coleccion, filtros, sumas):
+        filas = self.consultar(coleccion, filtros, [], None, None)
+        totales = [
+            sum(
+                d.get(campo) for _, d in filas
+                if isinstance(d.get(campo), (int, float)) and not isinstance(d.get(campo), bool)
+            )
+            for campo in sumas
+        ]
+        return len(filas), totales
+
+
+class MotorMemoria(Motor):
+    def __init__(self):
+        super().__init__()
+        self.colecciones = {}
+
+    def leer(self, coleccion, doc_id):
+        with self.lock:
+            datos = self.colecciones.get(coleccion, {}).get(doc_id)
+        return None if datos is None else dict(datos)
+
+    def consultar(self, coleccion, filtros, orden, limite, despues):
+        with self.lock:
+            docs = list(self.colecciones.get(coleccion, {}).items())
+        filas = [
+            (doc_id, datos) for doc_id, datos in docs
+            if all(_cumple(_valor(doc_id, datos, c), op, v) for c, op, v in filtros)
+            and all(_valor(doc_id, datos, c) is not _FALTA for c, _ in orden)
+        ]
+
+        # Orden estable por cada campo, del último al primero
+        for campo, descendente in reversed(orden):
+            filas.sort(key=lambda f: _clave_orden(_valor(f[0], f[1], campo)), reverse=descendente)
+
+        if despues is not None:
+            filas = [
+                f for f in filas
+                if _comparar_cursor([_valor(f[0], f[1], c) for c, _ in orden], despues, orden) > 0
+            ]
+        if limite is not None:
+            filas = filas[:limite]
+        return [(doc_id, dict(datos)) for doc_id, datos in filas]
+
+    def escribir(self, ops):
+        with self.lock:
+            # Se valida todo antes de aplicar nada
+            for tipo, coleccion, doc_id, _ in ops:
+                if tipo == "update" and doc_id not in self.colecciones.get(coleccion, {}):
+                    raise gcp_exceptions.NotFound(f"No existe {coleccion}/{doc_id}")
+            for tipo, coleccion, doc_id, datos in ops:
+                docs = self.colecciones.setdefault(coleccion, {})
+                if tipo == "delete":
+                    docs.pop(doc_id, None)
+                elif tipo == "set":
+                    docs[doc_id] = dict(datos)
+                else:
+                    docs[doc_id] = {**docs.get(doc_id, {}), **datos}
+
+
+class MotorSQLite(Motor):
+    """
+    Un documento por fila (colección, id, datos JSON), con índices sobre
+    Año y updated_at, que son los campos por los que consulta la app.
+    Las fechas se guardan como {"__fecha__": ISO en UTC}.
+    """
+
+    CAMPOS_INDEXADOS = ("Año", "updated_at")
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # Con ":memory:" cada conexión sería otra base: se comparte una
+        self._compartida = self._abrir() if self.path == ":memory:" else None
+        self._crear_tablas()
+
+    def _abrir(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        # Estadísticas para que el planificador elija los índices por campo
+        conn.execute("PRAGMA optimize=0x10002")
+        return conn
+
+    def _conexion(self):
+        if self._compartida is not None:
+            return self._compartida
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._abrir()
+        return conn
+
+    def _crear_tablas(self):
+        conn = self._conexion()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documentos ("
+                " coleccion TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " datos TEXT NOT NULL,"
+                " PRIMARY KEY (coleccion, id)) WITHOUT ROWID"
+            )
+            for i, campo in enumerate(self.CAMPOS_INDEXADOS):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_campo_{i} "
+                    f"ON documentos (coleccion, {_sql_orden(campo)})"
+                )
+
+    def leer(self, coleccion, doc_id):
+        filas = self._leer_sql(
+            "SELECT datos FROM documentos WHERE coleccion = ? AND id = ?",
+            (coleccion, doc_id)
+        )
+        return _decodificar(filas[0][0]) if filas else None
+
+    def consultar(self, coleccion, filtros, orden, limite, despues):
+        where, params = self._where(coleccion, filtros)
+
+        for campo, _ in orden:
+            if campo != ID_DOCUMENTO:
+                where.append(f"json_type(datos, {_sql_ruta(campo)}) IS NOT NULL")
+
+        if despues is not None:
+            # (a > x) OR (a = x AND b > y) OR ...
+            ramas = []
+            for i, (campo, descendente) in enumerate(orden):
+                partes = [f"{_sql_orden(c)} = ?" for c, _ in orden[:i]]
+                partes.append(f"{_sql_orden(campo)} {'<' if descendente else '>'} ?")
+                ramas.append("(" + " AND ".join(partes) + ")")
+                params += [_sql_valor(v) for v in despues[:i + 1]]
+            where.append("(" + " OR ".join(ramas) + ")")
+
+        sql = "SELECT id, datos FROM documentos WHERE " + " AND ".join(where)
+        if orden:
+            sql += " ORDER BY " + ", ".join(
+                f"{_sql_orden(c)}{' DESC' if d else ''}" for c, d in orden
+            )
+        if limite is not None:
+            sql += " LIMIT ?"
+            params.append(int(limite))
+
+        return [(doc_id, _decodificar(datos)) for doc_id, datos in self._leer_sql(sql, params)]
+
+    def agregar(self, coleccion, filtros, sumas):
+        where, params = self._where(coleccion, filtros)
+        columnas = ["COUNT(*)"] + [
+            f"TOTAL(CASE WHEN json_type(datos, {_sql_ruta(c)}) IN ('integer', 'real') "
+            f"THEN json_extract(datos, {_sql_ruta(c)}) END)"
+            for c in sumas
+        ]
+        sql = f"SELECT {', '.join(columnas)} FROM documentos WHERE " + " AND ".join(where)
+        fila = self._leer_sql(sql, params)[0]
+        return fila[0], list(fila[1:])
+
+    def _leer_sql(self, sql, params):
+        # Cada hilo lee con su conexión (WAL); la conexión compartida de
+        # ":memory:" se usa de uno en uno
+        if self._compartida is None:
+            return self._conexion().execute(sql, params).fetchall()
+        with self.lock:
+            return self._compartida.execute(sql, params).fetchall()
+
+    def _where(self, coleccion, filtros):
+        where, params = ["coleccion = ?"], [coleccion]
+        for campo, op, valor in filtros:
+            sql, valores = _sql_filtro(campo, op, valor)
+            where.append(sql)
+            params += valores
+        return where, params
+
+    def escribir(self, ops):
+        with self.lock:
+            conn = self._conexion()
+            with conn:
+                for tipo, coleccion, doc_id, datos in ops:
+                    if tipo == "delete":
+                        conn.execute(
+                            "DELETE FROM documentos WHERE coleccion = ? AND id = ?",
+                            (coleccion, doc_id)
+                        )
+                        continue
+
+                    if tipo in ("update", "merge"):
+                        fila = conn.execute(
+                            "SELECT datos FROM documentos WHERE coleccion = ? AND id = ?",
+                            (coleccion, doc_id)
+                        ).fetchone()
+                        if fila is None and tipo == "update":
+                            raise gcp_exceptions.NotFound(f"No existe {coleccion}/{doc_id}")
+                        datos = {**(_decodificar(fila[0]) if fila else {}), **datos}
+
+                    conn.execute(
+                        "INSERT OR REPLACE INTO documentos (coleccion, id, datos) "
+                        "VALUES (?, ?, ?)",
+                        (coleccion, doc_id, _codificar(datos))
+                    )
+
+
+# =====================================================
+# COMPARACIONES (MOTOR EN MEMORIA)
+# =====================================================
+_FALTA = object()
+
+# Orden de tipos de Firestore: null < bool < número < fecha < texto < resto
+def _clave_orden(valor):
+    if valor is None or valor is _FALTA:
+        return (0, 0)
+    if isinstance(valor, bool):
+        return (1, valor)
+    if isinstance(valor, (int, float)):
+        return (2, valor)
+    if isinstance(valor, datetime):
+        return (3, valor)
+    if isinstance(valor, str):
+        return (4, valor)
+    return (5, str(valor))
+
+
+def _valor(doc_id, datos, campo):
+    if campo == ID_DOCUMENTO:
+        return doc_id
+    return datos.get(campo, _FALTA)
+
+
+def _cumple(valor, op, esperado):
+    if valor is _FALTA:
+        return False
+    if op == "in":
+        return any(_cumple(valor, "==", e) for e in esperado)
+    if op == "not-in":
+        return not any(_cumple(valor, "==", e) for e in esperado)
+    if op == "array-contains":
+        return isinstance(valor, list) and esperado in valor
+
+    a, b = _clave_orden(valor), _clave_orden(esperado)
+    if op == "==":
+        return a == b
+    if op == "!=":
+        return a != b and valor is not None
+    # Los rangos solo comparan valores del mismo tipo
+    if a[0] != b[0]:
+        return False
+    return {
+        "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b,
+    }[op]
+
+
+def _comparar_cursor(valores, cursor, orden):
+    for valor, ref, (_, descendente) in zip(valores, cursor, orden):
+        a, b = _clave_orden(valor), _clave_orden(ref)
+        if a != b:
+            return (1 if a > b else -1) * (-1 if descendente else 1)
+    return 0
+
+
+# =====================================================
+# SQL Y JSON (MOTOR SQLITE)
+# =====================================================
+def _sql_ruta(campo):
+    nombre = campo.replace('"', '\\"').replace("'", "''")
+    return f"'$.\"{nombre}\"'"
+
+
+def _sql_ruta_fecha(campo):
+    return _sql_ruta(campo)[:-1] + ".__fecha__'"
+
+
+def _sql_orden(campo):
+    # Misma expresión en índices, filtros y ORDER BY para que SQLite use
+    # los índices; las fechas se comparan por su texto ISO
+    if campo == ID_DOCUMENTO:
+        return "id"
+    return (
+        f"COALESCE(json_extract(datos, {_sql_ruta_fecha(campo)}), "
+        f"json_extract(datos, {_sql_ruta(campo)}))"
+    )
+
+
+def _sql_valor(valor):
+    if isinstance(valor, datetime):
+        return _iso(valor)
+    if isinstance(valor, bool):
+        return int(valor)
+    return valor
+
+
+def _sql_filtro(campo, op, valor):
+    expr = _sql_orden(campo)
+    if op == "in":
+        return f"{expr} IN ({', '.join('?' * len(valor))})", [_sql_valor(v) for v in valor]
+    if op == "not-in":
+        return (
+            f"{expr} IS NOT NULL AND {expr} NOT IN ({', '.join('?' * len(valor))})",
+            [_sql_valor(v) for v in valor]
+        )
+    if op == "==" and valor is None:
+        return f"json_type(datos, {_sql_ruta(campo)}) = 'null'", []
+    if op == "!=":
+        return f"{expr} IS NOT NULL AND {expr} <> ?", [_sql_valor(valor)]
+    if op in ("==", "<", "<=", ">", ">="):
+        sql_op = "=" if op == "==" else op
+        return f"{expr} {sql_op} ?", [_sql_valor(valor)]
+    raise ValueError(f"Operador no soportado por el backend SQLite: {op}")
+
+
+def _iso(fecha):
+    return fecha.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _codificar(datos):
+    def por_defecto(valor):
+        if isinstance(valor, datetime):
+            return {"__fecha__": _iso(_normalizar(valor))}
+        raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+    return json.dumps(datos, default=por_defecto, ensure_ascii=False)
+
+
+def _decodificar(texto):
+    def fechas(obj):
+        if len(obj) == 1 and "__fecha__" in obj:
+            return datetime.fromisoformat(obj["__fecha__"])
+        return obj
+
+    return json.loads(texto, object_hook=fechas)
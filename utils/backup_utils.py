@@ -0,0 +1,169 @@
+# utils/backup_utils.py
+import hashlib
+import json
+import logging
+import tempfile
+import zipfile
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from utils.excel_utils import COLUMNAS_NO_EXPORTAR
+from utils.firestore_utils import COLLECTIONS, load_dataframes_firestore
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# BACKUP COMPRIMIDO (ZIP + NDJSON)
+# =====================================================
+# Un fichero NDJSON (una línea JSON por documento) por colección dentro de
+# un ZIP, más un manifest.json con filas, columnas, columnas de fecha y
+# sha256 de cada uno. Se escribe por bloques de filas a un fichero
+# temporal, así la memoria no crece mientras se comprime. El Excel de
+# crear_backup_en_memoria sigue disponible como formato alternativo, más
+# lento. restore_from_excel acepta los dos.
+FORMATO_VERSION = 1
+FILAS_POR_BLOQUE = 5000
+MANIFEST = "manifest.json"
+
+
+def datos_backup(data):
+    """
+    Solo las colecciones de `data`: get_shared_data también trae tablas
+    derivadas (líneas de producto, conteos, índice) que no se respaldan.
+    """
+    return {f"df_{key}": data.get(f"df_{key}") for key in COLLECTIONS}
+
+
+def leer_datos_backup():
+    """
+    Todas las colecciones completas, leídas de Firestore. La caché
+    compartida solo guarda algunos años de pedidos y gastos, y un backup
+    sin los demás los borraría al restaurarlo.
+    """
+    return datos_backup(load_dataframes_firestore())
+
+
+def crear_backup_zip(data, huella_anterior=None):
+    """
+    Genera el backup de `data` ({df_key: DataFrame}, ver datos_backup).
+
+    Devuelve (contenido, manifest) con los bytes del ZIP. La huella de los
+    datos se calcula antes de generar nada: si coincide con
+    `huella_anterior` no hay cambios y se devuelve (None, {"huella": ...})
+    sin escribir el ZIP.
+    """
+    frames = {
+        df_key: df.drop(columns=list(COLUMNAS_NO_EXPORTAR), errors="ignore")
+        for df_key, df in sorted(data.items())
+        if df is not None
+    }
+    huella = huella_datos(frames)
+    if huella_anterior and huella == huella_anterior:
+        return None, {"huella": huella}
+
+    fichero = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    manifest = {
+        "formato": FORMATO_VERSION,
+        "creado": datetime.now(timezone.utc).isoformat(),
+        "huella": huella,
+        "colecciones": {},
+    }
+
+    with fichero:
+        with zipfile.ZipFile(fichero, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for df_key, df in frames.items():
+                nombre = f"{df_key.removeprefix('df_')}.ndjson"
+                sha = hashlib.sha256()
+
+                with zf.open(nombre, "w") as out:
+                    for inicio in range(0, len(df), FILAS_POR_BLOQUE):
+                        bloque = _bloque_ndjson(df.iloc[inicio:inicio + FILAS_POR_BLOQUE])
+                        sha.update(bloque)
+                        out.write(bloque)
+
+                manifest["colecciones"][nombre] = {
+                    "filas": len(df),
+                    "columnas": [str(c) for c in df.columns],
+                    # En NDJSON las fechas son texto ISO: al restaurar se
+                    # vuelven a convertir estas columnas
+                    "fechas": [
+                        str(c) for c in df.columns
+                        if pd.api.types.is_datetime64_any_dtype(df[c])
+                    ],
+                    "sha256": sha.hexdigest(),
+                }
+
+            zf.writestr(MANIFEST, json.dumps(manifest, indent=2, ensure_ascii=False))
+
+        # st.download_button solo acepta bytes, texto o BytesIO
+        fichero.seek(0)
+        contenido = fichero.read()
+
+    logger.info(
+        f"Backup ZIP: {sum(c['filas'] for c in manifest['colecciones'].values())} "
+        f"filas, huella {huella[:12]}"
+    )
+    return contenido, manifest
+
+
+def huella_datos(frames):
+    """
+    Huella del contenido de `frames` ({df_key: DataFrame}): hash por filas
+    de pandas, mucho más barato que generar el ZIP. No depende de la fecha.
+    """
+    sha = hashlib.sha256()
+    for df_key, df in sorted(frames.items()):
+        sha.update(f"{df_key}:{[str(c) for c in df.columns]}".encode())
+        try:
+            filas = pd.util.hash_pandas_object(df, index=False)
+        except TypeError:
+            # Valores no hashables (listas, mapas): se comparan como texto
+            filas = pd.util.hash_pandas_object(df.astype(str), index=False)
+        sha.update(filas.to_numpy().tobytes())
+    return sha.hexdigest()
+
+
+def leer_backup_zip(zf, nombre):
+    """
+    DataFrame de la colección `nombre` (sin ".ndjson") del ZIP abierto
+    `zf`, con las columnas de fecha convertidas; None si no está.
+    """
+    manifest = json.loads(zf.read(MANIFEST))
+    info = manifest["colecciones"].get(f"{nombre}.ndjson")
+    if info is None:
+        return None
+    if not info["filas"]:
+        return pd.DataFrame(columns=info["columnas"])
+
+    with zf.open(f"{nombre}.ndjson") as f:
+        df = pd.read_json(f, lines=True, dtype=False, convert_dates=False)
+    for col in info.get("fechas", []):
+        df[col] = pd.to_datetime(df[col], errors="coerce", utc=True).dt.tz_convert(None)
+    return df.reindex(columns=info["columnas"])
+
+
+def verificar_backup_zip(fichero):
+    """Comprueba los sha256 del manifest. Devuelve (ok, mensaje)."""
+    with zipfile.ZipFile(fichero) as zf:
+        manifest = json.loads(zf.read(MANIFEST))
+        for nombre, info in manifest["colecciones"].items():
+            sha = hashlib.sha256()
+            with zf.open(nombre) as f:
+                for trozo in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(trozo)
+            if sha.hexdigest() != info["sha256"]:
+                return False, f"Checksum incorrecto en {nombre}"
+    return True, "OK"
+
+
+def _bloque_ndjson(df):
+    if df.empty:
+        return b""
+    texto = df.to_json(
+        orient="records", lines=True, date_format="iso",
+        date_unit="s", force_ascii=False, default_handler=str
+    )
+    if not texto.endswith("\n"):
+        texto += "\n"
+    return texto.encode("utf-8")
@@ -0,0 +1,87 @@
+# utils/estados.py
+import numpy as np
+import pandas as pd
+
+# =====================================================
+# CÓDIGO DE ESTADO DEL PEDIDO
+# =====================================================
+# Los cinco checks de estado se guardan además como un único entero de
+# 5 bits en la columna "Estado". Filtrar una vista es entonces un isin()
+# sobre esa columna, y los KPIs salen de una tabla de conteos por
+# (Año, Estado) que se mantiene al crear/modificar/borrar.
+COLUMNA_ESTADO = "Estado"
+
+INICIO = 1
+TERMINADO = 2
+PENDIENTE = 4
+COBRADO = 8
+RETIRADO = 16
+
+BITS = {
+    "Inicio Trabajo": INICIO,
+    "Trabajo Terminado": TERMINADO,
+    "Pendiente": PENDIENTE,
+    "Cobrado": COBRADO,
+    "Retirado": RETIRADO,
+}
+
+TODOS_LOS_CODIGOS = range(32)
+
+
+def _codigos(condicion):
+    return frozenset(c for c in TODOS_LOS_CODIGOS if condicion(c))
+
+
+# Códigos de estado que entran en cada vista de resumen_page
+VISTAS = {
+    "Todos los pedidos": _codigos(lambda c: True),
+    "Nuevos pedidos": _codigos(lambda c: c == 0),
+    "Trabajos empezados": _codigos(lambda c: c & INICIO and not c & TERMINADO),
+    "Pedidos pendientes": _codigos(lambda c: c & PENDIENTE),
+    "Trabajos terminados": _codigos(
+        lambda c: c & TERMINADO and (c & (COBRADO | RETIRADO)) != COBRADO | RETIRADO
+    ),
+    "Trabajos completados": _codigos(
+        lambda c: (c & (TERMINADO | COBRADO | RETIRADO)) == TERMINADO | COBRADO | RETIRADO
+    ),
+    "Empezados": _codigos(lambda c: c & INICIO),
+}
+
+
+def codigo_estado(df):
+    """Columna uint8 con el código de estado de cada fila de `df`."""
+    codigo = np.zeros(len(df), dtype=np.uint8)
+    for col, bit in BITS.items():
+        if col in df.columns:
+            codigo |= np.where(df[col].to_numpy(dtype=bool), bit, 0).astype(np.uint8)
+    return pd.Series(codigo, index=df.index, name=COLUMNA_ESTADO)
+
+
+def contar_estados(df):
+    """Conteo de pedidos por (Año, Estado)."""
+    if df is None or df.empty:
+        return pd.Series(
+            dtype="int64",
+            index=pd.MultiIndex.from_arrays([[], []], names=["Año", COLUMNA_ESTADO])
+        )
+    return df.groupby(["Año", COLUMNA_ESTADO]).size()
+
+
+def actualizar_conteos(conteos, filas_antes, filas_despues):
+    """
+    Ajusta `conteos` restando las filas que cambian tal como estaban y
+    sumándolas como quedan (creadas, modificadas o borradas).
+    """
+    delta = contar_estados(filas_despues).sub(
+        contar_estados(filas_antes), fill_value=0
+    )
+    conteos = conteos.add(delta, fill_value=0).astype("int64")
+    return conteos[conteos != 0]
+
+
+def contar_vista(conteos, año, vista):
+    """Pedidos de `año` en `vista` a partir de la tabla de conteos."""
+    if conteos is None or año not in conteos.index.get_level_values("Año"):
+        return 0
+    por_estado = conteos.loc[año]
+    return int(por_estado[por_estado.index.isin(VISTAS[vista])].sum())
@@ -1,7 +1,18 @@
 # utils/excel_utils.py
 import pandas as pd
+import streamlit as st
 from datetime import datetime
 from io import BytesIO
+from openpyxl import Workbook
+
+from utils.firestore_utils import UPDATED_AT_FIELD
+from utils.estados import COLUMNA_ESTADO
+from utils.perfilado import tramo
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Columnas de uso interno que no se exportan
+COLUMNAS_NO_EXPORTAR = (UPDATED_AT_FIELD, COLUMNA_ESTADO)
 
 # =====================================================
 # GENERAR BACKUP EN MEMORIA (STREAMLIT CLOUD)
@@ -10,8 +21,6 @@ def crear_backup_en_memoria(data: dict):
     """
     Crea un archivo Excel en memoria y lo devuelve como bytes.
     """
-    buffer = BytesIO()
-
     SHEET_NAMES = {
         "df_pedidos": "pedidos",
         "df_gastos": "gastos",
@@ -20,21 +29,76 @@ def crear_backup_en_memoria(data: dict):
         # "df_trabajos": "trabajos",
     }
 
-    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-        for key, sheet_name in SHEET_NAMES.items():
-            df = data.get(key)
+    # Libro en modo write_only: cada hoja se escribe fila a fila
+    wb = Workbook(write_only=True)
+    for key, sheet_name in SHEET_NAMES.items():
+        df = data.get(key)
+        if df is None:
+            df = pd.DataFrame()
+        _escribir_hoja(wb, df, sheet_name)
 
-            if df is None or df.empty:
-                df = pd.DataFrame()
-            else:
-                df = df.copy()
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
 
-                # Eliminar timezone si existe
-                for col in df.columns:
-                    if pd.api.types.is_datetime64_any_dtype(df[col]):
-                        df[col] = df[col].dt.tz_localize(None)
 
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+# =====================================================
+# EXPORTAR UN DATAFRAME A EXCEL (BAJO DEMANDA)
+# =====================================================
+def df_a_excel(df, sheet_name="Datos"):
+    """
+    Excel de una sola hoja con `df`, escrito fila a fila con openpyxl en
+    modo write_only (memoria constante, sin construir el libro entero).
+    """
+    wb = Workbook(write_only=True)
+    _escribir_hoja(wb, df, sheet_name)
 
-    buffer.seek(0)
-    return buffer
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def excel_cacheado(clave, _df, sheet_name="Datos"):
+    """
+    df_a_excel cacheado por `clave` (p. ej. versión de los datos, año y
+    vista). `_df` no entra en la clave: quien llama garantiza que la misma
+    clave implica los mismos datos.
+    """
+    with tramo("exportar"):
+        return df_a_excel(_df, sheet_name)
+
+
+def _escribir_hoja(wb, df, sheet_name):
+    df = df.drop(columns=list(COLUMNAS_NO_EXPORTAR), errors="ignore")
+
+    ws = wb.create_sheet(title=sheet_name)
+    ws.append([str(c) for c in df.columns])
+
+    columnas = [_valores_excel(df[col]) for col in df.columns]
+    for fila in zip(*columnas):
+        ws.append(fila)
+
+
+def _valores_excel(serie):
+    # Convierte una columna entera a valores que openpyxl sabe escribir
+    if isinstance(serie.dtype, pd.DatetimeTZDtype):
+        serie = serie.dt.tz_convert(None)
+
+    valores = serie.astype(object).where(serie.notna(), None)
+
+    if serie.dtype == object:
+        valores = valores.map(_valor_objeto)
+
+    return valores.tolist()
+
+
+def _valor_objeto(v):
+    if isinstance(v, pd.Timestamp):
+        return v.tz_convert(None).to_pydatetime() if v.tzinfo else v.to_pydatetime()
+    if isinstance(v, datetime):
+        return v.replace(tzinfo=None) if v.tzinfo else v
+    if isinstance(v, (list, dict)):
+        return str(v)
+    return v
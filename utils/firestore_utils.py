@@ -2,8 +2,26 @@ import pandas as pd
 import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
-from datetime import datetime, date
+from google.cloud import firestore as gcloud_firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core import exceptions as gcp_exceptions
+from datetime import datetime, date, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import functools
+import itertools
 import logging
+import os
+import threading
+import time
+
+from utils.almacenamiento import BACKEND, crear_cliente_local, transaccional
+from utils.snapshot_utils import cargar_snapshot, guardar_snapshot, borrar_snapshot
+from utils.productos_utils import construir_lineas_productos, actualizar_lineas_productos
+from utils.schemas import aplicar_esquema
+from utils.estados import COLUMNA_ESTADO, codigo_estado, contar_estados, actualizar_conteos
+from utils.indice_pedidos import INDICE_KEY, IndicePedidos
+from utils.metricas import medir, propagar, lecturas_agregacion
 
 logger = logging.getLogger(__name__)
 
@@ -16,65 +34,965 @@ COLLECTIONS = {
     "posibles_clientes": "posibles_clientes",
 }
 
+# Marca de modificación que se escribe en cada documento y permite
+# sincronizar solo lo que ha cambiado desde la última carga.
+UPDATED_AT_FIELD = "updated_at"
+
+# Los documentos borrados no se pueden consultar, así que cada borrado deja
+# una "lápida" en esta colección para que la sincronización incremental
+# pueda quitarlos también de los DataFrames en memoria.
+TOMBSTONES_COLLECTION = "_borrados"
+
+# Tabla derivada de df_pedidos con una fila por línea de producto
+LINEAS_KEY = "df_lineas_productos"
+
+# Conteo de pedidos por (Año, Estado), ver utils/estados.py
+CONTEOS_KEY = "df_conteos_estado"
+
+# Columnas que solo existen en memoria y nunca se escriben en Firestore
+_COLUMNAS_INTERNAS = ("id_documento_firestore", UPDATED_AT_FIELD, COLUMNA_ESTADO)
+
+# Un documento por colección y año con el último ID asignado
+COUNTERS_COLLECTION = "_contadores"
+
+# Firestore no admite más de 500 escrituras por batch
+BATCH_LIMIT = 500
+BATCH_WORKERS = 4
+BATCH_REINTENTOS = 5
+
+# Errores transitorios en los que tiene sentido reintentar un batch
+_ERRORES_TRANSITORIOS = (
+    gcp_exceptions.Aborted,
+    gcp_exceptions.DeadlineExceeded,
+    gcp_exceptions.InternalServerError,
+    gcp_exceptions.ResourceExhausted,
+    gcp_exceptions.ServiceUnavailable,
+)
+
+# Colecciones que se consultan por año: en memoria solo se tienen los años
+# que se están usando (el actual y el anterior al arrancar) y el resto se
+# pide a Firestore cuando una página lo selecciona.
+COLECCIONES_POR_AÑO = ("pedidos", "gastos")
+AÑOS_INICIALES = 2
+MAX_AÑOS_EN_MEMORIA = 3
+
+# Documentos por página en las consultas paginadas
+PAGE_SIZE = 500
+
+# Segundos que vale un resultado de agregar_firestore si no cambia la versión
+AGREGADOS_TTL = 600
+
+# Solape al pedir cambios: absorbe desfases de reloj entre la app y el
+# servidor. Aplicar dos veces el mismo cambio no tiene efecto.
+SYNC_OVERLAP = timedelta(minutes=2)
+
+# Colecciones cuyos cambios llegan solos a la caché con on_snapshot (ver
+# ESCUCHAS EN TIEMPO REAL). Con IMPERYO_TIEMPO_REAL=0 no se escucha nada y
+# los cambios de otros usuarios llegan con la sincronización al cargar.
+COLECCIONES_EN_TIEMPO_REAL = ("pedidos", "gastos", "posibles_clientes")
+TIEMPO_REAL = os.environ.get("IMPERYO_TIEMPO_REAL", "1") != "0"
+
 # =====================================
 # CLIENTE FIRESTORE
 # =====================================
+@st.cache_resource
 def get_firestore_client():
-    if "firestore_client" not in st.session_state:
+    # Un único cliente por proceso, compartido por todas las sesiones.
+    # IMPERYO_BACKEND elige otro almacenamiento (ver utils/almacenamiento.py)
+    # y con FIRESTORE_EMULATOR_HOST definido se usa el emulador local, sin
+    # credenciales (para pruebas).
+    if BACKEND != "firestore":
+        return crear_cliente_local(BACKEND)
+    if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        return gcloud_firestore.Client(
+            project=os.environ.get("GCLOUD_PROJECT", "demo-imperyo")
+        )
+    if not firebase_admin._apps:
         cred = credentials.Certificate(dict(st.secrets["firestore"]))
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app(cred)
-        st.session_state.firestore_client = firestore.client()
-    return st.session_state.firestore_client
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
 
 
 # =====================================
 # CARGA DE DATAFRAMES
 # =====================================
-def load_dataframes_firestore():
+def load_dataframes_firestore(progreso=None, colecciones=None, años=None):
+    """
+    Carga las colecciones pedidas (todas si `colecciones` es None) a la
+    vez, una por hilo. `años` ({collection_key: [años]}) limita esas
+    colecciones a los años indicados.
+
+    `progreso(coleccion, hechas, total)` se llama desde el hilo que
+    invoca la función (no desde los hilos de carga), así que puede
+    usar Streamlit sin problemas.
+    """
     db = get_firestore_client()
     data = {}
+    keys = list(COLLECTIONS) if colecciones is None else list(colecciones)
+    if not keys:
+        return data
+
+    def cargar(key):
+        if años and key in años:
+            return consultar_firestore(key, años[key])
+        with medir("stream", COLLECTIONS[key]) as llamada:
+            filas = [_doc_to_row(doc) for doc in db.collection(COLLECTIONS[key]).stream()]
+            llamada["leidos"] = max(1, len(filas))
+        return pd.DataFrame(filas)
+
+    with ThreadPoolExecutor(max_workers=len(keys)) as pool:
+        futures = {
+            pool.submit(propagar(cargar), key): key
+            for key in keys
+        }
+        for hechas, future in enumerate(as_completed(futures), start=1):
+            key = futures[future]
+            data[f"df_{key}"] = future.result()
+            if progreso:
+                progreso(COLLECTIONS[key], hechas, len(keys))
+
+    # Mismo orden de claves que se pidieron
+    return {f"df_{key}": data[f"df_{key}"] for key in keys}
+
+
+# =====================================
+# CONSULTAS POR AÑO (PAGINADAS)
+# =====================================
+def paginas_firestore(collection_key, años=None, filtros=None, tamaño_pagina=PAGE_SIZE):
+    """
+    Documentos de `collection_key` por páginas de `tamaño_pagina` filas.
+
+    El filtro por año (`años`: un año o una lista) y los de `filtros`
+    ({campo: valor}, p. ej. {"Cobrado": False}) se resuelven en Firestore,
+    así solo se leen y se pagan los documentos que cumplen. Cada página
+    sigue a la anterior con un cursor sobre el ID del documento.
+    """
+    query = (
+        _query_firestore(collection_key, años, filtros)
+        .order_by(FieldPath.document_id())
+        .limit(tamaño_pagina)
+    )
+
+    ultimo = None
+    while True:
+        pagina = query if ultimo is None else query.start_after(ultimo)
+        with medir("pagina", COLLECTIONS[collection_key]) as llamada:
+            docs = list(pagina.stream())
+            llamada["leidos"] = max(1, len(docs))
+        if docs:
+            yield [_doc_to_row(doc) for doc in docs]
+        if len(docs) < tamaño_pagina:
+            return
+        ultimo = docs[-1]
+
+
+def consultar_firestore(collection_key, años=None, filtros=None):
+    """DataFrame con todas las páginas de paginas_firestore."""
+    return pd.DataFrame([
+        fila
+        for pagina in paginas_firestore(collection_key, años, filtros)
+        for fila in pagina
+    ])
+
+
+def _query_firestore(collection_key, años=None, filtros=None):
+    db = get_firestore_client()
+    query = db.collection(COLLECTIONS[collection_key])
+
+    if años is not None:
+        if isinstance(años, (list, tuple, set)):
+            query = query.where(filter=FieldFilter("Año", "in", sorted(int(a) for a in años)))
+        else:
+            query = query.where(filter=FieldFilter("Año", "==", int(años)))
+    for campo, valor in (filtros or {}).items():
+        query = query.where(filter=FieldFilter(campo, "==", valor))
+
+    return query
+
+
+# =====================================
+# AGREGACIONES (COUNT / SUM EN FIRESTORE)
+# =====================================
+def agregar_firestore(collection_key, años=None, filtros=None, sumas=()):
+    """
+    Número de documentos y sumas de los campos `sumas` de `collection_key`
+    (con los mismos filtros que paginas_firestore), calculados por
+    Firestore con count()/sum(): no se descarga ningún documento.
+
+    Devuelve {"n": número, campo: suma, ...}. El resultado se cachea por
+    versión de la colección en la caché compartida, así que se vuelve a
+    pedir solo cuando cambian los datos (o, para años que no están en
+    memoria, como mucho cada AGREGADOS_TTL segundos).
+    """
+    if isinstance(años, (list, tuple, set)):
+        años = tuple(sorted(int(a) for a in años))
+    elif años is not None:
+        años = int(años)
+
+    return _agregado_cacheado(
+        collection_key,
+        años,
+        tuple(sorted((filtros or {}).items())),
+        tuple(sumas),
+        shared_data_versions().get(f"df_{collection_key}"),
+    )
+
+
+@st.cache_data(ttl=AGREGADOS_TTL, max_entries=256, show_spinner=False)
+def _agregado_cacheado(collection_key, años, filtros, sumas, version):
+    # `version` solo forma parte de la clave de la caché
+    agregacion = _query_firestore(
+        collection_key, list(años) if isinstance(años, tuple) else años, dict(filtros)
+    ).count(alias="n")
+    for i, campo in enumerate(sumas):
+        agregacion = agregacion.sum(campo, alias=f"suma_{i}")
+
+    with medir("agregar", COLLECTIONS[collection_key]) as llamada:
+        valores = {
+            r.alias: r.value
+            for resultados in agregacion.get()
+            for r in resultados
+        }
+        llamada["leidos"] = lecturas_agregacion(valores.get("n") or 0)
+    return {
+        "n": int(valores.get("n") or 0),
+        **{campo: float(valores.get(f"suma_{i}") or 0) for i, campo in enumerate(sumas)},
+    }
+
+
+def _rango_años_firestore(collection_key):
+    # Primer y último año con documentos: dos lecturas de un documento
+    db = get_firestore_client()
+    query = db.collection(COLLECTIONS[collection_key]).where(
+        filter=FieldFilter("Año", ">", 0)
+    )
+
+    extremos = []
+    for direccion in (firestore.Query.ASCENDING, firestore.Query.DESCENDING):
+        with medir("consulta", COLLECTIONS[collection_key], leidos=1):
+            docs = list(query.order_by("Año", direction=direccion).limit(1).stream())
+        if not docs:
+            return None
+        extremos.append(_año_fila(docs[0].to_dict()))
+    return tuple(extremos)
+
+
+def _años_iniciales():
+    actual = datetime.now().year
+    return [actual - i for i in range(AÑOS_INICIALES)]
+
+
+def _año_fila(fila):
+    # Mismo criterio que el esquema: sin año válido cuenta como el actual
+    try:
+        return int(float(fila.get("Año")))
+    except (TypeError, ValueError):
+        return datetime.now().year
+
+
+def _separar_por_año(filas, años):
+    # (filas de `años`, ids del resto): las de otros años no se guardan en
+    # memoria y, si estaban (p. ej. les han cambiado el año), se quitan
+    dentro, fuera = [], set()
+    for fila in filas:
+        if _año_fila(fila) in años:
+            dentro.append(fila)
+        else:
+            fuera.add(fila["id_documento_firestore"])
+    return dentro, fuera
+
+
+def nueva_marca_sync():
+    """
+    Instante a partir del cual habrá que pedir cambios en la próxima
+    sincronización. Se toma ANTES de leer para no perder escrituras
+    que ocurran durante la carga.
+    """
+    return datetime.now(timezone.utc)
+
+
+# =====================================
+# SINCRONIZACIÓN INCREMENTAL
+# =====================================
+def sync_dataframes_firestore(data, desde, ids_tocados=None, años=None):
+    """
+    Actualiza `data` solo con los documentos creados, modificados o
+    borrados desde `desde` (marca devuelta por la carga anterior).
+    Solo se sincronizan las colecciones que ya están en `data`. Si se
+    pasa `ids_tocados` (dict), se rellena con {df_key: ids cambiados}.
+    `años` ({df_key: años en memoria}) descarta los cambios de otros años.
+
+    Devuelve (data, nueva_marca).
+    """
+    db = get_firestore_client()
+    nueva_marca = nueva_marca_sync()
+    desde = desde - SYNC_OVERLAP
+
+    borrados = {}
+    tombstones = db.collection(TOMBSTONES_COLLECTION).where(
+        filter=FieldFilter(UPDATED_AT_FIELD, ">=", desde)
+    )
+    with medir("sync", TOMBSTONES_COLLECTION) as llamada:
+        lapidas = [doc.to_dict() for doc in tombstones.stream()]
+        llamada["leidos"] = max(1, len(lapidas))
+    for t in lapidas:
+        borrados.setdefault(t.get("coleccion"), set()).add(t.get("doc_id"))
 
     for key, collection in COLLECTIONS.items():
-        rows = []
-        for doc in db.collection(collection).stream():
-            r = doc.to_dict()
-            r["id_documento_firestore"] = doc.id
-            rows.append(r)
-        data[f"df_{key}"] = pd.DataFrame(rows)
+        df_key = f"df_{key}"
+        if df_key not in data:
+            continue
+
+        query = db.collection(collection).where(
+            filter=FieldFilter(UPDATED_AT_FIELD, ">=", desde)
+        )
+        with medir("sync", collection) as llamada:
+            cambios = [_doc_to_row(doc) for doc in query.stream()]
+            llamada["leidos"] = max(1, len(cambios))
+        quitar = borrados.get(collection, set())
+        if años and df_key in años:
+            cambios, fuera = _separar_por_año(cambios, años[df_key])
+            quitar = quitar | fuera
+
+        data[df_key] = _aplicar_cambios(data.get(df_key), cambios, quitar)
+        if ids_tocados is not None:
+            ids_tocados[df_key] = (
+                {c["id_documento_firestore"] for c in cambios} | quitar
+            )
+
+        if cambios or borrados.get(collection):
+            logger.info(
+                f"Sync '{collection}': {len(cambios)} cambios, "
+                f"{len(borrados.get(collection, ()))} borrados"
+            )
+
+    return data, nueva_marca
+
+
+def _aplicar_cambios(df, cambios, borrados):
+    if df is None:
+        df = pd.DataFrame()
+
+    ids_cambiados = {c["id_documento_firestore"] for c in cambios}
+    # Si un documento aparece en ambos, existe ahora: gana el cambio
+    borrados = set(borrados) - ids_cambiados
+
+    if not ids_cambiados and not borrados:
+        return df
+
+    if not df.empty and "id_documento_firestore" in df.columns:
+        df = df[~df["id_documento_firestore"].isin(ids_cambiados | borrados)]
+
+    if cambios:
+        df = pd.concat([df, pd.DataFrame(cambios)], ignore_index=True)
+
+    return df.reset_index(drop=True)
+
+
+# =====================================
+# CACHÉ COMPARTIDA ENTRE SESIONES
+# =====================================
+class _SharedCache:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.versions = {}
+        self.marca = None
+        # {df_key: años en memoria} de COLECCIONES_POR_AÑO, el último usado
+        # al final; y {collection_key: (primer, último año)} en Firestore
+        self.años = {}
+        self.rango_años = {}
+        # {colección: escucha on_snapshot}; `generacion` cambia al invalidar
+        # para que los avisos de escuchas ya cerradas no toquen nada
+        self.escuchas = {}
+        self.generacion = 0
+        # Contador global: las versiones nunca se repiten, ni tras invalidar
+        self._contador = itertools.count(1)
+
+    def publicar(self, df_key, df, ids=None):
+        # `ids`: documentos que han cambiado, si se conocen; permite
+        # actualizar las tablas derivadas sin rehacerlas enteras
+        df = aplicar_esquema(df_key.removeprefix("df_"), df)
+        if df_key == "df_pedidos":
+            df = self._derivadas_pedidos(df, ids)
+        self._guardar(df_key, df)
+
+    def _derivadas_pedidos(self, df, ids):
+        df[COLUMNA_ESTADO] = codigo_estado(df)
+        # Las posiciones cambian con cada parche: el índice se rehace entero
+        self._guardar(INDICE_KEY, IndicePedidos(df))
+
+        antes = self.data.get("df_pedidos")
+        lineas = self.data.get(LINEAS_KEY)
+        conteos = self.data.get(CONTEOS_KEY)
+
+        if ids is None or antes is None or lineas is None or conteos is None:
+            self._guardar(LINEAS_KEY, construir_lineas_productos(df))
+            self._guardar(CONTEOS_KEY, contar_estados(df))
+            return df
+
+        self._guardar(LINEAS_KEY, actualizar_lineas_productos(lineas, df, ids))
+        self._guardar(CONTEOS_KEY, actualizar_conteos(
+            conteos,
+            antes[antes["id_documento_firestore"].isin(ids)],
+            df[df["id_documento_firestore"].isin(ids)]
+        ))
+        return df
+
+    def _guardar(self, df_key, df):
+        self.data[df_key] = df
+        self.versions[df_key] = next(self._contador)
+
+
+@st.cache_resource
+def _get_shared_cache():
+    return _SharedCache()
+
+
+def get_shared_data(colecciones=None, sincronizar=True, progreso=None):
+    """
+    DataFrames compartidos por todas las sesiones del proceso.
+
+    Cada colección se carga la primera vez que alguien la pide
+    (`colecciones`, todas si es None), desde la copia local si existe más
+    los cambios posteriores, o completa desde Firestore si no. De las
+    COLECCIONES_POR_AÑO solo se cargan los años iniciales; los demás,
+    con cargar_año. Las ya cargadas, si `sincronizar`, solo traen lo
+    cambiado desde la última sincronización. `progreso` se pasa a
+    load_dataframes_firestore.
+
+    Devuelve (data, versiones) con todas las colecciones en caché. `data`
+    es un dict nuevo en cada llamada pero los DataFrames son los de la
+    caché: no modificarlos in situ.
+    """
+    cache = _get_shared_cache()
+    keys = list(COLLECTIONS) if colecciones is None else list(colecciones)
+
+    with cache.lock:
+        nuevos = {}
+        ids_tocados = {}
+        if cache.marca is None:
+            marca = nueva_marca_sync()
+        elif sincronizar and cache.data:
+            # Las colecciones con escucha ya están al día
+            escuchadas = _escuchas_activas(cache)
+            claves = [k for k in _claves_sincronizables(cache.data) if k not in escuchadas]
+            if claves:
+                nuevos, marca = sync_dataframes_firestore(
+                    {k: cache.data[k] for k in claves},
+                    cache.marca,
+                    ids_tocados,
+                    {k: set(v) for k, v in cache.años.items()}
+                )
+            else:
+                marca = cache.marca
+        else:
+            marca = cache.marca
+
+        faltan = []
+        años_faltan = {}
+        for key in keys:
+            df_key = f"df_{key}"
+            if df_key in cache.data:
+                continue
+            snapshot = cargar_snapshot(df_key)
+            if snapshot is None:
+                faltan.append(key)
+                if key in COLECCIONES_POR_AÑO:
+                    años_faltan[key] = _años_iniciales()
+                    cache.años[df_key] = list(reversed(años_faltan[key]))
+                continue
+            df, marca_snapshot = snapshot
+            años = None
+            if key in COLECCIONES_POR_AÑO:
+                años = {df_key: set(df["Año"].unique().tolist()) if not df.empty else set()}
+            sincronizado, _ = sync_dataframes_firestore(
+                {df_key: df}, marca_snapshot, años=años
+            )
+            df = sincronizado[df_key]
+            if años:
+                # La copia local puede no tener todavía los años iniciales
+                # (p. ej. al cambiar de año)
+                pendientes = [a for a in _años_iniciales() if a not in años[df_key]]
+                if pendientes:
+                    df = pd.concat(
+                        [df, consultar_firestore(key, pendientes)], ignore_index=True
+                    )
+                cache.años[df_key] = sorted(años[df_key] | set(pendientes))
+            nuevos[df_key] = df
+
+        nuevos.update(load_dataframes_firestore(progreso, faltan, años_faltan))
+
+        cambiados = {}
+        for df_key, df in nuevos.items():
+            if df is not cache.data.get(df_key):
+                cache.publicar(df_key, df, ids_tocados.get(df_key))
+                cambiados[df_key] = cache.data[df_key]
+        cache.marca = marca
+
+        guardar_snapshot(cambiados, marca)
+        _iniciar_escuchas(cache)
+
+        return dict(cache.data), dict(cache.versions)
+
+
+def cargar_año(collection_key, año):
+    """
+    Se asegura de que `año` de `collection_key` esté en la caché
+    compartida, pidiéndolo a Firestore si no está. Con más de
+    MAX_AÑOS_EN_MEMORIA años se descartan los usados hace más tiempo
+    (nunca el actual).
+
+    Devuelve True si la caché ha cambiado: la página debe hacer rerun
+    para recibir los datos nuevos.
+    """
+    df_key = f"df_{collection_key}"
+    cache = _get_shared_cache()
+
+    with cache.lock:
+        cargados = cache.años.get(df_key)
+        if cargados is None or df_key not in cache.data:
+            return False
+
+        año = int(año)
+        if año in cargados:
+            cargados.remove(año)
+            cargados.append(año)
+            return False
+
+        nuevo = consultar_firestore(collection_key, año)
+        cargados.append(año)
+        actual = datetime.now().year
+        conservar = [a for a in cargados if a != actual][-(MAX_AÑOS_EN_MEMORIA - 1):]
+        if actual in cargados:
+            conservar.insert(0, actual)
+        cache.años[df_key] = conservar
+
+        df = cache.data[df_key]
+        df = df[df["Año"].isin(conservar)]
+        if not nuevo.empty:
+            df = pd.concat([df, nuevo], ignore_index=True)
+        cache.publicar(df_key, df.reset_index(drop=True))
+
+        guardar_snapshot({df_key: cache.data[df_key]}, cache.marca)
+        logger.info(f"Año {año} de '{collection_key}': {len(nuevo)} documentos")
+        return True
+
+
+def año_en_memoria(collection_key, año):
+    """
+    True si la caché compartida tiene todos los documentos de `año` de
+    `collection_key`: la página puede calcular sobre su DataFrame sin
+    pedir nada a Firestore.
+    """
+    df_key = f"df_{collection_key}"
+    cache = _get_shared_cache()
+    with cache.lock:
+        if df_key not in cache.data:
+            return False
+        cargados = cache.años.get(df_key)
+        # Sin lista de años la colección está entera en memoria
+        return cargados is None or int(año) in cargados
+
+
+def años_disponibles(collection_key):
+    """
+    Años de `collection_key` para los selectores, de más reciente a más
+    antiguo, sin descargar los documentos: el rango sale de dos lecturas
+    a Firestore que se guardan en la caché compartida.
+    """
+    cache = _get_shared_cache()
+    with cache.lock:
+        if collection_key not in cache.rango_años:
+            cache.rango_años[collection_key] = _rango_años_firestore(collection_key)
+        rango = cache.rango_años[collection_key]
+        años = set(cache.años.get(f"df_{collection_key}", ()))
+
+    if rango:
+        años |= set(range(rango[0], rango[1] + 1))
+    años.add(datetime.now().year)
+    return sorted(años, reverse=True)
+
+
+def _claves_sincronizables(data):
+    # Solo las colecciones de Firestore, no las tablas derivadas
+    return [f"df_{k}" for k in COLLECTIONS if f"df_{k}" in data]
+
+
+def shared_data_versions():
+    """Versiones actuales de la caché, para detectar si una sesión está desfasada."""
+    cache = _get_shared_cache()
+    with cache.lock:
+        return dict(cache.versions)
+
+
+def invalidate_shared_data():
+    """
+    Vacía la caché compartida y la copia local: la siguiente lectura hará
+    carga completa desde Firestore.
+    """
+    cache = _get_shared_cache()
+    with cache.lock:
+        escuchas = list(cache.escuchas.values())
+        cache.escuchas = {}
+        cache.generacion += 1
+        cache.data = {}
+        cache.versions = {}
+        cache.marca = None
+        cache.años = {}
+        cache.rango_años = {}
+        borrar_snapshot()
+
+    # Fuera del lock: cerrar una escucha espera a su hilo, que puede estar
+    # esperando el lock para aplicar un aviso
+    for escucha in escuchas:
+        escucha.unsubscribe()
+
+
+def _patch_shared(collection_key, cambios=(), borrados=()):
+    # Aplica una escritura ya confirmada en Firestore a la caché
+    cache = _get_shared_cache()
+    df_key = f"df_{collection_key}"
 
-    return data
+    with cache.lock:
+        if cache.marca is None or df_key not in cache.data:
+            return
+        cambios = list(cambios)
+        if df_key in cache.años:
+            cambios, fuera = _separar_por_año(cambios, set(cache.años[df_key]))
+            borrados = set(borrados) | fuera
+        cache.publicar(
+            df_key,
+            _aplicar_cambios(cache.data[df_key], cambios, set(borrados)),
+            {c["id_documento_firestore"] for c in cambios} | set(borrados)
+        )
+
+
+def _replace_shared(collection_key, df):
+    cache = _get_shared_cache()
+    with cache.lock:
+        if cache.marca is not None:
+            cache.publicar(f"df_{collection_key}", df)
+
+
+def _patch_shared_campos(collection_key, campos_por_doc):
+    # Igual que _patch_shared, pero con {doc_id: campos modificados}
+    cache = _get_shared_cache()
+    with cache.lock:
+        df = cache.data.get(f"df_{collection_key}")
+        if df is None or df.empty or "id_documento_firestore" not in df.columns:
+            return
+
+        filas = df[df["id_documento_firestore"].isin(list(campos_por_doc))]
+        cambios = [
+            {**fila, **campos_por_doc[fila["id_documento_firestore"]]}
+            for fila in filas.to_dict("records")
+        ]
+        _patch_shared(collection_key, cambios=cambios)
+
+
+# =====================================
+# ESCUCHAS EN TIEMPO REAL
+# =====================================
+# Cada colección de COLECCIONES_EN_TIEMPO_REAL cargada en la caché tiene
+# una escucha on_snapshot sobre los documentos con updated_at posterior a
+# la última sincronización, y hay otra sobre las lápidas para los
+# borrados. Así el primer aviso trae solo lo cambiado desde entonces (no
+# la colección entera) y luego Firestore empuja cada cambio. Los avisos
+# llegan en el hilo de la escucha y se aplican con _patch_shared, bajo el
+# lock de la caché: las sesiones ven la versión nueva en su siguiente
+# rerun, y las escrituras de la propia app llegan dos veces sin efecto.
+def _iniciar_escuchas(cache):
+    # Con el lock de la caché tomado
+    if not TIEMPO_REAL or cache.marca is None:
+        return
+    en_memoria = [k for k in COLECCIONES_EN_TIEMPO_REAL if f"df_{k}" in cache.data]
+    if not en_memoria:
+        return
+
+    db = get_firestore_client()
+    desde = cache.marca - SYNC_OVERLAP
+    if TOMBSTONES_COLLECTION not in cache.escuchas:
+        cache.escuchas[TOMBSTONES_COLLECTION] = _escuchar(
+            db, TOMBSTONES_COLLECTION, desde,
+            functools.partial(_al_cambiar_lapidas, cache.generacion)
+        )
+    for key in en_memoria:
+        if key not in cache.escuchas:
+            cache.escuchas[key] = _escuchar(
+                db, COLLECTIONS[key], desde,
+                functools.partial(_al_cambiar, key, cache.generacion)
+            )
+            logger.info(f"Escuchando cambios de '{key}'")
+
+
+def _escuchar(db, collection, desde, callback):
+    return db.collection(collection).where(
+        filter=FieldFilter(UPDATED_AT_FIELD, ">=", desde)
+    ).on_snapshot(callback)
+
+
+def _escuchas_activas(cache):
+    # df_keys al día gracias a su escucha. Las escuchas que se han cerrado
+    # (error no recuperable) se descartan: esa colección se sincroniza y
+    # la escucha se vuelve a abrir desde la nueva marca.
+    for nombre, escucha in list(cache.escuchas.items()):
+        if not escucha.is_active:
+            logger.warning(f"La escucha de '{nombre}' se ha cerrado, se reabre")
+            del cache.escuchas[nombre]
+    if TOMBSTONES_COLLECTION not in cache.escuchas:
+        return set()
+    return {f"df_{k}" for k in cache.escuchas if k in COLLECTIONS}
+
+
+def _al_cambiar(collection_key, generacion, docs, cambios, read_time):
+    # Un documento solo sale de la consulta al borrarlo (updated_at nunca
+    # baja), y los borrados llegan por las lápidas: REMOVED se ignora
+    filas = [
+        _doc_to_row(cambio.document)
+        for cambio in cambios
+        if cambio.type.name != "REMOVED"
+    ]
+    if not filas:
+        return
+
+    cache = _get_shared_cache()
+    try:
+        with cache.lock:
+            if cache.generacion == generacion:
+                _patch_shared(collection_key, cambios=filas)
+    except Exception:
+        logger.exception(f"No se pudieron aplicar los cambios de '{collection_key}'")
+
+
+def _al_cambiar_lapidas(generacion, docs, cambios, read_time):
+    lapidas = {}
+    for cambio in cambios:
+        if cambio.type.name != "REMOVED":
+            t = cambio.document.to_dict()
+            lapidas.setdefault(t.get("coleccion"), {})[t.get("doc_id")] = t.get(UPDATED_AT_FIELD)
+    if not lapidas:
+        return
+
+    cache = _get_shared_cache()
+    try:
+        with cache.lock:
+            if cache.generacion != generacion:
+                return
+            for key in COLECCIONES_EN_TIEMPO_REAL:
+                if COLLECTIONS[key] in lapidas:
+                    _patch_shared(key, borrados=_borrados_vigentes(
+                        cache.data.get(f"df_{key}"), lapidas[COLLECTIONS[key]]
+                    ))
+    except Exception:
+        logger.exception("No se pudieron aplicar los borrados")
+
+
+def _borrados_vigentes(df, lapidas):
+    # Un documento recreado con el mismo ID tras borrarlo (p. ej. al
+    # restaurar) es más nuevo que su lápida y no se quita. Las dos escuchas
+    # no garantizan el orden entre sus avisos.
+    if df is None or df.empty or UPDATED_AT_FIELD not in df.columns:
+        return set(lapidas)
+
+    actuales = df.loc[
+        df["id_documento_firestore"].isin(list(lapidas)),
+        ["id_documento_firestore", UPDATED_AT_FIELD]
+    ]
+    recreados = set()
+    for doc_id, marca in actuales.itertuples(index=False):
+        borrado = lapidas[doc_id]
+        try:
+            if pd.notna(marca) and borrado is not None and pd.Timestamp(marca) > pd.Timestamp(borrado):
+                recreados.add(doc_id)
+        except TypeError:
+            pass
+    return set(lapidas) - recreados
 
 
 # =====================================
 # GUARDAR DATAFRAME COMPLETO
 # =====================================
 def save_dataframe_firestore(df, collection_key):
+    """
+    Deja la colección igual que `df`, escribiendo solo las filas nuevas o
+    cambiadas respecto a lo que ya hay (caché compartida o, si no está
+    cargada, Firestore). Fuera de "pedidos", los documentos que ya no
+    están en `df` se borran.
+    """
     db = get_firestore_client()
     collection = COLLECTIONS[collection_key]
     col_ref = db.collection(collection)
 
-    batch = db.batch()
-
-    if collection_key != "pedidos":
-        for doc in col_ref.stream():
-            batch.delete(doc.reference)
-
+    anteriores = _filas_actuales(collection_key)
+    ops = []
+    filas = []
+    cambios = []
+    ids_nuevos = set()
     for _, row in df.iterrows():
         data = {
             k: _sanitize(v)
             for k, v in row.items()
-            if k != "id_documento_firestore"
+            if k not in _COLUMNAS_INTERNAS
         }
 
         doc_id = row.get("id_documento_firestore")
         ref = col_ref.document(doc_id) if doc_id else col_ref.document()
-        batch.set(ref, data)
+        fila = {**data, "id_documento_firestore": ref.id}
+        filas.append(fila)
+        ids_nuevos.add(ref.id)
+
+        if anteriores.get(ref.id) != data:
+            ops.append(
+                ("set", ref, {**data, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP})
+            )
+            cambios.append(fila)
+
+    if collection_key != "pedidos":
+        for doc_id in anteriores.keys() - ids_nuevos:
+            ops.append(("delete", col_ref.document(doc_id), None))
+            ops.append(_tombstone_op(db, collection, doc_id))
+
+    _commit_en_bloques(db, ops)
+    logger.info(f"Guardado '{collection}': {len(ops)} escrituras")
+
+    if collection_key == "pedidos":
+        _patch_shared(collection_key, cambios=cambios)
+    else:
+        _replace_shared(collection_key, pd.DataFrame(filas))
+    return True
+
+
+def _filas_actuales(collection_key):
+    # {doc_id: datos saneados} del estado actual, para escribir solo diferencias
+    cache = _get_shared_cache()
+    with cache.lock:
+        df = cache.data.get(f"df_{collection_key}")
+
+    if df is None:
+        db = get_firestore_client()
+        with medir("stream", COLLECTIONS[collection_key]) as llamada:
+            docs = db.collection(COLLECTIONS[collection_key]).stream()
+            df = pd.DataFrame([_doc_to_row(doc) for doc in docs])
+            llamada["leidos"] = max(1, len(df))
+
+    if df.empty or "id_documento_firestore" not in df.columns:
+        return {}
+
+    return {
+        row["id_documento_firestore"]: {
+            k: _sanitize(v)
+            for k, v in row.items()
+            if k not in _COLUMNAS_INTERNAS
+        }
+        for row in df.to_dict("records")
+    }
+
+
+def reemplazar_coleccion_firestore(collection_key, df, nuevos_ids=False):
+    """
+    Sustituye la colección entera por las filas de `df` (scripts de
+    mantenimiento y restauraciones). Cada fila se escribe con updated_at
+    nuevo, con su id_documento_firestore o, si no tiene o `nuevos_ids`,
+    con uno nuevo; los documentos actuales que no se reescriben se borran
+    dejando lápida. Así la sincronización incremental, las escuchas y las
+    copias locales de otros procesos ven los cambios. Al terminar se
+    vacía la caché y la copia local de este proceso.
+    """
+    db = get_firestore_client()
+    collection = COLLECTIONS[collection_key]
+    col_ref = db.collection(collection)
+
+    ops = []
+    escritos = set()
+    for row in df.to_dict("records"):
+        data = {
+            k: _sanitize(v)
+            for k, v in row.items()
+            if k not in _COLUMNAS_INTERNAS
+        }
+        doc_id = None if nuevos_ids else _sanitize(row.get("id_documento_firestore"))
+        ref = col_ref.document(str(doc_id)) if doc_id else col_ref.document()
+        escritos.add(ref.id)
+        ops.append(("set", ref, {**data, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP}))
+
+    with medir("stream", collection) as llamada:
+        actuales = [doc.id for doc in col_ref.select([]).stream()]
+        llamada["leidos"] = max(1, len(actuales))
+    for doc_id in actuales:
+        if doc_id not in escritos:
+            ops.append(("delete", col_ref.document(doc_id), None))
+            ops.append(_tombstone_op(db, collection, doc_id))
 
-    batch.commit()
+    _commit_en_bloques(db, ops)
+    logger.info(f"Reemplazada '{collection}': {len(escritos)} documentos")
+
+    invalidate_shared_data()
     return True
 
 
+def _commit_en_bloques(db, ops):
+    # Reparte las operaciones en batches de BATCH_LIMIT y los confirma en
+    # paralelo; si alguno falla tras los reintentos, se propaga el error.
+    bloques = [ops[i:i + BATCH_LIMIT] for i in range(0, len(ops), BATCH_LIMIT)]
+    _commit_paralelo(db, dict(enumerate(bloques)))
+
+
+def commit_bloques(bloques, al_confirmar=None):
+    """
+    Confirma en paralelo `bloques` ({clave: [(tipo, ref, data), ...]},
+    cada uno de como mucho BATCH_LIMIT operaciones). `al_confirmar(clave)`
+    se llama desde el hilo que invoca según termina cada bloque.
+    """
+    _commit_paralelo(get_firestore_client(), bloques, al_confirmar)
+
+
+def _commit_paralelo(db, bloques, al_confirmar=None):
+    if not bloques:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(bloques))) as pool:
+        futures = {
+            pool.submit(propagar(_commit_bloque), db, ops): clave
+            for clave, ops in bloques.items()
+        }
+        for future in as_completed(futures):
+            future.result()
+            if al_confirmar:
+                al_confirmar(futures[future])
+
+
+def _aplicar_ops(batch, ops):
+    # Vale tanto para un WriteBatch como para una Transaction
+    for tipo, ref, data in ops:
+        if tipo == "delete":
+            batch.delete(ref)
+        elif tipo == "update":
+            batch.update(ref, data)
+        else:
+            batch.set(ref, data)
+
+
+def _commit_bloque(db, ops):
+    for intento in range(BATCH_REINTENTOS):
+        batch = db.batch()
+        _aplicar_ops(batch, ops)
+        try:
+            with medir("batch", _colecciones_ops(ops), escritos=len(ops)):
+                batch.commit()
+            return
+        except _ERRORES_TRANSITORIOS as e:
+            if intento == BATCH_REINTENTOS - 1:
+                raise
+            espera = 0.5 * 2 ** intento
+            logger.warning(f"Batch fallido ({e}), reintento en {espera}s")
+            time.sleep(espera)
+
+
+def _colecciones_ops(ops):
+    return ",".join(sorted({ref.parent.id for _, ref, _ in ops}))
+
+
 # =====================================
 # AÑADIR DOCUMENTO NUEVO (CORRECCIÓN)
 # =====================================
@@ -82,7 +1000,14 @@ def add_document_firestore(collection_key, data):
     db = get_firestore_client()
     collection = COLLECTIONS[collection_key]
     clean = {k: _sanitize(v) for k, v in data.items()}
-    db.collection(collection).add(clean)
+    with medir("add", collection, escritos=1):
+        _, ref = db.collection(collection).add(
+            {**clean, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP}
+        )
+    _patch_shared(
+        collection_key,
+        cambios=[{**clean, "id_documento_firestore": ref.id}]
+    )
     return True
 
 
@@ -96,7 +1021,12 @@ def update_document_firestore(collection_key, doc_id, data):
     db = get_firestore_client()
     collection = COLLECTIONS[collection_key]
     clean = {k: _sanitize(v) for k, v in data.items()}
-    db.collection(collection).document(doc_id).update(clean)
+    with medir("update", collection, escritos=1):
+        db.collection(collection).document(doc_id).update(
+            {**clean, UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP}
+        )
+
+    _patch_shared_campos(collection_key, {doc_id: clean})
     return True
 
 
@@ -106,10 +1036,102 @@ def update_document_firestore(collection_key, doc_id, data):
 def delete_document_firestore(collection_key, doc_id):
     db = get_firestore_client()
     collection = COLLECTIONS[collection_key]
-    db.collection(collection).document(doc_id).delete()
+
+    batch = db.batch()
+    batch.delete(db.collection(collection).document(doc_id))
+    _tombstone(db, batch, collection, doc_id)
+    with medir("batch", collection, escritos=2):
+        batch.commit()
+
+    _patch_shared(collection_key, borrados=[doc_id])
     return True
 
 
+# =====================================
+# BORRAR Y RENUMERAR
+# =====================================
+def delete_and_renumber_firestore(collection_key, doc_id, renumeracion,
+                                  contador=None):
+    """
+    Borra `doc_id` y cambia el campo "ID" de otros documentos según
+    `renumeracion` ({doc_id: nuevo_id}).
+
+    El borrado y todo lo que quepa en un batch van en una transacción,
+    que falla si el documento ya no existe; si la renumeración no cabe
+    en BATCH_LIMIT escrituras, el resto se confirma en bloques después.
+
+    `contador` = (año, ultimo_visto, ultimo_nuevo): si el contador de IDs
+    del año sigue en `ultimo_visto` (nadie ha creado nada entretanto), se
+    baja a `ultimo_nuevo` en la misma transacción.
+
+    Devuelve False si el documento ya había sido borrado.
+    """
+    db = get_firestore_client()
+    collection = COLLECTIONS[collection_key]
+    col_ref = db.collection(collection)
+    ref = col_ref.document(doc_id)
+
+    ops = [("delete", ref, None), _tombstone_op(db, collection, doc_id)]
+    for otro_id, nuevo_id in renumeracion.items():
+        ops.append(("update", col_ref.document(otro_id), {
+            "ID": int(nuevo_id),
+            UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP,
+        }))
+
+    en_transaccion = BATCH_LIMIT - 1 if contador else BATCH_LIMIT
+
+    @transaccional
+    def borrar(transaction):
+        llamada["leidos"] += 1
+        llamada["escritos"] = 0
+        if not ref.get(transaction=transaction).exists:
+            return False
+
+        if contador:
+            año, ultimo_visto, ultimo_nuevo = contador
+            contador_ref = _contador_ref(db, collection, año)
+            llamada["leidos"] += 1
+            snap = contador_ref.get(transaction=transaction)
+            if snap.exists and snap.get("ultimo") == ultimo_visto:
+                transaction.update(contador_ref, {
+                    "ultimo": int(ultimo_nuevo),
+                    UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP,
+                })
+                llamada["escritos"] = 1
+
+        _aplicar_ops(transaction, ops[:en_transaccion])
+        llamada["escritos"] += len(ops[:en_transaccion])
+        return True
+
+    with medir("transaccion", collection) as llamada:
+        borrado = borrar(db.transaction())
+    if not borrado:
+        return False
+
+    _commit_en_bloques(db, ops[en_transaccion:])
+
+    _patch_shared(collection_key, borrados=[doc_id])
+    _patch_shared_campos(collection_key, {
+        otro_id: {"ID": int(nuevo_id)}
+        for otro_id, nuevo_id in renumeracion.items()
+    })
+    return True
+
+
+def _tombstone(db, batch, collection, doc_id):
+    _, ref, data = _tombstone_op(db, collection, doc_id)
+    batch.set(ref, data)
+
+
+def _tombstone_op(db, collection, doc_id):
+    ref = db.collection(TOMBSTONES_COLLECTION).document(f"{collection}__{doc_id}")
+    return ("set", ref, {
+        "coleccion": collection,
+        "doc_id": doc_id,
+        UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP,
+    })
+
+
 # =====================================
 # NEXT ID POR AÑO (NO TOCAR)
 # =====================================
@@ -122,6 +1144,57 @@ def get_next_id_por_año(df, año):
     return int(pd.to_numeric(df_año["ID"], errors="coerce").max()) + 1
 
 
+# =====================================
+# RESERVA ATÓMICA DE IDS POR AÑO
+# =====================================
+def reservar_ids_firestore(collection_key, año, cantidad=1, minimo=0):
+    """
+    Reserva `cantidad` IDs consecutivos de `collection_key` para `año`
+    con un documento contador por colección y año, dentro de una
+    transacción: dos sesiones nunca reciben el mismo ID.
+
+    `minimo` es el ID más alto que el llamante ya conoce (p. ej. el máximo
+    de su DataFrame); sirve para arrancar el contador la primera vez y
+    para no quedarse por detrás tras una restauración.
+
+    Devuelve la lista de IDs reservados.
+    """
+    db = get_firestore_client()
+    collection = COLLECTIONS[collection_key]
+    ref = _contador_ref(db, collection, año)
+
+    @transaccional
+    def reservar(transaction):
+        llamada["leidos"] += 1
+        snap = ref.get(transaction=transaction)
+        ultimo = int(snap.get("ultimo") or 0) if snap.exists else 0
+        ultimo = max(ultimo, int(minimo or 0))
+        transaction.set(ref, {
+            "coleccion": collection,
+            "año": int(año),
+            "ultimo": ultimo + cantidad,
+            UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP,
+        })
+        return ultimo + 1
+
+    with medir("transaccion", COUNTERS_COLLECTION, escritos=1) as llamada:
+        primero = reservar(db.transaction())
+    return list(range(primero, primero + cantidad))
+
+
+def _contador_ref(db, collection, año):
+    return db.collection(COUNTERS_COLLECTION).document(f"{collection}__{int(año)}")
+
+
+# =====================================
+# DOCUMENTO -> FILA
+# =====================================
+def _doc_to_row(doc):
+    r = doc.to_dict()
+    r["id_documento_firestore"] = doc.id
+    return r
+
+
 # =====================================
 # SANITIZADOR INTERNO
 # =====================================
@@ -53,3 +53,33 @@ def safe_select_index(options, value):
         return options.index(value)
     except Exception:
         return 0
+
+
+# =====================================
+# NÚMERO SEGURO PARA NUMBER_INPUT
+# =====================================
+def safe_float(value, default=0.0):
+    # Las columnas numéricas del esquema traen NaN donde falta el valor
+    try:
+        if value is None or pd.isna(value):
+            return default
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# =====================================
+# RENUMERAR IDS TRAS BORRAR
+# =====================================
+def calcular_renumeracion(df_año, id_borrado):
+    """
+    {id_documento_firestore: nuevo_id} de las filas del año cuyo ID
+    cambia al quitar `id_borrado` y dejar los IDs como 1..n.
+    """
+    restantes = df_año[df_año["ID"] != id_borrado].sort_values("ID")
+    nuevos_ids = pd.Series(range(1, len(restantes) + 1), index=restantes.index)
+    cambian = restantes["ID"] != nuevos_ids
+    return dict(zip(
+        restantes.loc[cambian, "id_documento_firestore"],
+        nuevos_ids[cambian].astype(int)
+    ))
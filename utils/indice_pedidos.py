@@ -0,0 +1,73 @@
+# utils/indice_pedidos.py
+# =====================================================
+# ÍNDICE DE PEDIDOS
+# =====================================================
+# Posición de cada pedido en df_pedidos por (Año, ID) y por
+# id_documento_firestore. Se construye una vez cada vez que cambia
+# df_pedidos (ver firestore_utils._SharedCache) y las páginas de
+# consultar/modificar/eliminar lo usan para buscar el pedido elegido
+# sin recorrer el DataFrame en cada interacción.
+INDICE_KEY = "indice_pedidos"
+
+
+class IndicePedidos:
+    def __init__(self, df_pedidos):
+        # Se guardan etiquetas del índice de df_pedidos (único, RangeIndex
+        # en la caché), así cada búsqueda es un .loc directo
+        df = df_pedidos
+        self._df = df
+
+        con_id = df[df["ID"].notna()]
+        etiquetas = con_id.index.tolist()
+        claves = zip(con_id["Año"].astype(int).tolist(), con_id["ID"].astype(int).tolist())
+
+        # Si hay (Año, ID) repetidos gana la primera fila, como hacían
+        # los filtros con .iloc[0]
+        self._por_clave = {}
+        for clave, etiqueta in zip(claves, etiquetas):
+            self._por_clave.setdefault(clave, etiqueta)
+
+        self._por_doc = (
+            dict(zip(df["id_documento_firestore"].tolist(), df.index.tolist()))
+            if "id_documento_firestore" in df.columns else {}
+        )
+
+        self.años = sorted(df["Año"].dropna().unique().tolist(), reverse=True)
+        self._max_id = con_id.groupby("Año")["ID"].max().astype(int).to_dict()
+        self._secuencia = (
+            con_id.groupby("Año")["ID"].rank(method="first").astype(int).to_dict()
+        )
+        self._por_año = con_id.groupby("Año").size().to_dict()
+
+    def es_de(self, df_pedidos):
+        return self._df is df_pedidos
+
+    def pedido(self, año, pedido_id):
+        """Fila del pedido (Año, ID), o None si no existe."""
+        etiqueta = self._por_clave.get((int(año), int(pedido_id)))
+        return None if etiqueta is None else self._df.loc[etiqueta]
+
+    def pedido_por_doc(self, doc_id):
+        etiqueta = self._por_doc.get(doc_id)
+        return None if etiqueta is None else self._df.loc[etiqueta]
+
+    def max_id(self, año):
+        return self._max_id.get(int(año), 0)
+
+    def num_pedidos(self, año):
+        return self._por_año.get(int(año), 0)
+
+    def secuencia(self, pedido):
+        """Número de orden del pedido dentro de su año según el ID (1, 2, 3...)."""
+        return self._secuencia.get(pedido.name)
+
+    def pedidos_del_año(self, año):
+        return self._df[self._df["Año"] == año]
+
+
+def obtener_indice(data, df_pedidos):
+    """Índice de la caché si corresponde a `df_pedidos`; si no, uno nuevo."""
+    indice = (data or {}).get(INDICE_KEY)
+    if indice is not None and indice.es_de(df_pedidos):
+        return indice
+    return IndicePedidos(df_pedidos)
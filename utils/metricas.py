@@ -0,0 +1,219 @@
+# utils/metricas.py
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# MÉTRICAS DE FIRESTORE POR RERUN Y PÁGINA
+# =====================================================
+# Cada llamada a Firestore se apunta con medir() (operación, colección,
+# documentos leídos y escritos, milisegundos) en el rerun en curso, que
+# app.py abre con rerun() alrededor de la carga de datos y la página.
+# Los últimos MAX_RERUNS reruns de todas las sesiones quedan en memoria
+# para la pestaña de diagnóstico de Configuración; si se define
+# IMPERYO_METRICAS_PATH, cada rerun se añade además a ese fichero JSONL.
+MAX_RERUNS = int(os.environ.get("IMPERYO_METRICAS_RERUNS", 1000))
+METRICAS_PATH = os.environ.get("IMPERYO_METRICAS_PATH")
+
+PERCENTILES = (50, 95, 99)
+
+_RERUN = contextvars.ContextVar("rerun_metricas", default=None)
+
+
+class _Registro:
+    def __init__(self, maximo):
+        self.lock = threading.Lock()
+        self.reruns = deque(maxlen=maximo)
+
+    def guardar(self, rerun):
+        with self.lock:
+            self.reruns.append(rerun)
+
+    def lista(self):
+        with self.lock:
+            return list(self.reruns)
+
+    def vaciar(self):
+        with self.lock:
+            self.reruns.clear()
+
+
+@st.cache_resource(show_spinner=False)
+def _get_registro():
+    return _Registro(MAX_RERUNS)
+
+
+# =====================================================
+# REGISTRO DE LLAMADAS
+# =====================================================
+@contextmanager
+def rerun(pagina):
+    """
+    Agrupa en un rerun las llamadas hechas dentro del bloque. Se cierra
+    también si la página corta la ejecución con st.rerun() o st.stop().
+    """
+    actual = {
+        "rerun": uuid.uuid4().hex[:12],
+        "sesion": _id_sesion(),
+        "pagina": pagina,
+        "inicio": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "llamadas": [],
+    }
+    token = _RERUN.set(actual)
+    t0 = time.perf_counter()
+    try:
+        yield actual
+    finally:
+        actual["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        actual["lecturas"] = sum(ll["leidos"] for ll in actual["llamadas"])
+        actual["escrituras"] = sum(ll["escritos"] for ll in actual["llamadas"])
+        _RERUN.reset(token)
+        _get_registro().guardar(actual)
+        _escribir_jsonl(actual)
+        st.session_state["metricas_ultimo_rerun"] = actual
+
+
+@contextmanager
+def medir(operacion, coleccion, leidos=0, escritos=0):
+    """
+    Apunta una llamada a Firestore en el rerun en curso. El bloque puede
+    corregir `leidos`/`escritos` del dict que devuelve cuando no se
+    conocen hasta tener la respuesta (p. ej. documentos de una consulta).
+    Fuera de un rerun (scripts, hilos sin propagar) no se apunta nada.
+    """
+    llamada = {
+        "op": operacion,
+        "coleccion": coleccion,
+        "leidos": leidos,
+        "escritos": escritos,
+    }
+    t0 = time.perf_counter()
+    try:
+        yield llamada
+    except Exception as e:
+        llamada["error"] = type(e).__name__
+        raise
+    finally:
+        llamada["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        actual = _RERUN.get()
+        if actual is not None:
+            actual["llamadas"].append(llamada)
+
+
+def propagar(funcion):
+    """
+    `funcion` envuelta para que, ejecutada en otro hilo (ThreadPoolExecutor),
+    sus llamadas cuenten en el rerun de quien la envuelve.
+    """
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(funcion, *args, **kwargs)
+
+
+def lecturas_agregacion(n):
+    # count()/sum() cobran una lectura por cada 1000 documentos (mínimo 1)
+    return max(1, -(-int(n) // 1000))
+
+
+def _id_sesion():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id[:8] if ctx else None
+    except Exception:
+        return None
+
+
+def _escribir_jsonl(actual):
+    if not METRICAS_PATH:
+        return
+    try:
+        with open(METRICAS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(actual, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"No se pudieron guardar las métricas: {e}")
+
+
+# =====================================================
+# CONSULTA
+# =====================================================
+def reruns_registrados():
+    return _get_registro().lista()
+
+
+def vaciar_metricas():
+    _get_registro().vaciar()
+
+
+def exportar_jsonl(reruns=None):
+    """Bytes JSON lines: un rerun por línea con sus llamadas."""
+    reruns = reruns_registrados() if reruns is None else reruns
+    return "".join(
+        json.dumps(r, ensure_ascii=False) + "\n" for r in reruns
+    ).encode("utf-8")
+
+
+def _percentiles(valores, prefijo):
+    valores = np.asarray(valores, dtype=float)
+    return {
+        f"{prefijo} p{p}": round(float(np.percentile(valores, p)), 1) if len(valores) else None
+        for p in PERCENTILES
+    }
+
+
+def resumen_por_pagina(reruns=None):
+    """Una fila por página: reruns, documentos y percentiles de duración."""
+    reruns = reruns_registrados() if reruns is None else reruns
+    filas = []
+    for pagina, grupo in pd.DataFrame(reruns or [], columns=[
+        "pagina", "ms", "lecturas", "escrituras", "llamadas"
+    ]).groupby("pagina", sort=False):
+        filas.append({
+            "Página": pagina,
+            "Reruns": len(grupo),
+            "Lecturas": int(grupo["lecturas"].sum()),
+            "Escrituras": int(grupo["escrituras"].sum()),
+            "Lecturas/rerun": round(grupo["lecturas"].mean(), 1),
+            "Llamadas": int(grupo["llamadas"].map(len).sum()),
+            **_percentiles(grupo["ms"], "ms"),
+        })
+    return pd.DataFrame(filas).sort_values("Lecturas", ascending=False) if filas else pd.DataFrame()
+
+
+def resumen_por_operacion(reruns=None):
+    """Una fila por (página, operación, colección) con latencias de Firestore."""
+    reruns = reruns_registrados() if reruns is None else reruns
+    llamadas = [
+        {**ll, "pagina": r["pagina"]}
+        for r in reruns
+        for ll in r["llamadas"]
+    ]
+    if not llamadas:
+        return pd.DataFrame()
+
+    filas = []
+    df = pd.DataFrame(llamadas)
+    for (pagina, op, coleccion), grupo in df.groupby(["pagina", "op", "coleccion"]):
+        filas.append({
+            "Página": pagina,
+            "Operación": op,
+            "Colección": coleccion,
+            "Llamadas": len(grupo),
+            "Lecturas": int(grupo["leidos"].sum()),
+            "Escrituras": int(grupo["escritos"].sum()),
+            "Errores": int(grupo["error"].notna().sum()) if "error" in grupo else 0,
+            **_percentiles(grupo["ms"], "ms"),
+        })
+    return pd.DataFrame(filas).sort_values(["Lecturas", "Escrituras"], ascending=False)
@@ -1,29 +1,116 @@
 # utils/notifications.py
+import os
 import requests
 import logging
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from utils.outbox import encolar, CANAL_TELEGRAM
 
 logger = logging.getLogger(__name__)
 
-def enviar_telegram(mensaje, bot_token, chat_id):
+# Se puede apuntar a un servidor HTTP local para pruebas
+TELEGRAM_API = os.environ.get("IMPERYO_TELEGRAM_API", "https://api.telegram.org")
+
+
+def enviar_telegram(mensaje, bot_token=None, chat_id=None):
     """
     Envía un mensaje a un grupo de Telegram.
-    
+
+    El mensaje se deja en la cola de avisos (utils/outbox.py) y se envía
+    en segundo plano: devuelve True si ha quedado en la cola. El token
+    del bot no pasa por la cola: se lee de secrets ([telegram] bot_token)
+    al enviar.
+
     Args:
         mensaje (str): Texto del mensaje.
-        bot_token (str): Token del bot de Telegram.
-        chat_id (str): ID del grupo o chat.
+        bot_token: Obsoleto, se ignora. Se mantiene para las llamadas
+            antiguas enviar_telegram(mensaje, bot_token, chat_id).
+        chat_id (str): ID del grupo o chat. También vale
+            enviar_telegram(mensaje, chat_id).
     """
+    if chat_id is None:
+        # enviar_telegram(mensaje, chat_id): el segundo argumento es el chat
+        chat_id, bot_token = bot_token, None
+    if bot_token is not None:
+        logger.warning(
+            "enviar_telegram: bot_token está obsoleto y se ignora; "
+            "el token se lee de secrets ([telegram] bot_token)"
+        )
+
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        data = {
-            "chat_id": chat_id,
+        encolar(CANAL_TELEGRAM, {
             "text": mensaje,
-            "parse_mode": "HTML"
-        }
-        response = requests.post(url, data=data)
-        response.raise_for_status()
-        logger.info(f"Telegram enviado: {mensaje}")
+            "chat_id": chat_id,
+        })
         return True
     except Exception as e:
-        logger.error(f"Error al enviar Telegram: {e}")
-        return False
\ No newline at end of file
+        logger.error(f"Error al encolar Telegram: {e}")
+        return False
+
+
+# =====================================================
+# CLIENTE HTTP REUTILIZABLE
+# =====================================================
+class ClienteTelegram:
+    """
+    Envía los mensajes de un lote por una sesión HTTP con keep-alive, así
+    solo el primero paga la conexión TLS. Los reintentos los hace la cola.
+    """
+
+    def __init__(self, api=TELEGRAM_API, timeout=15, bot_token=None):
+        self.api = api.rstrip("/")
+        self.timeout = timeout
+        self.bot_token = bot_token
+        self._sesion = None
+
+    def enviar_lote(self, payloads):
+        errores = []
+        token = self.bot_token or st.secrets.get("telegram", {}).get("bot_token")
+        if not token:
+            return ["Falta [telegram] bot_token en secrets"] * len(payloads)
+
+        for payload in payloads:
+            try:
+                response = self._sesion_http().post(
+                    f"{self.api}/bot{token}/sendMessage",
+                    data={
+                        "chat_id": payload["chat_id"],
+                        "text": payload["text"],
+                        "parse_mode": "HTML"
+                    },
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                logger.info(f"Telegram enviado: {payload['text']}")
+                errores.append(None)
+            except Exception as e:
+                errores.append(_error_sin_url(e, token))
+        return errores
+
+    def _sesion_http(self):
+        if self._sesion is None:
+            sesion = requests.Session()
+            sesion.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            sesion.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            self._sesion = sesion
+        return self._sesion
+
+    def cerrar(self):
+        if self._sesion is not None:
+            self._sesion.close()
+            self._sesion = None
+
+
+def _error_sin_url(e, token):
+    # El texto de las excepciones de requests lleva la URL, y el token del
+    # bot va en la URL: ni la cola ni el log deben guardarlo
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        try:
+            detalle = e.response.json().get("description", "")
+        except ValueError:
+            detalle = ""
+        texto = f"HTTP {e.response.status_code} {detalle}".strip()
+    else:
+        texto = type(e).__name__
+    return texto.replace(token, "<token>")
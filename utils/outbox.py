@@ -0,0 +1,212 @@
+# utils/outbox.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import streamlit as st
+
+from utils.snapshot_utils import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# COLA DE NOTIFICACIONES (OUTBOX)
+# =====================================================
+# Los emails y mensajes de Telegram no se envían en el hilo de la página:
+# se guardan en una cola SQLite en disco y un hilo del proceso los va
+# enviando por lotes, reutilizando la conexión SMTP y la sesión HTTP.
+# Si un envío falla se reintenta más tarde con espera creciente; lo que
+# quede en la cola al reiniciar la app se envía al arrancar.
+OUTBOX_PATH = Path(
+    os.environ.get(
+        "IMPERYO_OUTBOX_PATH",
+        SNAPSHOT_DIR.parent / "outbox.sqlite3"
+    )
+)
+
+LOTE = 20
+MAX_INTENTOS = 6
+ESPERA_BASE = 5         # segundos antes del primer reintento (se duplica)
+ESPERA_COLA_VACIA = 30  # segundos entre comprobaciones sin avisos
+
+CANAL_EMAIL = "email"
+CANAL_TELEGRAM = "telegram"
+
+
+class _Outbox:
+    def __init__(self, path, emisores):
+        # `emisores`: {canal: objeto con enviar_lote(payloads) -> [error
+        # o None por payload] y cerrar()}
+        self.path = Path(path)
+        self.emisores = emisores
+        self._hay_trabajo = threading.Event()
+        self._parar = threading.Event()
+        self._hilo = None
+        self._crear_tabla()
+
+    # ---------- COLA ----------
+    def encolar(self, canal, payload):
+        with self._conectar() as conn:
+            cur = conn.execute(
+                "INSERT INTO outbox (canal, payload, proximo) VALUES (?, ?, ?)",
+                (canal, json.dumps(payload, ensure_ascii=False, default=str), time.time())
+            )
+        self._hay_trabajo.set()
+        return cur.lastrowid
+
+    def pendientes(self):
+        with self._conectar() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE fallido = 0"
+            ).fetchone()[0]
+
+    def procesar_pendientes(self):
+        """Envía un lote de avisos ya vencidos. Devuelve cuántos se han procesado."""
+        with self._conectar() as conn:
+            filas = conn.execute(
+                "SELECT id, canal, payload, intentos FROM outbox "
+                "WHERE fallido = 0 AND proximo <= ? ORDER BY id LIMIT ?",
+                (time.time(), LOTE)
+            ).fetchall()
+
+        por_canal = {}
+        for fila in filas:
+            por_canal.setdefault(fila[1], []).append(fila)
+
+        for canal, lote in por_canal.items():
+            emisor = self.emisores.get(canal)
+            if emisor is None:
+                errores = [f"Canal desconocido: {canal}"] * len(lote)
+            else:
+                try:
+                    errores = emisor.enviar_lote([json.loads(f[2]) for f in lote])
+                except Exception as e:
+                    errores = [str(e)] * len(lote)
+            self._registrar(lote, errores)
+
+        return len(filas)
+
+    def _registrar(self, lote, errores):
+        ahora = time.time()
+        with self._conectar() as conn:
+            for (id_, canal, _, intentos), error in zip(lote, errores):
+                if error is None:
+                    conn.execute("DELETE FROM outbox WHERE id = ?", (id_,))
+                    continue
+
+                intentos += 1
+                fallido = int(intentos >= MAX_INTENTOS)
+                conn.execute(
+                    "UPDATE outbox SET intentos = ?, proximo = ?, error = ?, "
+                    "fallido = ? WHERE id = ?",
+                    (intentos, ahora + ESPERA_BASE * 2 ** (intentos - 1),
+                     str(error), fallido, id_)
+                )
+                if fallido:
+                    logger.error(f"Aviso {canal} {id_} descartado tras {intentos} intentos: {error}")
+                else:
+                    logger.warning(f"Aviso {canal} {id_} fallido ({error}), se reintentará")
+
+    # ---------- HILO ----------
+    def iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._parar.clear()
+            self._hilo = threading.Thread(
+                target=self._bucle, name="outbox", daemon=True
+            )
+            self._hilo.start()
+
+    def parar(self):
+        self._parar.set()
+        self._hay_trabajo.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=10)
+        self._cerrar_emisores()
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self._hay_trabajo.clear()
+            try:
+                procesados = self.procesar_pendientes()
+            except Exception as e:
+                logger.error(f"Error en la cola de avisos: {e}")
+                procesados = 0
+
+            if procesados:
+                continue
+
+            # Cola vacía (o todo esperando reintento): se sueltan las
+            # conexiones hasta el siguiente aviso
+            self._cerrar_emisores()
+            self._hay_trabajo.wait(self._espera())
+
+    def _espera(self):
+        with self._conectar() as conn:
+            proximo = conn.execute(
+                "SELECT MIN(proximo) FROM outbox WHERE fallido = 0"
+            ).fetchone()[0]
+        if proximo is None:
+            return ESPERA_COLA_VACIA
+        return min(ESPERA_COLA_VACIA, max(proximo - time.time(), 0.1))
+
+    def _cerrar_emisores(self):
+        for emisor in self.emisores.values():
+            try:
+                emisor.cerrar()
+            except Exception:
+                pass
+
+    # ---------- SQLITE ----------
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _crear_tabla(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " canal TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " intentos INTEGER NOT NULL DEFAULT 0,"
+                " proximo REAL NOT NULL,"
+                " error TEXT,"
+                " fallido INTEGER NOT NULL DEFAULT 0)"
+            )
+
+
+def _emisores_por_defecto():
+    # Importados aquí: Email_utils y notifications encolan a través de
+    # este módulo
+    from utils.Email_utils import ConexionSMTP
+    from utils.notifications import ClienteTelegram
+
+    return {
+        CANAL_EMAIL: ConexionSMTP.desde_secrets(),
+        CANAL_TELEGRAM: ClienteTelegram(),
+    }
+
+
+@st.cache_resource
+def get_outbox():
+    # Una cola y un hilo por proceso, compartidos por todas las sesiones
+    outbox = _Outbox(OUTBOX_PATH, _emisores_por_defecto())
+    outbox.iniciar()
+    return outbox
+
+
+def encolar(canal, payload):
+    """Deja un aviso en la cola y vuelve enseguida; lo envía el hilo del outbox."""
+    return get_outbox().encolar(canal, payload)
@@ -0,0 +1,231 @@
+# utils/perfilado.py
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from utils.snapshot_utils import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# PERFILADO DE PÁGINAS (OPCIONAL)
+# =====================================================
+# Con IMPERYO_PERFIL definido, cada rerun se mide por tramos con nombre:
+# la página entera (rerun() desde app.py), cada función de página
+# (@perfilar) y las secciones marcadas con tramo("filtrar"), etc.
+#
+#   IMPERYO_PERFIL=tramos     solo los tramos
+#   IMPERYO_PERFIL=cprofile   tramos + cProfile del rerun (.prof)
+#   IMPERYO_PERFIL=muestreo   tramos + pila de Python cada
+#                             IMPERYO_PERFIL_INTERVALO segundos
+#
+# Cada rerun deja en PERFIL_DIR ficheros .folded (una línea "a;b;c n"
+# por pila, el formato de flamegraph.pl y speedscope) y una línea en
+# resumen.jsonl con los milisegundos de cada tramo. Sin la variable,
+# rerun() y tramo() no hacen nada.
+MODOS = ("tramos", "cprofile", "muestreo")
+MODO = os.environ.get("IMPERYO_PERFIL", "").strip().lower() or None
+if MODO and MODO not in MODOS:
+    logger.warning(f"IMPERYO_PERFIL='{MODO}' no es válido ({', '.join(MODOS)})")
+    MODO = None
+
+PERFIL_DIR = Path(
+    os.environ.get("IMPERYO_PERFIL_DIR", SNAPSHOT_DIR.parent / "perfiles")
+)
+INTERVALO_MUESTREO = float(os.environ.get("IMPERYO_PERFIL_INTERVALO", 0.005))
+MAX_PERFILES = 200  # reruns que se conservan en disco
+
+# Las pilas muestreadas empiezan en el primer marco del código de la app
+_RAIZ_APP = str(Path(__file__).resolve().parent.parent)
+
+_PERFIL = contextvars.ContextVar("perfil", default=None)
+
+# cProfile no admite dos perfiles activos a la vez en el proceso
+_CPROFILE_LOCK = threading.Lock()
+
+
+class _Perfil:
+    def __init__(self, pagina):
+        self.pagina = pagina
+        self.hilo = threading.get_ident()
+        self.pila = [pagina]
+        self.tramos = {}          # ruta (tupla) -> segundos acumulados
+        self.muestras = Counter()  # pila plegada -> número de muestras
+
+    def sumar(self, ruta, segundos):
+        self.tramos[ruta] = self.tramos.get(ruta, 0.0) + segundos
+
+    def propios(self):
+        # Tiempo de cada tramo sin el de sus tramos hijos
+        propios = dict(self.tramos)
+        for ruta, segundos in self.tramos.items():
+            if len(ruta) > 1 and ruta[:-1] in propios:
+                propios[ruta[:-1]] -= segundos
+        return propios
+
+
+# =====================================================
+# TRAMOS
+# =====================================================
+@contextmanager
+def rerun(pagina):
+    """Perfil de un rerun completo de `pagina` (no hace nada si MODO es None)."""
+    if MODO is None:
+        yield
+        return
+
+    perfil = _Perfil(pagina)
+    token = _PERFIL.set(perfil)
+    muestreador = _Muestreador(perfil) if MODO == "muestreo" else None
+    profiler = None
+    if MODO == "cprofile" and _CPROFILE_LOCK.acquire(blocking=False):
+        profiler = cProfile.Profile()
+
+    inicio = datetime.now()
+    t0 = time.perf_counter()
+    if muestreador:
+        muestreador.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            _CPROFILE_LOCK.release()
+        if muestreador:
+            muestreador.parar()
+        perfil.sumar((pagina,), time.perf_counter() - t0)
+        _PERFIL.reset(token)
+        try:
+            _guardar(perfil, inicio, profiler)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar el perfil: {e}")
+
+
+@contextmanager
+def tramo(nombre):
+    """Mide el bloque como un tramo hijo del tramo en curso."""
+    perfil = _PERFIL.get()
+    # Solo el hilo del script: los hilos de carga no tocan la pila
+    if perfil is None or threading.get_ident() != perfil.hilo:
+        yield
+        return
+
+    perfil.pila.append(nombre)
+    ruta = tuple(perfil.pila)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        perfil.sumar(ruta, time.perf_counter() - t0)
+        perfil.pila.pop()
+
+
+def perfilar(funcion):
+    """Decorador: la función entera es un tramo con su nombre."""
+    @functools.wraps(funcion)
+    def envuelta(*args, **kwargs):
+        with tramo(funcion.__name__):
+            return funcion(*args, **kwargs)
+    return envuelta
+
+
+# =====================================================
+# MUESTREO
+# =====================================================
+class _Muestreador(threading.Thread):
+    def __init__(self, perfil):
+        super().__init__(daemon=True, name="perfil-muestreo")
+        self.perfil = perfil
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(INTERVALO_MUESTREO):
+            marco = sys._current_frames().get(self.perfil.hilo)
+            if marco is None:
+                continue
+            tramos = list(self.perfil.pila)
+            self.perfil.muestras[";".join(tramos + _pila_python(marco))] += 1
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def _pila_python(marco):
+    # Del marco más externo de la app al más interno; los de Streamlit
+    # por encima del primero de la app sobran
+    pila = []
+    hasta = None
+    while marco is not None:
+        codigo = marco.f_code
+        pila.append(f"{codigo.co_name} ({Path(codigo.co_filename).name}:{codigo.co_firstlineno})")
+        if codigo.co_filename.startswith(_RAIZ_APP):
+            hasta = len(pila)
+        marco = marco.f_back
+    return pila[:hasta][::-1]
+
+
+# =====================================================
+# INFORMES
+# =====================================================
+def _guardar(perfil, inicio, profiler):
+    PERFIL_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"\W+", "_", perfil.pagina.lower()).strip("_") or "pagina"
+    base = f"{inicio:%Y%m%d_%H%M%S_%f}_{slug}"
+
+    propios = perfil.propios()
+    _escribir_folded(
+        PERFIL_DIR / f"{base}.tramos.folded",
+        # Microsegundos de tiempo propio por ruta de tramos
+        {";".join(ruta): round(s * 1e6) for ruta, s in propios.items()}
+    )
+    if perfil.muestras:
+        _escribir_folded(PERFIL_DIR / f"{base}.muestras.folded", perfil.muestras)
+    if profiler:
+        profiler.dump_stats(PERFIL_DIR / f"{base}.prof")
+
+    with open(PERFIL_DIR / "resumen.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "inicio": inicio.isoformat(timespec="milliseconds"),
+            "pagina": perfil.pagina,
+            "modo": MODO,
+            "ms": round(perfil.tramos[(perfil.pagina,)] * 1000, 1),
+            "tramos": {
+                "/".join(ruta): {
+                    "ms": round(s * 1000, 1),
+                    "propio_ms": round(propios[ruta] * 1000, 1),
+                }
+                for ruta, s in sorted(perfil.tramos.items())
+            },
+            "fichero": base,
+        }, ensure_ascii=False) + "\n")
+
+    _podar()
+
+
+def _escribir_folded(path, pilas):
+    with open(path, "w", encoding="utf-8") as f:
+        for pila, valor in sorted(pilas.items()):
+            if valor > 0:
+                f.write(f"{pila} {valor}\n")
+
+
+def _podar():
+    # Deja en disco solo los MAX_PERFILES reruns más recientes
+    bases = sorted({p.name.split(".")[0] for p in PERFIL_DIR.glob("*.folded")})
+    for vieja in bases[:-MAX_PERFILES]:
+        for path in PERFIL_DIR.glob(f"{vieja}.*"):
+            path.unlink(missing_ok=True)
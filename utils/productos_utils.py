@@ -0,0 +1,126 @@
+# utils/productos_utils.py
+import json
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# LÍNEAS DE PRODUCTO
+# =====================================================
+# El campo "Productos" de cada pedido es un JSON con una lista de líneas.
+# Se convierte una sola vez en una tabla (una fila por línea) que se
+# guarda junto a df_pedidos y se actualiza solo para los pedidos que
+# cambian.
+COLUMNAS_LINEAS = [
+    "id_documento_firestore", "Año", "ID",
+    "Producto", "Tela", "Cantidad", "PrecioUnitario",
+]
+
+
+def parse_productos(value):
+    if not value:
+        return []
+    try:
+        if isinstance(value, str):
+            return json.loads(value)
+        if isinstance(value, list):
+            return value
+    except Exception:
+        pass
+    return []
+
+
+def construir_lineas_productos(df_pedidos):
+    """
+    Tabla de líneas de producto de `df_pedidos`: una fila por producto
+    con la clave del pedido, producto, tela, cantidad y precio unitario.
+    """
+    if (
+        df_pedidos is None or df_pedidos.empty
+        or "Productos" not in df_pedidos.columns
+    ):
+        return pd.DataFrame(columns=COLUMNAS_LINEAS)
+
+    df_pedidos = df_pedidos.reset_index(drop=True)
+    listas = _parsear_columna(df_pedidos["Productos"]).explode().dropna()
+    listas = listas[listas.map(lambda p: isinstance(p, dict))]
+    if listas.empty:
+        return pd.DataFrame(columns=COLUMNAS_LINEAS)
+
+    lineas = pd.DataFrame(listas.tolist(), index=listas.index)
+    lineas = lineas.reindex(columns=["Producto", "Tela", "Cantidad", "PrecioUnitario"])
+    lineas["Cantidad"] = (
+        pd.to_numeric(lineas["Cantidad"], errors="coerce").fillna(1).astype(int)
+    )
+    lineas["PrecioUnitario"] = (
+        pd.to_numeric(lineas["PrecioUnitario"], errors="coerce").fillna(0.0)
+    )
+
+    claves = df_pedidos.reindex(columns=["id_documento_firestore", "Año", "ID"])
+    return pd.concat([
+        claves.loc[lineas.index].reset_index(drop=True),
+        lineas.reset_index(drop=True),
+    ], axis=1)[COLUMNAS_LINEAS]
+
+
+def actualizar_lineas_productos(df_lineas, df_pedidos, ids):
+    """
+    Rehace solo las líneas de los pedidos `ids` (creados, modificados o
+    borrados) a partir del `df_pedidos` ya actualizado.
+    """
+    if df_lineas is None or "id_documento_firestore" not in df_pedidos.columns:
+        return construir_lineas_productos(df_pedidos)
+
+    ids = set(ids)
+    resto = df_lineas[~df_lineas["id_documento_firestore"].isin(ids)]
+    nuevas = construir_lineas_productos(
+        df_pedidos[df_pedidos["id_documento_firestore"].isin(ids)]
+    )
+    if nuevas.empty:
+        return resto.reset_index(drop=True)
+    return pd.concat([resto, nuevas], ignore_index=True)
+
+
+def _parsear_columna(productos):
+    # Todos los JSON de la columna se parsean en una sola llamada a
+    # json.loads uniéndolos en un único array; si alguno está mal formado
+    # se vuelve a parsear uno a uno para descartar solo ese.
+    es_texto = productos.map(lambda v: isinstance(v, str) and bool(v.strip()))
+    textos = productos[es_texto].str.strip()
+
+    parseados = None
+    # Un texto como '[..],[..]' es JSON válido dentro del array común pero
+    # aporta dos elementos, y otro mal formado puede compensarlo: solo se
+    # acepta el resultado si cada texto es un array y sale uno por pedido
+    if (textos.str.startswith("[") & textos.str.endswith("]")).all():
+        try:
+            parseados = json.loads("[" + ",".join(textos) + "]")
+        except ValueError:
+            pass
+    if (
+        parseados is None
+        or len(parseados) != len(textos)
+        or not all(isinstance(p, list) for p in parseados)
+    ):
+        parseados = [parse_productos(v) for v in textos]
+
+    listas = pd.concat([
+        productos[~es_texto],
+        pd.Series(parseados, index=textos.index, dtype=object),
+    ]).reindex(productos.index)
+
+    return listas.where(listas.map(lambda v: isinstance(v, list)))
+
+
+def productos_de_pedido(df_lineas, doc_id):
+    """Líneas de un pedido como lista de dicts (mismo formato que el JSON)."""
+    if df_lineas is None or df_lineas.empty or not doc_id:
+        return []
+    lineas = df_lineas[df_lineas["id_documento_firestore"] == doc_id]
+    return (
+        lineas[["Producto", "Tela", "PrecioUnitario", "Cantidad"]]
+        .fillna({"Producto": "", "Tela": ""})
+        .to_dict("records")
+    )
@@ -1,9 +1,24 @@
-import pandas as pd
-import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
+import hashlib
+import json
 import logging
+import zipfile
+from contextlib import contextmanager
+from io import BytesIO
+
+import pandas as pd
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from openpyxl import load_workbook
+
+from utils.firestore_utils import (
+    get_firestore_client, commit_bloques, invalidate_shared_data,
+    BATCH_LIMIT, COUNTERS_COLLECTION, UPDATED_AT_FIELD,
+)
+from utils.backup_utils import leer_backup_zip, verificar_backup_zip
+from utils.metricas import medir
+from utils.schemas import aplicar_esquema
+from utils.snapshot_utils import SNAPSHOT_DIR
+from utils.estados import COLUMNA_ESTADO
 
 logger = logging.getLogger(__name__)
 
@@ -17,68 +32,258 @@ COLLECTION_MAPPING = {
     "listas": "listas",
 }
 
+# Punto de control de la restauración en curso: qué colecciones están ya
+# vaciadas y qué bloques se han subido. Si la restauración se corta, volver
+# a lanzarla con el mismo archivo continúa desde ahí.
+CHECKPOINT_DIR = SNAPSHOT_DIR.parent / "restore"
+CHECKPOINT = "checkpoint.json"
 
-# =====================================================
-# FIRESTORE CLIENT
-# =====================================================
-def _get_firestore_client():
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(dict(st.secrets["firestore"]))
-        firebase_admin.initialize_app(cred)
-    return firestore.client()
+# Columnas del backup que no son campos del documento
+_COLUMNAS_NO_RESTAURAR = ("id_documento_firestore", UPDATED_AT_FIELD, COLUMNA_ESTADO)
 
 
 # =====================================================
 # RESTORE DESDE EXCEL (STREAMLIT CLOUD)
 # =====================================================
-def restore_from_excel(uploaded_file):
+def restore_from_excel(uploaded_file, progreso=None):
     """
-    Restaura datos desde un Excel subido por Streamlit.
-    BORRA las colecciones actuales y carga las del Excel.
+    Restaura datos desde un backup subido por Streamlit: Excel (.xlsx) o
+    ZIP de crear_backup_zip, cuyos sha256 se comprueban antes de borrar
+    nada. BORRA las colecciones actuales y carga las del backup.
+
+    Las escrituras van en batches paralelos de BATCH_LIMIT. Cada documento
+    tiene un ID fijo (el del backup, o uno derivado del archivo y la fila),
+    así repetir un bloque no duplica nada y se puede reanudar.
+
+    `progreso(coleccion, hechas, total)` se llama tras cada bloque.
     """
     try:
-        db = _get_firestore_client()
-        xls = pd.ExcelFile(uploaded_file)
-
-        for sheet_name, collection_name in COLLECTION_MAPPING.items():
-            if sheet_name not in xls.sheet_names:
-                logger.warning(f"Hoja '{sheet_name}' no encontrada")
-                continue
-
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-            col_ref = db.collection(collection_name)
-
-            # =====================================
-            # BORRAR COLECCIÓN ACTUAL (BATCH)
-            # =====================================
-            docs = list(col_ref.stream())
-            if docs:
-                batch = db.batch()
-                for doc in docs:
-                    batch.delete(doc.reference)
-                batch.commit()
-
-            # =====================================
-            # SUBIR DATOS NUEVOS
-            # =====================================
-            for _, row in df.iterrows():
-                data = row.to_dict()
-
-                # Limpiar fechas
-                for k, v in data.items():
-                    if isinstance(v, pd.Timestamp):
-                        data[k] = v.to_pydatetime()
-                    elif isinstance(v, datetime):
-                        data[k] = v
-
-                col_ref.add(data)
-
-            logger.info(
-                f"Colección '{collection_name}' restaurada con {len(df)} documentos."
-            )
+        contenido = _leer_bytes(uploaded_file)
+        huella = hashlib.sha256(contenido).hexdigest()
+        checkpoint = _leer_checkpoint(huella)
+        reanudada = bool(checkpoint["colecciones"])
 
+        db = get_firestore_client()
+
+        with _abrir_backup(contenido) as leer:
+            for sheet_name, collection_name in COLLECTION_MAPPING.items():
+                df = leer(sheet_name, collection_name)
+                if df is None:
+                    logger.warning(f"Hoja '{sheet_name}' no encontrada")
+                    continue
+
+                estado = checkpoint["colecciones"].setdefault(
+                    collection_name, {"borrada": False, "bloques": []}
+                )
+
+                # =====================================
+                # BORRAR COLECCIÓN ACTUAL (BATCHES)
+                # =====================================
+                if not estado["borrada"]:
+                    _vaciar_coleccion(db, collection_name, progreso)
+                    estado["borrada"] = True
+                    _guardar_checkpoint(checkpoint)
+
+                # =====================================
+                # SUBIR DATOS NUEVOS
+                # =====================================
+                _subir_documentos(
+                    db, collection_name, df, huella, estado, checkpoint, progreso
+                )
+
+                logger.info(
+                    f"Colección '{collection_name}' restaurada con {len(df)} documentos."
+                )
+
+        _borrar_checkpoint()
+        invalidate_shared_data()
+
+        if reanudada:
+            return True, "Datos restaurados correctamente (restauración reanudada)"
         return True, "Datos restaurados correctamente"
 
     except Exception as e:
         logger.error(f"Error al restaurar datos: {e}")
         return False, str(e)
+
+
+def restauracion_pendiente(uploaded_file):
+    """True si hay una restauración a medias de este mismo archivo."""
+    huella = hashlib.sha256(_leer_bytes(uploaded_file)).hexdigest()
+    return bool(_leer_checkpoint(huella)["colecciones"])
+
+
+# =====================================================
+# LECTURA DEL BACKUP (EXCEL O ZIP)
+# =====================================================
+@contextmanager
+def _abrir_backup(contenido):
+    # Da leer(hoja, coleccion) -> DataFrame con el esquema aplicado, o
+    # None si el backup no tiene esa hoja
+    if zipfile.is_zipfile(BytesIO(contenido)):
+        ok, msg = verificar_backup_zip(BytesIO(contenido))
+        if not ok:
+            raise ValueError(msg)
+        with zipfile.ZipFile(BytesIO(contenido)) as zf:
+            def leer(sheet_name, collection_name):
+                df = leer_backup_zip(zf, sheet_name)
+                return None if df is None else aplicar_esquema(collection_name, df)[list(df.columns)]
+            yield leer
+        return
+
+    wb = load_workbook(BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        def leer(sheet_name, collection_name):
+            if sheet_name not in wb.sheetnames:
+                return None
+            return _leer_hoja(wb[sheet_name], collection_name)
+        yield leer
+    finally:
+        wb.close()
+
+
+def _leer_bytes(uploaded_file):
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    with open(uploaded_file, "rb") as f:
+        return f.read()
+
+
+def _leer_hoja(ws, collection_name):
+    # En modo read_only openpyxl va leyendo la hoja fila a fila; los tipos
+    # se convierten después por columnas con el esquema de la colección.
+    filas = ws.iter_rows(values_only=True)
+    cabecera = next(filas, None)
+    if not cabecera:
+        return pd.DataFrame()
+
+    posiciones = [i for i, c in enumerate(cabecera) if c is not None]
+    columnas = [str(cabecera[i]) for i in posiciones]
+    datos = [
+        [fila[i] if i < len(fila) else None for i in posiciones]
+        for fila in filas
+        if any(v is not None for v in fila)
+    ]
+
+    df = pd.DataFrame(datos, columns=columnas)
+    return aplicar_esquema(collection_name, df)[columnas]
+
+
+def _columna_a_valores(serie):
+    # Valores nativos de Python (int, float, bool, datetime, str) y None en
+    # los vacíos, convertidos de una vez para toda la columna
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        valores = pd.Series(serie.dt.to_pydatetime(), index=serie.index, dtype=object)
+    else:
+        valores = serie.astype(object)
+    return valores.where(serie.notna(), None).tolist()
+
+
+# =====================================================
+# ESCRITURA EN FIRESTORE
+# =====================================================
+def _vaciar_coleccion(db, collection_name, progreso=None):
+    col_ref = db.collection(collection_name)
+    with medir("stream", collection_name) as llamada:
+        ops = [("delete", doc.reference, None) for doc in col_ref.select([]).stream()]
+        llamada["leidos"] = max(1, len(ops))
+
+    # Los contadores de ID se vuelven a crear a partir de los datos restaurados
+    with medir("stream", COUNTERS_COLLECTION) as llamada:
+        contadores = list(
+            db.collection(COUNTERS_COLLECTION)
+            .where(filter=FieldFilter("coleccion", "==", collection_name))
+            .stream()
+        )
+        llamada["leidos"] = max(1, len(contadores))
+    ops += [("delete", doc.reference, None) for doc in contadores]
+
+    bloques = dict(enumerate(_trocear(ops)))
+    hechos = []
+
+    def al_confirmar(clave):
+        hechos.append(clave)
+        if progreso:
+            progreso(f"{collection_name} (borrando)", len(hechos), len(bloques))
+
+    commit_bloques(bloques, al_confirmar)
+
+
+def _subir_documentos(db, collection_name, df, huella, estado, checkpoint, progreso=None):
+    col_ref = db.collection(collection_name)
+    doc_ids = _ids_documentos(df, collection_name, huella)
+
+    campos = [c for c in df.columns if c not in _COLUMNAS_NO_RESTAURAR]
+    valores = [_columna_a_valores(df[c]) for c in campos]
+
+    ops = [
+        ("set", col_ref.document(doc_id),
+         {**dict(zip(campos, fila)), UPDATED_AT_FIELD: firestore.SERVER_TIMESTAMP})
+        for doc_id, fila in zip(doc_ids, zip(*valores))
+    ]
+
+    todos = dict(enumerate(_trocear(ops)))
+    hechos = set(estado["bloques"])
+    pendientes = {k: v for k, v in todos.items() if k not in hechos}
+
+    def al_confirmar(clave):
+        estado["bloques"].append(clave)
+        _guardar_checkpoint(checkpoint)
+        if progreso:
+            progreso(collection_name, len(estado["bloques"]), len(todos))
+
+    commit_bloques(pendientes, al_confirmar)
+
+
+def _ids_documentos(df, collection_name, huella):
+    # El ID del backup si lo tiene; si no, uno determinista por fila
+    derivados = [
+        hashlib.sha1(f"{huella}:{collection_name}:{i}".encode()).hexdigest()[:20]
+        for i in range(len(df))
+    ]
+    if "id_documento_firestore" not in df.columns:
+        return derivados
+    originales = df["id_documento_firestore"].tolist()
+    return [
+        str(o) if isinstance(o, str) and o.strip() else d
+        for o, d in zip(originales, derivados)
+    ]
+
+
+def _trocear(ops):
+    return [ops[i:i + BATCH_LIMIT] for i in range(0, len(ops), BATCH_LIMIT)]
+
+
+# =====================================================
+# PUNTO DE CONTROL
+# =====================================================
+def _leer_checkpoint(huella):
+    # Solo vale para el mismo archivo; otro archivo empieza de cero
+    try:
+        path = CHECKPOINT_DIR / CHECKPOINT
+        if path.exists():
+            checkpoint = json.loads(path.read_text())
+            if checkpoint.get("huella") == huella:
+                return checkpoint
+    except Exception as e:
+        logger.warning(f"No se pudo leer el punto de control: {e}")
+    return {"huella": huella, "colecciones": {}}
+
+
+def _guardar_checkpoint(checkpoint):
+    try:
+        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = CHECKPOINT_DIR / f"{CHECKPOINT}.tmp"
+        tmp.write_text(json.dumps(checkpoint))
+        tmp.replace(CHECKPOINT_DIR / CHECKPOINT)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar el punto de control: {e}")
+
+
+def _borrar_checkpoint():
+    try:
+        (CHECKPOINT_DIR / CHECKPOINT).unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning(f"No se pudo borrar el punto de control: {e}")
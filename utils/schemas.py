@@ -0,0 +1,87 @@
+# utils/schemas.py
+import pandas as pd
+from datetime import datetime
+
+# =====================================================
+# ESQUEMAS DE LAS COLECCIONES
+# =====================================================
+# Tipos de cada columna por colección. Se aplican una sola vez al cargar o
+# actualizar los datos (ver firestore_utils._SharedCache.publicar), así las
+# páginas trabajan directamente con el DataFrame tipado sin copiarlo ni
+# convertir columnas en cada rerun.
+#
+#   "año"       -> int64, los vacíos pasan a ser el año actual
+#   "Int64"     -> entero que admite vacíos
+#   "float"     -> float64, vacíos como NaN
+#   "bool"      -> bool, vacíos como False
+#   "category"  -> categoría (columnas de texto con muchos repetidos)
+#   "fecha"     -> datetime64 sin zona horaria (UTC)
+ESQUEMAS = {
+    "pedidos": {
+        "ID": "Int64",
+        "Año": "año",
+        "Cliente": "category",
+        "Club": "category",
+        "Precio": "float",
+        "Precio Factura": "float",
+        "Fecha entrada": "fecha",
+        "Fecha salida": "fecha",
+        "Inicio Trabajo": "bool",
+        "Trabajo Terminado": "bool",
+        "Pendiente": "bool",
+        "Retirado": "bool",
+        "Cobrado": "bool",
+    },
+    "gastos": {
+        "ID": "Int64",
+        "Año": "año",
+        "Fecha": "fecha",
+        "Importe": "float",
+        "Tipo": "category",
+    },
+}
+
+
+def aplicar_esquema(collection_key, df):
+    """
+    Devuelve `df` con los tipos de ESQUEMAS[collection_key]. Las columnas
+    declaradas que falten se crean vacías. Colecciones sin esquema se
+    devuelven tal cual.
+    """
+    esquema = ESQUEMAS.get(collection_key)
+    if esquema is None or df is None:
+        return df
+
+    df = df.copy()
+    for col, tipo in esquema.items():
+        if col not in df.columns:
+            df[col] = pd.Series(pd.NA, index=df.index, dtype=object)
+        df[col] = _convertir(df[col], tipo)
+
+    return df
+
+
+def _convertir(serie, tipo):
+    if tipo == "año":
+        return (
+            pd.to_numeric(serie, errors="coerce")
+            .fillna(datetime.now().year)
+            .astype("int64")
+        )
+
+    if tipo == "Int64":
+        return pd.to_numeric(serie, errors="coerce").round().astype("Int64")
+
+    if tipo == "float":
+        return pd.to_numeric(serie, errors="coerce").astype("float64")
+
+    if tipo == "bool":
+        return serie.astype(object).where(serie.notna(), False).astype(bool)
+
+    if tipo == "category":
+        return serie.astype("category")
+
+    if tipo == "fecha":
+        return pd.to_datetime(serie, errors="coerce", utc=True).dt.tz_convert(None)
+
+    raise ValueError(f"Tipo de esquema desconocido: {tipo}")
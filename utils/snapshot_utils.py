@@ -0,0 +1,90 @@
+# utils/snapshot_utils.py
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# COPIA LOCAL DE LOS DATAFRAMES
+# =====================================================
+# Un fichero por colección + un índice con la marca de sincronización de
+# cada una. Al arrancar se leen de aquí y solo se piden a Firestore los
+# cambios posteriores a esa marca.
+SNAPSHOT_DIR = Path(
+    os.environ.get(
+        "IMPERYO_SNAPSHOT_DIR",
+        Path(__file__).resolve().parent.parent / "data" / "snapshot"
+    )
+)
+INDICE = "indice.json"
+
+
+def cargar_snapshot(df_key):
+    """
+    Devuelve (DataFrame, marca) de la copia local de `df_key`,
+    o None si no hay copia o no se puede leer.
+    """
+    try:
+        indice = _leer_indice()
+        marca = indice.get(df_key)
+        path = SNAPSHOT_DIR / f"{df_key}.pkl"
+        if marca is None or not path.exists():
+            return None
+        return pd.read_pickle(path), datetime.fromisoformat(marca)
+    except Exception as e:
+        logger.warning(f"No se pudo leer la copia local de {df_key}: {e}")
+        return None
+
+
+def guardar_snapshot(frames, marca):
+    """
+    Guarda `frames` ({df_key: DataFrame}) sincronizados hasta `marca`.
+
+    Primero los datos y después el índice: si el proceso muere a medias,
+    el índice sigue apuntando a una marca anterior y la siguiente
+    sincronización vuelve a traer esos cambios.
+    """
+    if not frames:
+        return
+
+    try:
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+
+        for df_key, df in frames.items():
+            _escribir_atomico(
+                SNAPSHOT_DIR / f"{df_key}.pkl",
+                lambda tmp, df=df: df.to_pickle(tmp)
+            )
+
+        indice = _leer_indice()
+        indice.update({k: marca.isoformat() for k in frames})
+        _escribir_atomico(
+            SNAPSHOT_DIR / INDICE,
+            lambda tmp: tmp.write_text(json.dumps(indice, indent=2))
+        )
+    except Exception as e:
+        # La copia local es solo una optimización: nunca debe romper la app
+        logger.warning(f"No se pudo guardar la copia local: {e}")
+
+
+def borrar_snapshot():
+    for path in SNAPSHOT_DIR.glob("*"):
+        path.unlink(missing_ok=True)
+
+
+def _leer_indice():
+    path = SNAPSHOT_DIR / INDICE
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def _escribir_atomico(path, escribir):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    escribir(tmp)
+    os.replace(tmp, path)